@@ -0,0 +1,324 @@
+# Modo de servicio asíncrono (ASGI). Sirve las rutas de routes/routes.py con
+# las versiones asíncronas de los controladores (controllers/async_controllers.py)
+# sobre un motor SQLAlchemy asíncrono; el resto de rutas (operaciones masivas,
+# estadísticas, Swagger...) las atiende la aplicación Flask montada como WSGI.
+#
+#   uvicorn asgi:crear_app_asgi --factory --workers 4
+#
+# El despliegue síncrono (app.py) no cambia.
+import time
+from flask import current_app
+from starlette.applications import Starlette
+from starlette.middleware.wsgi import WSGIMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+import controllers.async_controllers as controllers
+import routes.routes as vistas
+from config import adb, auth, cache, compresion, eventos, limitador, metricas
+from utils.auth import ErrorAutenticacion
+from utils.compresion import etag_codificado
+from utils.limites import LimiteExcedido
+from utils.paginacion import LimiteInvalido, leer_limite
+from utils.condicional import evaluar_cabeceras
+from utils.credenciales import normalizar_email
+from utils.eventos import StreamSaturado
+from utils.passwords import PoolSaturado
+from utils.serializacion import volcar_bytes
+
+
+def respuesta_json(response, status):
+    # Mismo proveedor JSON que jsonify(), para que ambos modos den el mismo cuerpo
+    return Response(volcar_bytes(response), status_code=status, media_type='application/json')
+
+
+async def leer_json(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+async def responder_condicional(request, sellos, generar):
+    # Como utils.condicional.responder_condicional, incluida la compresión con
+    # los cuerpos comprimidos compartidos en caché
+    if sellos is None:
+        return await generar()
+    ruta = request.url.path + '?' + request.url.query
+    etag, ultima, coincidente = evaluar_cabeceras(sellos, ruta, request.headers)
+    codificacion = compresion.negociar(request.headers.get('accept-encoding'))
+    if coincidente:
+        respuesta = Response(status_code=304)
+        etag = coincidente
+    else:
+        cuerpo = compresion.cuerpo_cacheado(etag, codificacion) if codificacion else None
+        if cuerpo is None:
+            with cache.sellada(sellos):
+                respuesta = await generar()
+            if respuesta.status_code != 200:
+                return respuesta
+            if codificacion and not isinstance(respuesta, StreamingResponse):
+                cuerpo = compresion.comprimir_cuerpo(respuesta.body, codificacion, etag)
+        if cuerpo is not None:
+            respuesta = Response(cuerpo, media_type='application/json',
+                                 headers={'Content-Encoding': codificacion})
+            etag = etag_codificado(etag, codificacion)
+    if compresion.activa:
+        respuesta.headers['Vary'] = 'Accept-Encoding'
+    respuesta.headers['ETag'] = '"%s"' % etag
+    if ultima:
+        respuesta.headers['Last-Modified'] = ultima.strftime('%a, %d %b %Y %H:%M:%S GMT')
+    respuesta.headers['Cache-Control'] = 'no-cache'
+    return respuesta
+
+
+async def responder_listado(request, obtener, stream, **parametros):
+    if request.query_params.get('stream', '').lower() in ('1', 'true'):
+        response, status = await stream(**parametros)
+        if status != 200:
+            return respuesta_json(response, status)
+        return StreamingResponse(response, media_type='application/json')
+    response, status = await obtener(
+        limit=leer_limite(request.query_params.get('limit')),
+        after=request.query_params.get('after'),
+        **parametros
+    )
+    return respuesta_json(response, status)
+
+
+# ------------------------- LÍMITES -------------------------
+def limitar(request, vista, claims=None, data=None):
+    # Las mismas reglas que la vista de Flask (limitador.limite), y en el mismo orden
+    ip = request.client.host if request.client else None
+    if limitador.confiar_proxy and request.headers.get('x-forwarded-for'):
+        ip = request.headers['x-forwarded-for'].split(',')[0].strip()
+    for clave, tasa in getattr(vista, 'limites', ()):
+        if clave == 'ip':
+            valor = ip
+        elif clave == 'usuario':
+            valor = claims[current_app.config['JWT_IDENTITY_CLAIM']] if claims else ip
+        else:
+            valor = normalizar_email(data.get('email')) if isinstance(data, dict) else None
+        limitador.comprobar(vista.__name__, clave, valor, tasa)
+
+
+# ------------------------- AUTENTICACIÓN -------------------------
+async def login(request):
+    data = await leer_json(request)
+    limitar(request, vistas.login, data=data)
+    if data is None:
+        return respuesta_json({'msg': 'JSON no válido'}, 400)
+    return respuesta_json(*await controllers.login_usuario(data.get('email'), data.get('password')))
+
+
+async def registrar(request):
+    limitar(request, vistas.registrar)
+    data = await leer_json(request)
+    if data is None:
+        return respuesta_json({'msg': 'JSON no válido'}, 400)
+    return respuesta_json(*await controllers.registrar_usuario(
+        data.get('nombre'), data.get('email'), data.get('password')
+    ))
+
+
+# ------------------------- RECURSOS -------------------------
+# Las tres colecciones comparten forma: listado + alta, y lectura, modificación
+# y baja por id. campos: claves del cuerpo JSON, en el orden del controlador
+# (campos_actualizacion, si la modificación admite más que el alta).
+def rutas_recurso(ruta, nombre, campos, parametros_listado=None, tablas=None, campos_actualizacion=None,
+                  parametros_eliminacion=None):
+    obtener_todos = getattr(controllers, 'obtener_%ss' % nombre)
+    stream = getattr(controllers, 'stream_%ss' % nombre)
+    obtener_uno = getattr(controllers, 'obtener_%s' % nombre)
+    sello = getattr(controllers, 'sello_%s' % nombre)
+    crear = getattr(controllers, 'crear_%s' % nombre)
+    actualizar = getattr(controllers, 'actualizar_%s' % nombre)
+    eliminar = getattr(controllers, 'eliminar_%s' % nombre)
+    tablas = tablas or [ruta.strip('/')]
+    vistas_escritura = {
+        'POST': getattr(vistas, 'crear_%s' % nombre),
+        'PUT': getattr(vistas, 'actualizar_%s' % nombre),
+        'DELETE': getattr(vistas, 'eliminar_%s' % nombre)
+    }
+
+    async def coleccion(request):
+        if request.method == 'GET':
+            try:
+                parametros = parametros_listado(request) if parametros_listado else {}
+            except ValueError as e:
+                return respuesta_json({'msg': str(e)}, 400)
+            return await responder_condicional(
+                request,
+                await controllers.sellos_tablas(*tablas),
+                lambda: responder_listado(request, obtener_todos, stream, **parametros)
+            )
+        limitar(request, vistas_escritura['POST'], auth.verificar(request.headers.get('authorization')))
+        data = await leer_json(request)
+        if data is None:
+            return respuesta_json({'msg': 'JSON no válido'}, 400)
+        return respuesta_json(*await crear(*[data.get(c) for c in campos]))
+
+    async def elemento(request):
+        id = request.path_params['id']
+        if request.method == 'GET':
+            async def generar():
+                return respuesta_json(*await obtener_uno(id))
+            return await responder_condicional(request, await sello(id), generar)
+        limitar(request, vistas_escritura[request.method], auth.verificar(request.headers.get('authorization')))
+        if request.method == 'DELETE':
+            try:
+                parametros = parametros_eliminacion(request) if parametros_eliminacion else {}
+            except ValueError as e:
+                return respuesta_json({'msg': str(e)}, 400)
+            return respuesta_json(*await eliminar(id, **parametros))
+        data = await leer_json(request)
+        if data is None:
+            return respuesta_json({'msg': 'JSON no válido'}, 400)
+        return respuesta_json(*await actualizar(id, *[data.get(c) for c in campos_actualizacion or campos]))
+
+    return [
+        Route(ruta, coleccion, methods=['GET', 'POST']),
+        Route(ruta + '/{id:int}', elemento, methods=['GET', 'PUT', 'DELETE'])
+    ]
+
+
+def parametros_productos(request):
+    # ValueError si un filtro numérico no es un número
+    return {
+        **controllers.leer_filtros_productos(request.query_params),
+        'sort': request.query_params.get('sort'),
+        'fields': request.query_params.get('fields')
+    }
+
+
+def parametros_eliminacion_producto(request):
+    # ValueError si version no es un entero
+    return {'version': controllers.leer_version(request.query_params.get('version'))}
+
+
+class StreamEventos(StreamingResponse):
+    # Libera la conexión SSE al terminar la respuesta, haya empezado o no el
+    # generador (desconexión antes del primer evento)
+    def __init__(self, contenido, cerrar, **kwargs):
+        super().__init__(contenido, **kwargs)
+        self.cerrar = cerrar
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.cerrar()
+
+
+async def stream_productos(request):
+    # Igual que en Flask, pero sin ocupar un hilo por conexión: el generador
+    # consulta el broker cada medio segundo
+    cabeceras = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    if request.method == 'HEAD':
+        # StreamingResponse enviaría el flujo entero aunque el servidor lo descarte
+        return Response(media_type='text/event-stream', headers=cabeceras)
+    desde = request.headers.get('last-event-id') or request.query_params.get('last_event_id')
+    cerrar = eventos.abrir()
+    return StreamEventos(
+        eventos.flujo_async(('productos', 'categorias'), desde),
+        cerrar,
+        media_type='text/event-stream',
+        headers=cabeceras
+    )
+
+
+async def no_autenticado(request, error):
+    return JSONResponse({'msg': str(error)}, status_code=401)
+
+
+async def limite_invalido(request, error):
+    return JSONResponse({'msg': str(error)}, status_code=400)
+
+
+async def limite_excedido(request, error):
+    return JSONResponse({'msg': str(error)}, status_code=429, headers={'Retry-After': error.retry_after})
+
+
+async def pool_saturado(request, error):
+    return JSONResponse(
+        {'msg': 'Servidor ocupado, inténtelo de nuevo más tarde'},
+        status_code=503,
+        headers={'Retry-After': '1'}
+    )
+
+
+class ContextoPeticion:
+    # Abre, para cada petición HTTP, el contexto de la aplicación Flask
+    # (configuración, JWT, proveedor JSON) y una sesión asíncrona, que siguen
+    # vivos mientras se envía la respuesta (también en modo streaming).
+    # También registra las métricas de las rutas asíncronas; las rutas de Flask
+    # montadas las registran los hooks de la propia aplicación Flask.
+    def __init__(self, app, flask_app, plantillas):
+        self.app = app
+        self.flask_app = flask_app
+        self.plantillas = plantillas
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        inicio = time.perf_counter()
+        sql = [0, 0.0]
+        respuesta = {'status': 500, 'tamano': 0}
+
+        async def enviar(mensaje):
+            if mensaje['type'] == 'http.response.start':
+                respuesta['status'] = mensaje['status']
+            elif mensaje['type'] == 'http.response.body':
+                respuesta['tamano'] += len(mensaje.get('body', b''))
+            await send(mensaje)
+
+        token = metricas.sql_peticion.set(sql)
+        try:
+            with self.flask_app.app_context():
+                async with adb.sesion():
+                    await self.app(scope, receive, enviar)
+        finally:
+            metricas.sql_peticion.reset(token)
+            ruta = self.plantillas.get(scope.get('endpoint'))
+            if ruta is not None:
+                metricas.registrar(ruta, scope['method'], respuesta['status'],
+                                   time.perf_counter() - inicio, respuesta['tamano'], sql)
+
+
+def crear_app_asgi(flask_app=None):
+    if flask_app is None:
+        from app import create_app
+        flask_app = create_app()
+    if adb.engine is None:
+        adb.init_app(flask_app)
+
+    rutas = [
+        Route('/login', login, methods=['POST']),
+        Route('/registrar', registrar, methods=['POST']),
+        *rutas_recurso('/usuarios', 'usuario', ['nombre', 'email', 'password']),
+        *rutas_recurso('/productos', 'producto', ['nombre', 'precio', 'cantidad', 'categoria_id'],
+                       parametros_productos, ['productos', 'categorias'],
+                       ['nombre', 'precio', 'cantidad', 'categoria_id', 'version'],
+                       parametros_eliminacion_producto),
+        *rutas_recurso('/categorias', 'categoria', ['nombre']),
+        Route('/stream/productos', stream_productos, methods=['GET']),
+        Mount('/', WSGIMiddleware(flask_app))
+    ]
+    # Ruta con la misma sintaxis que Flask, para que las series coincidan en ambos modos
+    plantillas = {
+        ruta.endpoint: ruta.path.replace('{id:int}', '<int:id>')
+        for ruta in rutas if isinstance(ruta, Route)
+    }
+    app = Starlette(
+        routes=rutas,
+        exception_handlers={
+            PoolSaturado: pool_saturado,
+            StreamSaturado: pool_saturado,
+            ErrorAutenticacion: no_autenticado,
+            LimiteExcedido: limite_excedido,
+            LimiteInvalido: limite_invalido
+        },
+        on_shutdown=[adb.engine.dispose]
+    )
+    app.add_middleware(ContextoPeticion, flask_app=flask_app, plantillas=plantillas)
+    return app
@@ -0,0 +1,72 @@
+# Tiempo de arranque en frío de un worker: importar la aplicación, construirla
+# con create_app y servir la primera petición.
+#
+#   python -m benchmarks.bench_arranque --repeticiones 10
+#
+# Cada medida se toma en un intérprete nuevo (sin módulos ya importados ni
+# .pyc calientes en memoria), con y sin los componentes opcionales: Swagger UI
+# (flasgger), migraciones (Flask-Migrate/Alembic) y especificación precalculada.
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+SCRIPT = r'''
+import json, sys, time
+inicio = time.perf_counter()
+from app import create_app
+importado = time.perf_counter()
+app = create_app(json.loads(sys.argv[1]))
+creado = time.perf_counter()
+respuesta = app.test_client().get(sys.argv[2])
+fin = time.perf_counter()
+assert respuesta.status_code == 200, respuesta.status_code
+print(json.dumps([importado - inicio, creado - importado, fin - creado]))
+'''
+
+
+def arrancar(config, ruta):
+    salida = subprocess.run(
+        [sys.executable, '-c', SCRIPT, json.dumps(config), ruta],
+        capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    )
+    return json.loads(salida.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeticiones', type=int, default=10)
+    parser.add_argument('--ruta', default='/categorias?limit=10')
+    args = parser.parse_args()
+
+    from benchmarks.comun import crear_app_flask, sembrar
+    from utils.swagger import generar_spec
+    directorio = tempfile.gettempdir()
+    uri = 'sqlite:///' + os.path.join(directorio, 'recursoapi_bench_arranque.db')
+    spec = os.path.join(directorio, 'recursoapi_swagger.json')
+    app = crear_app_flask(uri)
+    sembrar(app, usuarios=10, categorias=20, productos=100)
+    with open(spec, 'w', encoding='utf-8') as f:
+        json.dump(generar_spec(app), f)
+
+    base = {'SQLALCHEMY_DATABASE_URI': uri, 'CACHE_TYPE': 'null'}
+    escenarios = [
+        ('completo (swagger + migraciones)', {'SWAGGER_UI': True, 'MIGRATIONS_ENABLED': True}),
+        ('sin migraciones', {'SWAGGER_UI': True, 'MIGRATIONS_ENABLED': False}),
+        ('sin swagger ni migraciones', {'SWAGGER_UI': False, 'MIGRATIONS_ENABLED': False}),
+        ('spec precalculada', {'SWAGGER_UI': False, 'MIGRATIONS_ENABLED': False, 'SWAGGER_SPEC_FILE': spec})
+    ]
+    print('%d repeticiones, primera petición GET %s (medianas en ms)' % (args.repeticiones, args.ruta))
+    print('%-34s %9s %11s %10s %9s' % ('escenario', 'import', 'create_app', '1ª pet.', 'total'))
+    for nombre, config in escenarios:
+        medidas = [arrancar({**base, **config}, args.ruta) for _ in range(args.repeticiones)]
+        import_ms, crear_ms, peticion_ms = (statistics.median(m) * 1000 for m in zip(*medidas))
+        print('%-34s %9.1f %11.1f %10.1f %9.1f' % (
+            nombre, import_ms, crear_ms, peticion_ms, import_ms + crear_ms + peticion_ms))
+
+
+if __name__ == '__main__':
+    main()
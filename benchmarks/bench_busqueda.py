@@ -0,0 +1,100 @@
+# GET /productos/search: latencia del índice invertido en memoria frente a
+# LIKE '%x%' sobre productos.nombre, con nombres en español (con acentos).
+#
+#   python -m benchmarks.bench_busqueda --productos 1000000 --repeticiones 20
+#
+# Con MySQL (--uri mysql+pymysql://...) se mide también el índice FULLTEXT.
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from sqlalchemy import func, select
+from benchmarks.comun import crear_app_flask, sembrar
+from config import buscador, db
+from models import Producto
+
+TIPOS = ['Camiseta', 'Pantalón', 'Camión', 'Cañón', 'Sartén', 'Balón', 'Jersey', 'Cinturón',
+         'Lámpara', 'Mesa', 'Silla', 'Sofá', 'Cojín', 'Colchón', 'Botella', 'Teléfono']
+MATERIALES = ['algodón', 'lana', 'madera', 'acero', 'cuero', 'plástico', 'vidrio', 'bambú']
+ADJETIVOS = ['rojo', 'azul', 'verde', 'negro', 'blanco', 'clásico', 'ecológico', 'térmico',
+             'plegable', 'infantil', 'grande', 'pequeño', 'básico', 'económico', 'práctico']
+# Consultas de distinta selectividad: común, combinada, rara y prefijo
+CONSULTAS = ['camiseta', 'camion azul', 'sarten acero termico', 'cojin bambu infantil 12', 'lamp']
+
+
+def nombre_producto(i, aleatorio):
+    return '%s de %s %s %s %d' % (
+        aleatorio.choice(TIPOS), aleatorio.choice(MATERIALES),
+        aleatorio.choice(ADJETIVOS), aleatorio.choice(ADJETIVOS), i % 1000
+    )
+
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tiempos), max(tiempos)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--productos', type=int, default=1000000)
+    parser.add_argument('--repeticiones', type=int, default=20)
+    parser.add_argument('--uri', default='sqlite:///' + os.path.join(
+        tempfile.gettempdir(), 'recursoapi_bench_busqueda.db'))
+    parser.add_argument('--sin-sembrar', action='store_true', help='Reutiliza la base de datos existente')
+    args = parser.parse_args()
+
+    # El índice se construye aquí mismo (no en segundo plano) para medir cuánto tarda
+    app = crear_app_flask(args.uri, RATE_LIMIT_ENABLED=False, COMPRESSION_ENABLED=False,
+                          SEARCH_INDEX_BACKGROUND=False)
+    if not args.sin_sembrar:
+        inicio = time.perf_counter()
+        sembrar(app, usuarios=1, productos=args.productos, nombre=nombre_producto)
+        print('sembrado: %.1f s' % (time.perf_counter() - inicio))
+
+    with app.app_context():
+        fulltext = buscador.usa_fulltext(db.session)
+        if not fulltext:
+            inicio = time.perf_counter()
+            indice = buscador.indice(db.session)
+            print('índice en memoria: %d productos, %d términos, %.1f s' % (
+                len(indice), len(indice.terminos), time.perf_counter() - inicio))
+
+        print('\nms (mediana / máximo de %d repeticiones)' % args.repeticiones)
+        print('%-28s %8s %18s %18s' % ('consulta', 'total', 'índice', "LIKE '%x%'"))
+        for consulta in CONSULTAS:
+            total, _ = buscador.buscar(db.session, consulta, 20)
+            indice_ms = medir(lambda: buscador.buscar(db.session, consulta, 20), args.repeticiones)
+            # Referencia: LIKE sin índice utilizable (una condición por palabra)
+            like = select(Producto.id).where(*[
+                Producto.nombre.like('%' + palabra + '%') for palabra in consulta.split()
+            ]).order_by(Producto.id).limit(20)
+            like_ms = medir(lambda: db.session.execute(like).all(), max(1, args.repeticiones // 5))
+            print('%-28s %8d %8.2f / %7.2f %8.2f / %7.2f' % (consulta, total, *indice_ms, *like_ms))
+
+        escrituras = 200
+        inicio = time.perf_counter()
+        for i in range(escrituras):
+            producto = db.session.get(Producto, i + 1)
+            producto.nombre = nombre_producto(i + 7, __import__('random').Random(i))
+            db.session.commit()
+        print('\nactualizar nombre + reindexar: %.2f ms por commit' % (
+            (time.perf_counter() - inicio) / escrituras * 1000))
+        print('productos: %d' % db.session.scalar(select(func.count()).select_from(Producto)))
+
+    cliente = app.test_client()
+    print('\nGET /productos/search (petición completa, sin caché)')
+    for consulta in CONSULTAS:
+        mediana, maximo = medir(
+            lambda: cliente.get('/productos/search', query_string={'q': consulta, 'limit': 20}),
+            args.repeticiones
+        )
+        print('%-28s %8.2f / %7.2f' % (consulta, mediana, maximo))
+
+
+if __name__ == '__main__':
+    main()
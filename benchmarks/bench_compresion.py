@@ -0,0 +1,55 @@
+# Compresión de GET /productos: ratio y velocidad de cada codificación y nivel,
+# y coste por petición con y sin cuerpos comprimidos en caché.
+#
+#   python -m benchmarks.bench_compresion --productos 5000 --peticiones 200
+import argparse
+import os
+import tempfile
+import time
+from benchmarks.comun import crear_app_flask, sembrar
+from config import compresion
+
+NIVELES = {'gzip': [1, 6, 9], 'br': [1, 4, 11], 'zstd': [1, 3, 19]}
+
+
+def por_peticion(cliente, ruta, cabeceras, peticiones):
+    cliente.get(ruta, headers=cabeceras)
+    inicio = time.perf_counter()
+    for _ in range(peticiones):
+        cliente.get(ruta, headers=cabeceras)
+    return (time.perf_counter() - inicio) / peticiones * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--productos', type=int, default=5000)
+    parser.add_argument('--peticiones', type=int, default=200)
+    parser.add_argument('--ruta', default='/productos')
+    args = parser.parse_args()
+
+    uri = 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'recursoapi_bench_compresion.db')
+    app = crear_app_flask(uri)
+    sembrar(app, usuarios=10, productos=args.productos)
+    datos = app.test_client().get(args.ruta).data
+    print('%s: %d bytes sin comprimir' % (args.ruta, len(datos)))
+    print('%-6s %6s %10s %8s %10s' % ('cod.', 'nivel', 'bytes', 'ratio', 'MB/s'))
+    for codificacion in compresion.compresores:
+        for nivel in NIVELES[codificacion]:
+            inicio = time.perf_counter()
+            cuerpo = compresion.compresores[codificacion](datos, nivel)
+            segundos = time.perf_counter() - inicio
+            print('%-6s %6d %10d %7.1fx %10.1f' % (
+                codificacion, nivel, len(cuerpo), len(datos) / len(cuerpo), len(datos) / 1e6 / segundos))
+
+    print('\nms por petición (%d peticiones)' % args.peticiones)
+    for nombre, config, cabeceras in [
+        ('sin compresión', {'COMPRESSION_ENABLED': False}, {}),
+        ('gzip, sin caché', {'CACHE_TYPE': 'null'}, {'Accept-Encoding': 'gzip'}),
+        ('gzip, cuerpo en caché', {'CACHE_TYPE': 'memory'}, {'Accept-Encoding': 'gzip'})
+    ]:
+        cliente = crear_app_flask(uri, **config).test_client()
+        print('%-24s %8.2f' % (nombre, por_peticion(cliente, args.ruta, cabeceras, args.peticiones)))
+
+
+if __name__ == '__main__':
+    main()
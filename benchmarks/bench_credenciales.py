@@ -0,0 +1,80 @@
+# Búsqueda de credenciales (login) y comprobación de email registrado (registro)
+# sin el coste del hash: objeto Usuario completo por email frente a id y
+# password por email_normalizado, y consulta frente a filtro de Bloom para
+# emails que no existen (una avalancha de registros o de credential stuffing).
+#
+#   python -m benchmarks.bench_credenciales --usuarios 200000 --consultas 20000
+import argparse
+import os
+import sys
+import tempfile
+import time
+from sqlalchemy import insert, select
+from benchmarks.comun import crear_app_flask
+from config import credenciales, db, hasher
+from controllers.controllers import consulta_credenciales, consulta_email_registrado
+from models import Usuario
+from utils.credenciales import normalizar_email
+
+
+def por_consulta(funcion, emails):
+    inicio = time.perf_counter()
+    for email in emails:
+        funcion(email)
+    return (time.perf_counter() - inicio) / len(emails) * 1e6
+
+
+def sembrar_usuarios(app, usuarios):
+    # Con un único hash precalculado: sembrar con Usuario() calcularía uno por fila
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        password = hasher.hashear('password123')
+        for inicio in range(0, usuarios, 5000):
+            db.session.execute(insert(Usuario), [
+                {'nombre': 'usuario-%d' % i, 'email': 'Usuario%d@Correo.com' % i,
+                 'email_normalizado': 'usuario%d@correo.com' % i, 'password': password}
+                for i in range(inicio, min(inicio + 5000, usuarios))
+            ])
+        db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--usuarios', type=int, default=200000)
+    parser.add_argument('--consultas', type=int, default=20000)
+    args = parser.parse_args()
+
+    uri = 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'recursoapi_bench_credenciales.db')
+    app = crear_app_flask(uri)
+    sembrar_usuarios(app, args.usuarios)
+    existentes = ['usuario%d@correo.com' % (i * 7919 % args.usuarios) for i in range(args.consultas)]
+    nuevos = ['nuevo%d@correo.com' % i for i in range(args.consultas)]
+
+    with app.app_context():
+        sesion = db.session
+        print('µs por búsqueda de credenciales (%d usuarios)' % args.usuarios)
+        for nombre, funcion in [
+            ('Usuario completo por email', lambda e: Usuario.query.filter_by(email=e).first()),
+            ('id, password por clave', lambda e: sesion.execute(consulta_credenciales(normalizar_email(e))).first())
+        ]:
+            print('  %-28s existe %8.1f   no existe %8.1f' % (
+                nombre, por_consulta(funcion, existentes), por_consulta(funcion, nuevos)))
+            sesion.expunge_all()
+
+        inicio = time.perf_counter()
+        filtro = credenciales.filtro(sesion)
+        print('\nfiltro: %d claves en %.2f s, %.1f KB, %d funciones hash' % (
+            len(filtro), time.perf_counter() - inicio, sys.getsizeof(filtro.mapa) / 1024, filtro.funciones))
+        positivos = sum(credenciales.puede_existir(sesion, e) for e in nuevos)
+        print('falsos positivos: %d de %d (%.2f%%)' % (positivos, len(nuevos), 100 * positivos / len(nuevos)))
+
+        print('\nµs por comprobación de email registrado (emails nuevos)')
+        consulta = lambda e: sesion.scalar(consulta_email_registrado(e))
+        print('  %-28s %8.1f' % ('consulta', por_consulta(consulta, nuevos)))
+        print('  %-28s %8.1f' % ('filtro + consulta si puede', por_consulta(
+            lambda e: credenciales.puede_existir(sesion, e) and consulta(e), nuevos)))
+
+
+if __name__ == '__main__':
+    main()
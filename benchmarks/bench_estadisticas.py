@@ -0,0 +1,66 @@
+# GET /stats/inventario: GROUP BY sobre productos (STATS_SOURCE=query) frente a
+# la tabla de resumen (STATS_SOURCE=summary), y coste de mantener el resumen
+# en cada escritura (que con STATS_SOURCE=query no se mantiene).
+#
+#   python -m benchmarks.bench_estadisticas --productos 1000000 --peticiones 20
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from benchmarks.comun import crear_app_flask, sembrar
+from controllers.controllers import reconstruir_resumen
+from config import db, resumen
+from models import Producto
+
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tiempos)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--productos', type=int, default=100000)
+    parser.add_argument('--categorias', type=int, default=20)
+    parser.add_argument('--peticiones', type=int, default=20)
+    parser.add_argument('--uri', default='sqlite:///' + os.path.join(
+        tempfile.gettempdir(), 'recursoapi_bench_estadisticas.db'))
+    args = parser.parse_args()
+
+    app = crear_app_flask(args.uri, RATE_LIMIT_ENABLED=False, COMPRESSION_ENABLED=False,
+                          STATS_SOURCE='summary')
+    sembrar(app, usuarios=1, categorias=args.categorias, productos=args.productos)
+    with app.app_context():
+        inicio = time.perf_counter()
+        reconstruir_resumen()
+        print('reconstruir resumen: %.1f ms' % ((time.perf_counter() - inicio) * 1000))
+
+    cliente = app.test_client()
+    print('\nms por petición (mediana de %d)' % args.peticiones)
+    for fuente in ('query', 'summary'):
+        app.config['STATS_SOURCE'] = fuente
+        inventario = medir(lambda: cliente.get('/stats/inventario'), args.peticiones)
+        categoria = medir(lambda: cliente.get('/categorias/1/stats'), args.peticiones)
+        print('%-8s /stats/inventario %8.2f   /categorias/1/stats %8.2f' % (fuente, inventario, categoria))
+
+    # Escritura de un producto: con 'summary' la transacción incluye la
+    # actualización del resumen
+    with app.app_context():
+        def escribir():
+            producto = db.session.get(Producto, 1)
+            producto.cantidad += 1
+            db.session.commit()
+        print()
+        for fuente in ('query', 'summary'):
+            app.config['STATS_SOURCE'] = fuente
+            resumen.init_app(app)
+            print('modificar un producto (%-7s): %.2f ms' % (fuente, medir(escribir, args.peticiones * 5)))
+
+
+if __name__ == '__main__':
+    main()
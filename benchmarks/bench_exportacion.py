@@ -0,0 +1,64 @@
+# GET /productos/export: filas por segundo, tamaño y memoria de cada formato y
+# codificación con un catálogo grande. La memoria se mide en una segunda pasada
+# con tracemalloc (pico de memoria de Python durante la exportación), que es
+# más lenta; los tiempos son los de la primera.
+#
+#   python -m benchmarks.bench_exportacion --productos 1000000
+#   python -m benchmarks.bench_exportacion --productos 1000000 --memoria
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+from benchmarks.comun import crear_app_flask, sembrar
+from config import compresion
+from utils.exportacion import formatos_disponibles
+
+CODIFICACIONES = {'csv': [None, 'gzip', 'zstd'], 'ndjson': [None, 'gzip', 'zstd'], 'parquet': [None]}
+
+
+def exportar(cliente, formato, codificacion):
+    # Consume la respuesta por trozos, como un cliente que la guarda en disco
+    cabeceras = {'Accept-Encoding': codificacion} if codificacion else {}
+    respuesta = cliente.get('/productos/export?format=' + formato, headers=cabeceras, buffered=False)
+    total = 0
+    for trozo in respuesta.response:
+        total += len(trozo)
+    respuesta.close()
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--productos', type=int, default=1000000)
+    parser.add_argument('--lote', type=int, default=5000, help='EXPORT_BATCH_SIZE')
+    parser.add_argument('--memoria', action='store_true', help='mide también el pico de memoria')
+    args = parser.parse_args()
+
+    uri = 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'recursoapi_bench_exportacion.db')
+    app = crear_app_flask(uri, EXPORT_BATCH_SIZE=args.lote, RATE_LIMIT_ENABLED=False)
+    inicio = time.perf_counter()
+    sembrar(app, usuarios=10, productos=args.productos)
+    print('%d productos sembrados en %.1f s\n' % (args.productos, time.perf_counter() - inicio))
+    cliente = app.test_client()
+
+    print('%-8s %-6s %9s %12s %10s %10s' % ('formato', 'cod.', 'segundos', 'filas/s', 'MB', 'pico MB'))
+    for formato in formatos_disponibles():
+        for codificacion in CODIFICACIONES[formato]:
+            if codificacion and codificacion not in compresion.algoritmos:
+                continue
+            inicio = time.perf_counter()
+            total = exportar(cliente, formato, codificacion)
+            segundos = time.perf_counter() - inicio
+            pico = ''
+            if args.memoria:
+                tracemalloc.start()
+                exportar(cliente, formato, codificacion)
+                pico = '%.1f' % (tracemalloc.get_traced_memory()[1] / 1e6)
+                tracemalloc.stop()
+            print('%-8s %-6s %9.2f %12.0f %10.1f %10s' % (
+                formato, codificacion or '-', segundos, args.productos / segundos, total / 1e6, pico))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+# Rendimiento de la serialización de listados (bytes de JSON por segundo).
+#
+#   python -m benchmarks.bench_json --productos 20000 --repeticiones 5
+#
+# Compara la ruta anterior (instancias ORM + to_dict() + json de la biblioteca
+# estándar) con la actual (tuplas de columnas + orjson), y las combinaciones
+# intermedias, sobre el listado completo de productos con su categoría. Mide
+# también GET /productos de punta a punta con cada proveedor JSON.
+import argparse
+import os
+import tempfile
+import time
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy.orm import joinedload
+from benchmarks.comun import crear_app_flask, sembrar
+from controllers.controllers import consulta_productos
+from models import Producto
+from utils.serializacion import ProveedorOrjson
+
+
+def filas_orm():
+    productos = Producto.query.options(joinedload(Producto.categoria)).order_by(Producto.id).all()
+    return [p.to_dict() for p in productos]
+
+
+def filas_tuplas():
+    query, serializar = consulta_productos()
+    return [serializar(fila) for fila in query.order_by(Producto.id).all()]
+
+
+def medir(funcion, repeticiones):
+    mejor, tamano = None, 0
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        tamano = len(funcion())
+        transcurrido = time.perf_counter() - inicio
+        mejor = transcurrido if mejor is None else min(mejor, transcurrido)
+    return mejor, tamano
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--productos', type=int, default=20000)
+    parser.add_argument('--repeticiones', type=int, default=5)
+    args = parser.parse_args()
+
+    uri = 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'recursoapi_bench_json.db')
+    app = crear_app_flask(uri)
+    sembrar(app, usuarios=10, productos=args.productos)
+    estandar, rapido = DefaultJSONProvider(app), ProveedorOrjson(app)
+
+    def volcar_estandar(datos):
+        # Igual que jsonify() con el proveedor por defecto (sin espacios)
+        return estandar.dumps(datos, separators=(',', ':')).encode('utf-8')
+
+    combinaciones = [
+        ('ORM + to_dict + json', filas_orm, volcar_estandar),
+        ('ORM + to_dict + orjson', filas_orm, rapido.dumpb),
+        ('tuplas + json', filas_tuplas, volcar_estandar),
+        ('tuplas + orjson', filas_tuplas, rapido.dumpb)
+    ]
+    print('%d productos, mejor de %d repeticiones' % (args.productos, args.repeticiones))
+    print('%-26s %10s %10s %10s' % ('ruta', 'ms', 'MB', 'MB/s'))
+    with app.app_context():
+        for nombre, cargar, volcar in combinaciones:
+            segundos, tamano = medir(lambda: volcar(cargar()), args.repeticiones)
+            print('%-26s %10.1f %10.2f %10.1f' % (nombre, segundos * 1000, tamano / 1e6, tamano / 1e6 / segundos))
+
+    print('\nGET /productos de punta a punta')
+    for proveedor in ('default', 'orjson'):
+        cliente = crear_app_flask(uri, JSON_PROVIDER=proveedor).test_client()
+        segundos, tamano = medir(lambda: cliente.get('/productos').data, args.repeticiones)
+        print('%-26s %10.1f %10.2f %10.1f' % (
+            'JSON_PROVIDER=' + proveedor, segundos * 1000, tamano / 1e6, tamano / 1e6 / segundos))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+# Coste de POST /login aceptado (consulta + verificación del hash) frente a
+# rechazado por el límite de tasa (429 sin base de datos ni hash).
+#
+#   python -m benchmarks.bench_limites --peticiones 200
+import argparse
+import os
+import tempfile
+import time
+from benchmarks.comun import crear_app_flask, sembrar
+from config import limitador
+
+
+def por_peticion(cliente, cuerpo, peticiones, esperado):
+    inicio = time.perf_counter()
+    for _ in range(peticiones):
+        respuesta = cliente.post('/login', json=cuerpo)
+        assert respuesta.status_code == esperado, respuesta.status_code
+    return (time.perf_counter() - inicio) / peticiones * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--peticiones', type=int, default=200)
+    parser.add_argument('--hash', default='pbkdf2:sha256:600000')
+    args = parser.parse_args()
+
+    uri = 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'recursoapi_bench_limites.db')
+    cuerpo = {'email': 'usuario0@correo.com', 'password': 'incorrecta'}
+    print('ms por petición (%d peticiones, %s)' % (args.peticiones, args.hash))
+    app = crear_app_flask(uri, RATE_LIMIT_ENABLED=False, PASSWORD_HASH_METHOD=args.hash)
+    sembrar(app, usuarios=10, productos=0)
+    print('%-22s %8.3f' % ('login sin límite', por_peticion(app.test_client(), cuerpo, args.peticiones, 401)))
+
+    app = crear_app_flask(uri, RATE_LIMITS={'login:email': '1/day'}, PASSWORD_HASH_METHOD=args.hash)
+    cliente = app.test_client()
+    cliente.post('/login', json=cuerpo)
+    print('%-22s %8.3f' % ('login rechazado (429)', por_peticion(cliente, cuerpo, args.peticiones, 429)))
+    print('rechazos: %d' % limitador.rechazos['login'])
+
+
+if __name__ == '__main__':
+    main()
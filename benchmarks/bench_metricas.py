@@ -0,0 +1,54 @@
+# Coste por petición de las métricas (utils/metricas.py).
+#
+#   python -m benchmarks.bench_metricas --peticiones 5000
+#
+# Sirve la misma ruta con el cliente de pruebas de Flask, primero sin métricas
+# y después con ellas (hooks de petición + eventos de cursor de SQLAlchemy), y
+# mide también el coste aislado de registrar una petición.
+import argparse
+import os
+import tempfile
+import time
+from benchmarks.comun import crear_app_flask, sembrar
+from config import metricas
+
+
+def medir(app, ruta, peticiones):
+    cliente = app.test_client()
+    for _ in range(min(200, peticiones)):
+        cliente.get(ruta)
+    inicio = time.perf_counter()
+    for _ in range(peticiones):
+        cliente.get(ruta)
+    return (time.perf_counter() - inicio) / peticiones * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--peticiones', type=int, default=5000)
+    parser.add_argument('--ruta', default='/categorias/1')
+    args = parser.parse_args()
+
+    uri = 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'recursoapi_bench_metricas.db')
+    sin = crear_app_flask(uri, METRICS_ENABLED=False)
+    sembrar(sin, productos=1000)
+    us_sin = medir(sin, args.ruta, args.peticiones)
+
+    con = crear_app_flask(uri, METRICS_ENABLED=True)
+    us_con = medir(con, args.ruta, args.peticiones)
+
+    n = 100000
+    inicio = time.perf_counter()
+    for i in range(n):
+        metricas.registrar('/bench', 'GET', 200, 0.003, 512, [2, 0.001])
+    us_registro = (time.perf_counter() - inicio) / n * 1e6
+
+    print('ruta %s, %d peticiones' % (args.ruta, args.peticiones))
+    print('sin métricas:  %8.1f us/petición' % us_sin)
+    print('con métricas:  %8.1f us/petición (+%.1f us, %+.1f%%)' % (
+        us_con, us_con - us_sin, (us_con - us_sin) / us_sin * 100))
+    print('registrar():   %8.2f us/llamada' % us_registro)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+# Microbenchmark de hash / verificación de contraseñas.
+#
+#   python -m benchmarks.bench_passwords --metodo scrypt:32768:8:1 --trabajadores 4 --tipo thread
+#
+# Mide operaciones por segundo con N clientes concurrentes pasando por
+# HasherPasswords, igual que hacen registrar_usuario y login_usuario.
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask
+from utils.passwords import HasherPasswords
+
+
+def medir(funcion, operaciones, clientes):
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clientes) as clientes_pool:
+        list(clientes_pool.map(lambda _: funcion(), range(operaciones)))
+    return operaciones / (time.perf_counter() - inicio)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--metodo', default='scrypt:32768:8:1')
+    parser.add_argument('--tipo', default='thread', choices=['thread', 'process', 'inline'])
+    parser.add_argument('--trabajadores', type=int, default=4)
+    parser.add_argument('--clientes', type=int, default=8)
+    parser.add_argument('--operaciones', type=int, default=64)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config.update(
+        PASSWORD_HASH_METHOD=args.metodo,
+        PASSWORD_POOL_TYPE=args.tipo,
+        PASSWORD_POOL_WORKERS=args.trabajadores,
+        PASSWORD_POOL_MAX_PENDING=args.clientes,
+        PASSWORD_POOL_TIMEOUT=60
+    )
+    hasher = HasherPasswords(app)
+    password_hash = hasher.hashear('password123')
+
+    hash_s = medir(lambda: hasher.hashear('password123'), args.operaciones, args.clientes)
+    verif_s = medir(lambda: hasher.verificar(password_hash, 'password123'), args.operaciones, args.clientes)
+    hasher.cerrar()
+    print('metodo=%s tipo=%s trabajadores=%d clientes=%d' % (
+        args.metodo, args.tipo, args.trabajadores, args.clientes))
+    print('hash:        %8.1f ops/s' % hash_s)
+    print('verificación:%8.1f ops/s' % verif_s)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,483 @@
+# Benchmark de todas las rutas de routes/routes.py, para comparar dos versiones
+# de la API.
+#
+#   python -m benchmarks.bench_rutas --modo proceso --salida antes.json
+#   python -m benchmarks.bench_rutas --modo http --concurrencia 16 --salida despues.json
+#   python -m benchmarks.bench_rutas --comparar antes.json despues.json
+#
+# Siembra la base de datos (un SQLite temporal o --uri) con --usuarios,
+# --categorias y --productos y lanza --peticiones peticiones a cada escenario:
+# con el cliente de pruebas de Flask en este proceso, una detrás de otra, o por
+# HTTP contra un servidor WSGI con hilos en un subproceso, con --concurrencia
+# clientes. Por escenario se mide peticiones/s, p50/p95/p99, errores (status >=
+# 400), sentencias SQL por petición (del histograma de /metrics) y el pico de
+# RSS del proceso que sirve la API durante el escenario.
+#
+# Las escrituras consumen filas y tokens preparados antes de medir (productos
+# que borrar, tokens que revocar...), así que cada pasada hace el mismo trabajo.
+# Con SQLite las escrituras concurrentes se serializan y pueden fallar con
+# 'database is locked'; para medirlas con concurrencia, --uri con MySQL.
+import argparse
+import asyncio
+import json
+import os
+import platform
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+import httpx
+from flask_jwt_extended import create_access_token, create_refresh_token
+from benchmarks.comun import crear_app_flask, percentil, sembrar
+from config import db
+from models import Usuario, Categoria, Producto, Trabajo
+
+# La API sin límites de tasa: se mide el coste de cada ruta, no el limitador.
+# Las conexiones SSE se cierran tras el primer mensaje: se mide abrirlas. Los
+# trabajos solo se encolan: se mide la petición, no la importación.
+CONFIG = {'RATE_LIMIT_ENABLED': False, 'STREAM_MAX_SECONDS': 0, 'JOBS_POOL_TYPE': 'external'}
+
+# peticion(i, contexto) -> argumentos de la petición i (path, json o data, headers)
+Escenario = namedtuple('Escenario', 'nombre metodo ruta peticion reservas')
+
+
+def escenario(nombre, peticion, reservas=None):
+    metodo, _, ruta = nombre.partition(' ')
+    return Escenario(nombre, metodo, ruta.partition('?')[0], peticion, reservas)
+
+
+def get(path):
+    return lambda i, c: {'path': path(i, c) if callable(path) else path}
+
+
+def con_token(path, json=None, token='acceso'):
+    # token: uno de c.tokens, o una reserva con un token distinto por petición
+    def peticion(i, c):
+        valor = c.tokens[token] if token in c.tokens else c.reservas[token][i]
+        return {
+            'path': path(i, c) if callable(path) else path,
+            'json': json(i, c) if callable(json) else json,
+            'headers': {'Authorization': 'Bearer ' + valor}
+        }
+    return peticion
+
+
+def importacion(i, c):
+    peticion = con_token('/jobs/import-productos')(i, c)
+    peticion['headers']['Content-Type'] = 'text/csv'
+    peticion['data'] = 'nombre,precio,cantidad,categoria_id\n' + ''.join(
+        'importado-%d-%d,10.5,5,%d\n' % (i, k, 1 + k % c.categorias) for k in range(c.lote)
+    )
+    return peticion
+
+
+def producto(i, c):
+    return 1 + i % c.productos
+
+
+def lote(i, c):
+    return [1 + (i * c.lote + k) % c.productos for k in range(c.lote)]
+
+
+ESCENARIOS = [
+    # Lecturas
+    escenario('GET /', get('/')),
+    escenario('GET /usuarios', get('/usuarios?limit=20')),
+    escenario('GET /usuarios/<int:id>', get(lambda i, c: '/usuarios/%d' % (1 + i % c.usuarios))),
+    escenario('GET /usuarios/me', con_token('/usuarios/me')),
+    escenario('GET /productos', get('/productos?limit=50')),
+    escenario('GET /productos?categoria_id&sort', get('/productos?limit=50&categoria_id=3&sort=-precio')),
+    escenario('GET /productos/search', get(lambda i, c: '/productos/search?q=producto+%d' % (i % 100))),
+    escenario('GET /productos/export?categoria_id',
+              get(lambda i, c: '/productos/export?format=ndjson&categoria_id=%d' % (1 + i % c.categorias))),
+    escenario('GET /productos/<int:id>', get(lambda i, c: '/productos/%d' % producto(i, c))),
+    escenario('GET /categorias', get('/categorias')),
+    escenario('GET /categorias/<int:id>', get(lambda i, c: '/categorias/%d' % (1 + i % c.categorias))),
+    escenario('GET /categorias/<int:id>/stats',
+              get(lambda i, c: '/categorias/%d/stats' % (1 + i % c.categorias))),
+    escenario('GET /stats/inventario', get('/stats/inventario')),
+    escenario('GET /cache/stats', get('/cache/stats')),
+    escenario('GET /pool/stats', get('/pool/stats')),
+    escenario('GET /replicas/stats', get('/replicas/stats')),
+    escenario('GET /metrics', get('/metrics')),
+    escenario('GET /stream/productos', get('/stream/productos')),
+
+    # Autenticación
+    escenario('POST /login', lambda i, c: {'path': '/login', 'json': {
+        'email': 'usuario%d@correo.com' % (i % c.usuarios), 'password': 'password123'
+    }}),
+    escenario('POST /registrar', lambda i, c: {'path': '/registrar', 'json': {
+        'nombre': 'registro-%d' % i, 'email': 'registro%d@bench.com' % i, 'password': 'password123'
+    }}),
+    escenario('POST /refresh', con_token('/refresh', token='refresco')),
+    escenario('POST /logout', con_token('/logout', token='tokens_acceso'), 'tokens_acceso'),
+    escenario('POST /logout/refresh', con_token('/logout/refresh', token='tokens_refresco'), 'tokens_refresco'),
+
+    # Escrituras
+    escenario('POST /usuarios', con_token('/usuarios', lambda i, c: {
+        'nombre': 'nuevo-%d' % i, 'email': 'nuevo%d@bench.com' % i, 'password': 'password123'
+    })),
+    escenario('PUT /usuarios/<int:id>', con_token(
+        lambda i, c: '/usuarios/%d' % (1 + i % c.usuarios), lambda i, c: {'nombre': 'usuario-%d-b' % i})),
+    escenario('PATCH /usuarios/<int:id>', con_token(
+        lambda i, c: '/usuarios/%d' % (1 + i % c.usuarios), lambda i, c: {'nombre': 'usuario-%d-c' % i})),
+    escenario('POST /productos', con_token('/productos', lambda i, c: {
+        'nombre': 'nuevo-%d' % i, 'precio': 10.5, 'cantidad': 5, 'categoria_id': 1 + i % c.categorias
+    })),
+    escenario('PUT /productos/<int:id>', con_token(
+        lambda i, c: '/productos/%d' % producto(i, c), lambda i, c: {'precio': 1 + i % 500})),
+    escenario('PATCH /productos/<int:id>', con_token(
+        lambda i, c: '/productos/%d' % producto(i, c), lambda i, c: {'precio': 2 + i % 500})),
+    escenario('POST /productos/<int:id>/stock', con_token(
+        lambda i, c: '/productos/%d/stock' % producto(i, c), {'delta': 1})),
+    escenario('POST /productos/stock', con_token('/productos/stock', lambda i, c: [
+        {'id': id, 'delta': 1} for id in lote(i, c)[:5]
+    ])),
+    escenario('POST /productos/bulk', con_token('/productos/bulk', lambda i, c: [
+        {'nombre': 'lote-%d-%d' % (i, k), 'precio': 10.5, 'cantidad': 5, 'categoria_id': 1 + k % c.categorias}
+        for k in range(c.lote)
+    ])),
+    escenario('PATCH /productos/bulk', con_token('/productos/bulk', lambda i, c: [
+        {'id': id, 'precio': 1 + (i + id) % 500} for id in lote(i, c)
+    ])),
+    escenario('POST /categorias', con_token('/categorias', lambda i, c: {'nombre': 'categoria-nueva-%d' % i})),
+    escenario('POST /jobs/import-productos', importacion),
+    escenario('GET /jobs/<int:id>', con_token(lambda i, c: '/jobs/%d' % c.reservas['trabajos'][i]), 'trabajos'),
+    escenario('PUT /categorias/<int:id>', con_token(
+        lambda i, c: '/categorias/%d' % (1 + i % c.categorias), lambda i, c: {'nombre': 'categoria-%d-b' % i})),
+    escenario('PATCH /categorias/<int:id>', con_token(
+        lambda i, c: '/categorias/%d' % (1 + i % c.categorias), lambda i, c: {'nombre': 'categoria-%d-c' % i})),
+
+    # Borrados, sobre filas creadas para ellos
+    escenario('DELETE /usuarios/<int:id>', con_token(
+        lambda i, c: '/usuarios/%d' % c.reservas['usuarios'][i]), 'usuarios'),
+    escenario('DELETE /productos/<int:id>', con_token(
+        lambda i, c: '/productos/%d' % c.reservas['productos'][i]), 'productos'),
+    escenario('DELETE /productos/bulk', con_token(
+        '/productos/bulk', lambda i, c: c.reservas['productos_lote'][i * c.lote:(i + 1) * c.lote]),
+        'productos_lote'),
+    escenario('DELETE /categorias/<int:id>', con_token(
+        lambda i, c: '/categorias/%d' % c.reservas['categorias'][i]), 'categorias'),
+]
+
+
+class Contexto:
+    def __init__(self, args):
+        self.usuarios, self.categorias, self.productos = args.usuarios, args.categorias, args.productos
+        self.lote = args.lote
+        self.tokens = {}
+        self.reservas = {}
+
+
+def insertar(objetos):
+    db.session.add_all(objetos)
+    db.session.commit()
+    return [obj.id for obj in objetos]
+
+
+def preparar(app, contexto, escenarios, peticiones):
+    # Filas y tokens que consumen los escenarios de escritura, creados antes de medir
+    with app.app_context():
+        contexto.tokens['acceso'] = create_access_token(identity='1')
+        contexto.tokens['refresco'] = create_refresh_token(identity='1')
+        reservas = {e.reservas for e in escenarios}
+        if 'tokens_acceso' in reservas:
+            contexto.reservas['tokens_acceso'] = [create_access_token(identity='1') for _ in range(peticiones)]
+        if 'tokens_refresco' in reservas:
+            contexto.reservas['tokens_refresco'] = [create_refresh_token(identity='1') for _ in range(peticiones)]
+        if 'usuarios' in reservas:
+            contexto.reservas['usuarios'] = insertar([
+                Usuario(nombre='borrar-%d' % i, email='borrar%d@bench.com' % i, password='password123')
+                for i in range(peticiones)
+            ])
+        if 'trabajos' in reservas:
+            contexto.reservas['trabajos'] = insertar([
+                Trabajo(tipo='import-productos', estado='completado', usuario_id=1) for _ in range(peticiones)
+            ])
+        if 'categorias' in reservas:
+            contexto.reservas['categorias'] = insertar([
+                Categoria(nombre='borrar-%d' % i) for i in range(peticiones)
+            ])
+        for reserva, cantidad in (('productos', peticiones), ('productos_lote', peticiones * contexto.lote)):
+            if reserva in reservas:
+                contexto.reservas[reserva] = insertar([
+                    Producto(nombre='borrar-%d' % i, precio=1.0, cantidad=1, categoria_id=1)
+                    for i in range(cantidad)
+                ])
+
+
+# ------------------------- MEDICIONES -------------------------
+SQL_METRICA = re.compile(
+    r'^http_request_sql_statements_(sum|count)\{route="([^"]*)",method="([^"]*)"\} (\S+)$', re.M)
+
+
+def sentencias_sql(metricas, ruta, metodo):
+    # (sentencias, peticiones) acumuladas de la ruta en el texto de /metrics
+    totales = {'sum': 0.0, 'count': 0.0}
+    for campo, r, m, valor in SQL_METRICA.findall(metricas):
+        if r == ruta and m == metodo:
+            totales[campo] += float(valor)
+    return totales['sum'], totales['count']
+
+
+def reiniciar_pico_rss(pid):
+    # Linux: escribir 5 en clear_refs reinicia VmHWM (el pico de RSS)
+    try:
+        with open('/proc/%d/clear_refs' % pid, 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def pico_rss_mb(pid):
+    try:
+        with open('/proc/%d/status' % pid) as f:
+            for linea in f:
+                if linea.startswith('VmHWM:'):
+                    return int(linea.split()[1]) / 1024
+    except OSError:
+        pass
+    if pid == os.getpid():
+        # Pico de toda la vida del proceso; ru_maxrss va en KB en Linux y en bytes en macOS
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return pico / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    return None
+
+
+def resultado(latencias, errores, segundos, sql, rss):
+    peticiones = len(latencias)
+    return {
+        'peticiones': peticiones,
+        'errores': errores,
+        'rps': round(peticiones / segundos, 1),
+        'p50_ms': round(percentil(latencias, 0.50) * 1000, 3),
+        'p95_ms': round(percentil(latencias, 0.95) * 1000, 3),
+        'p99_ms': round(percentil(latencias, 0.99) * 1000, 3),
+        'sql_por_peticion': round(sql[0] / sql[1], 2) if sql and sql[1] else None,
+        'rss_pico_mb': round(rss, 1) if rss is not None else None
+    }
+
+
+def medir_proceso(app, escenario, peticiones):
+    cliente = app.test_client()
+    antes = sentencias_sql(cliente.get('/metrics').get_data(as_text=True), escenario.ruta, escenario.metodo)
+    reiniciar_pico_rss(os.getpid())
+    latencias, errores = [], 0
+    inicio = time.perf_counter()
+    for peticion in peticiones:
+        t = time.perf_counter()
+        respuesta = cliente.open(method=escenario.metodo, **peticion)
+        # Las respuestas por trozos se generan al leerlas: se mide hasta el final
+        respuesta.get_data()
+        respuesta.close()
+        latencias.append(time.perf_counter() - t)
+        errores += respuesta.status_code >= 400
+    segundos = time.perf_counter() - inicio
+    rss = pico_rss_mb(os.getpid())
+    despues = sentencias_sql(cliente.get('/metrics').get_data(as_text=True), escenario.ruta, escenario.metodo)
+    return resultado(latencias, errores, segundos, (despues[0] - antes[0], despues[1] - antes[1]), rss)
+
+
+async def medir_http(url_base, pid, escenario, peticiones, concurrencia):
+    latencias, errores = [], 0
+    pendientes = iter(peticiones)
+
+    async def cliente(http):
+        nonlocal errores
+        for peticion in pendientes:
+            t = time.perf_counter()
+            respuesta = await http.request(escenario.metodo, peticion['path'], json=peticion.get('json'),
+                                           content=peticion.get('data'), headers=peticion.get('headers'))
+            latencias.append(time.perf_counter() - t)
+            errores += respuesta.status_code >= 400
+
+    limites = httpx.Limits(max_connections=concurrencia)
+    async with httpx.AsyncClient(base_url=url_base, limits=limites, timeout=60) as http:
+        antes = sentencias_sql((await http.get('/metrics')).text, escenario.ruta, escenario.metodo)
+        reiniciar_pico_rss(pid)
+        inicio = time.perf_counter()
+        await asyncio.gather(*[cliente(http) for _ in range(concurrencia)])
+        segundos = time.perf_counter() - inicio
+        rss = pico_rss_mb(pid)
+        despues = sentencias_sql((await http.get('/metrics')).text, escenario.ruta, escenario.metodo)
+    return resultado(latencias, errores, segundos, (despues[0] - antes[0], despues[1] - antes[1]), rss)
+
+
+# ------------------------- SERVIDOR -------------------------
+def servir(uri, puerto):
+    import logging
+    from werkzeug.serving import run_simple
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    run_simple('127.0.0.1', puerto, crear_app_flask(uri, **CONFIG), threaded=True)
+
+
+def esperar_servidor(url_base, proceso, timeout=30):
+    limite = time.time() + timeout
+    while time.time() < limite:
+        if proceso.poll() is not None:
+            raise RuntimeError('El servidor ha terminado antes de arrancar')
+        try:
+            httpx.get(url_base + '/', timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError('El servidor no responde')
+
+
+# ------------------------- INFORMES -------------------------
+def rutas_sin_escenario(app):
+    rutas = {
+        (metodo, regla.rule)
+        for regla in app.url_map.iter_rules() if regla.endpoint.startswith('routes.')
+        for metodo in regla.methods - {'HEAD', 'OPTIONS'}
+    }
+    return sorted('%s %s' % ruta for ruta in rutas - {(e.metodo, e.ruta) for e in ESCENARIOS})
+
+
+def commit_actual():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def imprimir(nombre, r):
+    print('%-36s %8.1f %9.2f %9.2f %9.2f %7s %8s %6d' % (
+        nombre, r['rps'], r['p50_ms'], r['p95_ms'], r['p99_ms'],
+        '-' if r['sql_por_peticion'] is None else '%.1f' % r['sql_por_peticion'],
+        '-' if r['rss_pico_mb'] is None else '%.0f' % r['rss_pico_mb'], r['errores']))
+
+
+def variacion(antes, despues):
+    if antes is None or despues is None:
+        return None
+    return (despues - antes) / antes * 100 if antes else (0.0 if despues == antes else float('inf'))
+
+
+def comparar(fichero_a, fichero_b, umbral):
+    # Devuelve 1 si algún escenario empeora más del umbral (rps, p95 o SQL por petición)
+    with open(fichero_a) as f:
+        a = json.load(f)
+    with open(fichero_b) as f:
+        b = json.load(f)
+    print('%s (%s) -> %s (%s)' % (fichero_a, a['meta'].get('commit'), fichero_b, b['meta'].get('commit')))
+    distintos = [campo for campo in ('modo', 'concurrencia', 'peticiones', 'productos', 'base_de_datos')
+                 if a['meta'].get(campo) != b['meta'].get(campo)]
+    if distintos:
+        print('Aviso: las pasadas difieren en %s' % ', '.join(distintos))
+    print('%-36s %19s %8s %20s %8s %14s %14s' % ('escenario', 'rps', '', 'p95 (ms)', '', 'sql', 'rss (MB)'))
+    regresiones = 0
+    for nombre in a['escenarios']:
+        if nombre not in b['escenarios']:
+            continue
+        ra, rb = a['escenarios'][nombre], b['escenarios'][nombre]
+        rps, p95 = variacion(ra['rps'], rb['rps']), variacion(ra['p95_ms'], rb['p95_ms'])
+        sql_a, sql_b = ra['sql_por_peticion'], rb['sql_por_peticion']
+        peor = (rps is not None and rps < -umbral) or (p95 is not None and p95 > umbral) \
+            or (sql_a is not None and sql_b is not None and sql_b > sql_a)
+        regresiones += peor
+        print('%-36s %8.1f -> %7.1f %+7.1f%% %8.2f -> %8.2f %+7.1f%% %5s -> %5s %5s -> %5s %s' % (
+            nombre, ra['rps'], rb['rps'], rps or 0, ra['p95_ms'], rb['p95_ms'], p95 or 0,
+            sql_a, sql_b, ra['rss_pico_mb'], rb['rss_pico_mb'], '<-- peor' if peor else ''))
+    solo = sorted(set(a['escenarios']) ^ set(b['escenarios']))
+    if solo:
+        print('\nEscenarios en un solo fichero: %s' % ', '.join(solo))
+    print('\n%d escenarios empeoran más de un %.0f%%' % (regresiones, umbral))
+    return 1 if regresiones else 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--modo', choices=['proceso', 'http'], default='proceso')
+    parser.add_argument('--uri', help='Base de datos (por defecto un SQLite temporal)')
+    parser.add_argument('--usuarios', type=int, default=100)
+    parser.add_argument('--categorias', type=int, default=20)
+    parser.add_argument('--productos', type=int, default=10000)
+    parser.add_argument('--peticiones', type=int, default=200, help='Peticiones por escenario')
+    parser.add_argument('--concurrencia', type=int, default=16, help='Clientes simultáneos (modo http)')
+    parser.add_argument('--lote', type=int, default=50, help='Elementos por petición masiva')
+    parser.add_argument('--filtro', help='Solo los escenarios cuyo nombre contiene este texto')
+    parser.add_argument('--salida', help='Fichero JSON con los resultados')
+    parser.add_argument('--comparar', nargs=2, metavar=('ANTES', 'DESPUES'))
+    parser.add_argument('--umbral', type=float, default=10, help='%% de empeoramiento que cuenta como regresión')
+    parser.add_argument('--puerto', type=int, default=8766)
+    parser.add_argument('--servir', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.comparar:
+        sys.exit(comparar(*args.comparar, args.umbral))
+    uri = args.uri or 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'recursoapi_bench_rutas.db')
+    if args.servir:
+        return servir(uri, args.puerto)
+
+    app = crear_app_flask(uri, **CONFIG)
+    faltan = rutas_sin_escenario(app)
+    if faltan:
+        print('Rutas sin escenario: %s\n' % ', '.join(faltan))
+    escenarios = [e for e in ESCENARIOS if not args.filtro or args.filtro in e.nombre]
+    sembrar(app, usuarios=args.usuarios, categorias=args.categorias, productos=args.productos)
+    contexto = Contexto(args)
+    preparar(app, contexto, escenarios, args.peticiones)
+
+    proceso = None
+    if args.modo == 'http':
+        # La salida del servidor (trazas de los errores 500) va a un fichero
+        log = os.path.join(tempfile.gettempdir(), 'recursoapi_bench_rutas_servidor.log')
+        with open(log, 'w') as salida:
+            proceso = subprocess.Popen([
+                sys.executable, '-m', 'benchmarks.bench_rutas', '--servir', '--uri', uri, '--puerto', str(args.puerto)
+            ], stdout=salida, stderr=subprocess.STDOUT)
+        url_base = 'http://127.0.0.1:%d' % args.puerto
+        esperar_servidor(url_base, proceso)
+
+    print('%-36s %8s %9s %9s %9s %7s %8s %6s' % (
+        'escenario', 'rps', 'p50 (ms)', 'p95 (ms)', 'p99 (ms)', 'sql', 'rss (MB)', 'errores'))
+    resultados = {}
+    try:
+        for e in escenarios:
+            peticiones = [e.peticion(i, contexto) for i in range(args.peticiones)]
+            if proceso is None:
+                resultados[e.nombre] = medir_proceso(app, e, peticiones)
+            else:
+                resultados[e.nombre] = asyncio.run(
+                    medir_http(url_base, proceso.pid, e, peticiones, args.concurrencia))
+            imprimir(e.nombre, resultados[e.nombre])
+    finally:
+        if proceso is not None:
+            proceso.terminate()
+            proceso.wait()
+            print('\nSalida del servidor en %s' % log)
+
+    if args.salida:
+        with app.app_context():
+            motor = db.engine.dialect.name
+        informe = {
+            'meta': {
+                'fecha': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'commit': commit_actual(),
+                'modo': args.modo,
+                'concurrencia': args.concurrencia if args.modo == 'http' else 1,
+                'peticiones': args.peticiones,
+                'usuarios': args.usuarios,
+                'categorias': args.categorias,
+                'productos': args.productos,
+                'lote': args.lote,
+                'base_de_datos': motor,
+                'python': platform.python_version(),
+                'rutas_sin_escenario': faltan
+            },
+            'escenarios': resultados
+        }
+        with open(args.salida, 'w') as f:
+            json.dump(informe, f, indent=2, sort_keys=True, ensure_ascii=False)
+            f.write('\n')
+        print('\nResultados en %s' % args.salida)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+# Varios hilos descuentan stock del mismo producto a la vez:
+#   put-sin-version  GET + PUT con la cantidad calculada por el cliente (se pierden
+#                    actualizaciones cuando dos lecturas se solapan)
+#   put-con-version  GET + PUT con la versión leída, reintentando tras un 409
+#   delta            POST /productos/<id>/stock con delta -1 (UPDATE condicional)
+# Para cada modo: peticiones por segundo, conflictos (409) y unidades perdidas.
+#
+#   python -m benchmarks.bench_stock --hilos 8 --operaciones 50
+import argparse
+import os
+import tempfile
+import threading
+import time
+from benchmarks.comun import crear_app_flask, sembrar
+from config import db
+from models import Producto
+
+ID = 1
+
+
+def put_sin_version(cliente, cabeceras):
+    producto = cliente.get('/productos/%d' % ID).get_json()
+    cliente.put('/productos/%d' % ID, json={'cantidad': producto['cantidad'] - 1}, headers=cabeceras)
+    return 2, 0
+
+
+def put_con_version(cliente, cabeceras):
+    peticiones = conflictos = 0
+    while True:
+        producto = cliente.get('/productos/%d' % ID).get_json()
+        respuesta = cliente.put('/productos/%d' % ID, headers=cabeceras, json={
+            'cantidad': producto['cantidad'] - 1, 'version': producto['version']
+        })
+        peticiones += 2
+        if respuesta.status_code != 409:
+            return peticiones, conflictos
+        conflictos += 1
+
+
+def delta(cliente, cabeceras):
+    respuesta = cliente.post('/productos/%d/stock' % ID, json={'delta': -1}, headers=cabeceras)
+    assert respuesta.status_code == 200, respuesta.get_json()
+    return 1, 0
+
+
+MODOS = {'put-sin-version': put_sin_version, 'put-con-version': put_con_version, 'delta': delta}
+
+
+def ejecutar(app, operacion, hilos, operaciones, cabeceras):
+    with app.app_context():
+        inicial = db.session.get(Producto, ID).cantidad
+    totales = {'peticiones': 0, 'conflictos': 0}
+    lock = threading.Lock()
+
+    def trabajar():
+        cliente = app.test_client()
+        peticiones = conflictos = 0
+        for _ in range(operaciones):
+            p, c = operacion(cliente, cabeceras)
+            peticiones += p
+            conflictos += c
+        with lock:
+            totales['peticiones'] += peticiones
+            totales['conflictos'] += conflictos
+
+    trabajadores = [threading.Thread(target=trabajar) for _ in range(hilos)]
+    inicio = time.perf_counter()
+    for trabajador in trabajadores:
+        trabajador.start()
+    for trabajador in trabajadores:
+        trabajador.join()
+    segundos = time.perf_counter() - inicio
+    with app.app_context():
+        final = db.session.get(Producto, ID).cantidad
+    perdidas = final - (inicial - hilos * operaciones)
+    return hilos * operaciones / segundos, totales['peticiones'] / segundos, totales['conflictos'], perdidas
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--hilos', type=int, default=8)
+    parser.add_argument('--operaciones', type=int, default=50)
+    parser.add_argument('--uri', default='sqlite:///' + os.path.join(
+        tempfile.gettempdir(), 'recursoapi_bench_stock.db'))
+    args = parser.parse_args()
+
+    app = crear_app_flask(args.uri, RATE_LIMIT_ENABLED=False, COMPRESSION_ENABLED=False)
+    print('%d hilos x %d descuentos sobre el mismo producto' % (args.hilos, args.operaciones))
+    print('%-16s %12s %12s %10s %10s' % ('modo', 'descuentos/s', 'peticiones/s', 'conflictos', 'perdidas'))
+    for nombre, operacion in MODOS.items():
+        sembrar(app, usuarios=1, categorias=1, productos=10)
+        with app.app_context():
+            db.session.get(Producto, ID).cantidad = args.hilos * args.operaciones
+            db.session.commit()
+        login = app.test_client().post('/login', json={
+            'email': 'usuario0@correo.com', 'password': 'password123'
+        }).get_json()
+        cabeceras = {'Authorization': 'Bearer ' + login['access_token']}
+        resultado = ejecutar(app, operacion, args.hilos, args.operaciones, cabeceras)
+        print('%-16s %12.0f %12.0f %10d %10d' % ((nombre,) + resultado))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+# Utilidades compartidas por los benchmarks: aplicación Flask contra una base
+# de datos local (SQLite o MySQL) y carga de datos de prueba.
+import random
+from sqlalchemy import insert
+from app import create_app
+from config import db
+from models import Usuario, Categoria, Producto
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))] if valores else 0.0
+
+
+def crear_app_flask(uri, **config):
+    return create_app({
+        'SQLALCHEMY_DATABASE_URI': uri,
+        'SECRET_KEY': 'benchmark-' * 4,
+        'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+        'CACHE_TYPE': 'null',
+        'SWAGGER_UI': False,
+        'MIGRATIONS_ENABLED': False,
+        **config
+    })
+
+
+def sembrar(app, usuarios=100, categorias=20, productos=10000, semilla=42, nombre=None):
+    # nombre(i, aleatorio): nombre del producto i; por defecto producto-<i>
+    aleatorio = random.Random(semilla)
+    nombre = nombre or (lambda i, aleatorio: 'producto-%d' % i)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.add_all(Categoria(nombre='categoria-%d' % i) for i in range(categorias))
+        db.session.add_all(
+            Usuario(nombre='usuario-%d' % i, email='usuario%d@correo.com' % i, password='password123')
+            for i in range(usuarios)
+        )
+        db.session.commit()
+        filas = [
+            {
+                'nombre': nombre(i, aleatorio),
+                'precio': round(aleatorio.uniform(1, 500), 2),
+                'cantidad': aleatorio.randint(0, 1000),
+                'categoria_id': aleatorio.randint(1, categorias)
+            }
+            for i in range(productos)
+        ]
+        for inicio in range(0, len(filas), 5000):
+            db.session.execute(insert(Producto), filas[inicio:inicio + 5000])
+        db.session.commit()
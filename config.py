@@ -1,12 +1,115 @@
 import pymysql
 import os
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
+from flask_jwt_extended import JWTManager
+from sqlalchemy.engine import make_url
+from utils.async_db import AsyncDB
+from utils.auth import Autenticacion
+from utils.busqueda import Buscador
+from utils.cache import Cache
+from utils.compresion import Compresion
+from utils.credenciales import Credenciales
+from utils.eventos import Eventos
+from utils.limites import Limitador
+from utils.metricas import Metricas
+from utils.passwords import HasherPasswords
+from utils.pool import PoolAsyncInstrumentado, PoolInstrumentado
+from utils.replicas import Replicas, SesionReplicas
+from utils.resumen import Resumen
+from utils.trabajos import Trabajos
 
 pymysql.install_as_MySQLdb()
 
-# Inicialización de base de datos y migraciones
-db = SQLAlchemy()
-migrate = Migrate()
+# Inicialización de base de datos y autenticación JWT. Las migraciones
+# (Flask-Migrate) se registran en create_app solo si están activadas. La sesión
+# envía las lecturas de las peticiones GET a las réplicas, si las hay.
+db = SQLAlchemy(session_options={'class_': SesionReplicas})
+jwt = JWTManager()
+auth = Autenticacion()
 
-SECRET_KEY = 'examen_recurso'
+# Caché de lectura (categorías y listados de productos). Se invalida sola al
+# confirmar cualquier escritura sobre las tablas de las que depende.
+cache = Cache()
+DEPENDENCIAS_CACHE = {
+    'productos': ['productos'],
+    'categorias': ['categorias', 'productos']
+}
+cache.invalidar_en_commit(db.session, DEPENDENCIAS_CACHE)
+
+# Motor asíncrono para el modo ASGI (asgi.py); comparte caché e invalidación
+adb = AsyncDB()
+cache.invalidar_en_commit(adb.clase_sesion, DEPENDENCIAS_CACHE)
+
+# Compresión de las respuestas (gzip, br, zstd) negociada con Accept-Encoding
+compresion = Compresion()
+
+# Búsqueda de productos por nombre: FULLTEXT en MySQL, índice invertido en memoria en el resto
+buscador = Buscador()
+
+# Feed de cambios de productos, categorías y usuarios (GET /stream/productos)
+eventos = Eventos()
+
+# Resumen del inventario por categoría, mantenido solo con STATS_SOURCE = 'summary'
+resumen = Resumen()
+
+# Límites de peticiones por IP, usuario o email (login), en memoria o en Redis
+limitador = Limitador()
+
+# Réplicas de lectura (binds replica-N), con comprobación de salud y retraso
+replicas = Replicas()
+
+# Métricas de Prometheus (GET /metrics)
+metricas = Metricas()
+
+# Hash y verificación de contraseñas en un pool acotado de hilos/procesos
+hasher = HasherPasswords()
+
+# Emails registrados (filtro de Bloom por proceso) para el registro de usuarios
+credenciales = Credenciales()
+
+# Trabajos en segundo plano (importaciones) en un pool de procesos; la tabla
+# trabajos es la cola. Un trabajo ejecutado en otro proceso invalida allí su
+# caché: al terminar se invalida también la del proceso que lo lanzó.
+trabajos = Trabajos()
+trabajos.al_terminar(lambda tablas: cache.invalidar(
+    *{espacio for tabla in tablas for espacio in DEPENDENCIAS_CACHE.get(tabla, ())}
+))
+
+# ------------------------- BASE DE DATOS -------------------------
+# Sin DATABASE_URL, un SQLite local (en la carpeta instance/ de Flask) para
+# desarrollo: la URL y las credenciales de producción solo vienen del entorno
+DATABASE_URL_POR_DEFECTO = 'sqlite:///recurso.db'
+
+def database_url():
+    # DATABASE_URL (entorno o .env); mysql:// se sirve con PyMySQL
+    url = os.environ.get('DATABASE_URL', DATABASE_URL_POR_DEFECTO)
+    if url.startswith('mysql://'):
+        url = 'mysql+pymysql://' + url[len('mysql://'):]
+    return url
+
+def database_replica_urls():
+    # DATABASE_REPLICA_URLS: URLs de las réplicas de lectura, separadas por comas
+    urls = os.environ.get('DATABASE_REPLICA_URLS', '')
+    return [
+        'mysql+pymysql://' + url[len('mysql://'):] if url.startswith('mysql://') else url
+        for url in (url.strip() for url in urls.split(',')) if url
+    ]
+
+def entero_entorno(nombre, por_defecto):
+    return int(os.environ.get(nombre, por_defecto))
+
+def opciones_motor(url, asincrono=False):
+    # pool_pre_ping descarta conexiones cerradas por el servidor (timeout de
+    # inactividad de RDS) y pool_recycle las renueva antes de que caduquen
+    opciones = {
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', '1').lower() in ('1', 'true'),
+        'pool_recycle': entero_entorno('DB_POOL_RECYCLE', 1800)
+    }
+    if make_url(url).get_backend_name() != 'sqlite':
+        opciones.update(
+            poolclass=PoolAsyncInstrumentado if asincrono else PoolInstrumentado,
+            pool_size=entero_entorno('DB_POOL_SIZE', 10),
+            max_overflow=entero_entorno('DB_MAX_OVERFLOW', 20),
+            pool_timeout=entero_entorno('DB_POOL_TIMEOUT', 10)
+        )
+    return opciones
@@ -0,0 +1,246 @@
+import asyncio
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+from sqlalchemy.orm.exc import StaleDataError
+from config import adb, cache, credenciales, hasher
+from controllers.controllers import (COLUMNAS_CATEGORIA, COLUMNAS_USUARIO, consulta_credenciales,
+                                     consulta_email_registrado, leer_filtros_productos, leer_version,
+                                     preparar_listado_productos, tokens_usuario)
+from models.models import Usuario, Producto, Categoria, VersionTabla
+from utils.paginacion import (
+    CursorInvalido, columnas_de_orden, consulta_pagina, construir_pagina, fila_a_dict, ordenar,
+    serializar_en_streaming_async
+)
+from utils.credenciales import normalizar_email
+
+# Versiones asíncronas de controllers.controllers para el modo ASGI (asgi.py).
+# Devuelven lo mismo (respuesta, status); la sesión es la de la petición en
+# curso (adb.session). El hash de contraseñas y la serialización no cambian:
+# el KDF se ejecuta fuera del bucle de eventos con asyncio.to_thread.
+
+# ------------------------- AUTENTICACIÓN -------------------------
+async def login_usuario(email, password):
+    fila = (await adb.session.execute(consulta_credenciales(normalizar_email(email)))).first()
+    if fila and await asyncio.to_thread(hasher.verificar, fila.password, password):
+        return tokens_usuario(fila.id), 200
+    return {'msg': 'Credenciales incorrectas'}, 401
+
+async def registrar_usuario(nombre, email, password):
+    clave = normalizar_email(email)
+    if not clave:
+        return {'msg': 'Falta el email'}, 400
+    if await adb.session.run_sync(credenciales.puede_existir, clave) \
+            and await adb.session.scalar(consulta_email_registrado(clave)):
+        return {'msg': 'El usuario ya existe'}, 400
+    nuevo_usuario = await asyncio.to_thread(Usuario, nombre=nombre, email=email, password=password)
+    adb.session.add(nuevo_usuario)
+    try:
+        await adb.session.commit()
+    except IntegrityError:
+        await adb.session.rollback()
+        if not await adb.session.scalar(consulta_email_registrado(clave)):
+            raise
+        await adb.session.run_sync(credenciales.conocida, clave)
+        return {'msg': 'El usuario ya existe'}, 400
+    return {'msg': 'Usuario registrado exitosamente'}, 201
+
+# ------------------------- VERSIONES (ETag) -------------------------
+async def sellos_tablas(*tablas):
+    filas = (await adb.session.execute(
+        select(VersionTabla.tabla, VersionTabla.version, VersionTabla.updated_at)
+        .where(VersionTabla.tabla.in_(tablas))
+    )).all()
+    return sorted(tuple(fila) for fila in filas)
+
+async def sello_fila(modelo, id):
+    updated_at = await adb.session.scalar(select(modelo.updated_at).where(modelo.id == id))
+    return [(modelo.__tablename__, id, updated_at)] if updated_at else None
+
+async def sello_usuario(id):
+    return await sello_fila(Usuario, id)
+
+async def sello_categoria(id):
+    return await sello_fila(Categoria, id)
+
+async def sello_producto(id):
+    fila = (await adb.session.execute(
+        select(Producto.categoria_id, Producto.updated_at, Categoria.updated_at)
+        .outerjoin(Categoria, Producto.categoria_id == Categoria.id)
+        .where(Producto.id == id)
+    )).first()
+    if fila is None:
+        return None
+    return [('productos', id, fila[1]), ('categorias', fila[0], fila[2])]
+
+# ------------------------- LISTADOS -------------------------
+async def obtener_listado(query, columna, limit=None, after=None, serializar=None,
+                          ordenar_por=None, descendente=False):
+    serializar = serializar or fila_a_dict
+    if limit is None and after is None:
+        query = ordenar(query, columnas_de_orden(columna, ordenar_por), descendente)
+        return [serializar(fila) for fila in (await adb.session.execute(query)).all()], 200
+    try:
+        query, claves, limit = consulta_pagina(query, columna, limit, after, ordenar_por, descendente)
+    except CursorInvalido:
+        return {'msg': 'Cursor inválido'}, 400
+    filas = (await adb.session.execute(query)).all()
+    return construir_pagina(filas, claves, limit, serializar), 200
+
+async def eliminar_fila(modelo, id, no_encontrado, eliminado):
+    fila = await adb.session.get(modelo, id)
+    if not fila:
+        return {'msg': no_encontrado}, 404
+    await adb.session.delete(fila)
+    await adb.session.commit()
+    return {'msg': eliminado}, 200
+
+# ------------------------- USUARIOS -------------------------
+async def obtener_usuarios(limit=None, after=None):
+    return await obtener_listado(select(*COLUMNAS_USUARIO), Usuario.id, limit, after)
+
+async def stream_usuarios():
+    return serializar_en_streaming_async(adb.session, select(*COLUMNAS_USUARIO), Usuario.id), 200
+
+async def obtener_usuario(id):
+    usuario = await adb.session.get(Usuario, id)
+    if not usuario:
+        return {'msg': 'Usuario no encontrado'}, 404
+    return usuario.to_dict(), 200
+
+async def crear_usuario(nombre, email, password):
+    nuevo_usuario = await asyncio.to_thread(Usuario, nombre=nombre, email=email, password=password)
+    adb.session.add(nuevo_usuario)
+    await adb.session.commit()
+    return nuevo_usuario.to_dict(), 201
+
+async def actualizar_usuario(id, nombre=None, email=None, password=None):
+    usuario = await adb.session.get(Usuario, id)
+    if not usuario:
+        return {'msg': 'Usuario no encontrado'}, 404
+    if nombre:
+        usuario.nombre = nombre
+    if email:
+        usuario.email = email
+    if password:
+        await asyncio.to_thread(usuario.set_password, password)
+    await adb.session.commit()
+    return usuario.to_dict(), 200
+
+async def eliminar_usuario(id):
+    return await eliminar_fila(Usuario, id, 'Usuario no encontrado', 'Usuario eliminado')
+
+# ------------------------- PRODUCTOS -------------------------
+async def cargar_producto(id):
+    return await adb.session.get(
+        Producto, id,
+        options=[joinedload(Producto.categoria)],
+        populate_existing=True
+    )
+
+@cache.cached('productos')
+async def obtener_productos(limit=None, after=None, sort=None, fields=None, **filtros):
+    try:
+        query, ordenar_por, descendente, serializar = preparar_listado_productos(
+            sort, fields, seleccionar=select, **filtros
+        )
+    except ValueError as e:
+        return {'msg': str(e)}, 400
+    return await obtener_listado(query, Producto.id, limit, after, serializar, ordenar_por, descendente)
+
+async def stream_productos(sort=None, fields=None, **filtros):
+    try:
+        query, ordenar_por, descendente, serializar = preparar_listado_productos(
+            sort, fields, seleccionar=select, **filtros
+        )
+    except ValueError as e:
+        return {'msg': str(e)}, 400
+    return serializar_en_streaming_async(
+        adb.session, query, Producto.id, serializar=serializar,
+        ordenar_por=ordenar_por, descendente=descendente
+    ), 200
+
+async def obtener_producto(id):
+    producto = await cargar_producto(id)
+    if not producto:
+        return {'msg': 'Producto no encontrado'}, 404
+    return producto.to_dict(), 200
+
+async def crear_producto(nombre, precio, cantidad, categoria_id):
+    nuevo_producto = Producto(nombre=nombre, precio=precio, cantidad=cantidad, categoria_id=categoria_id)
+    adb.session.add(nuevo_producto)
+    await adb.session.commit()
+    return (await cargar_producto(nuevo_producto.id)).to_dict(), 201
+
+async def conflicto_version(id):
+    version = await adb.session.scalar(select(Producto.version).where(Producto.id == id))
+    if version is None:
+        return {'msg': 'Producto no encontrado'}, 404
+    return {'msg': 'El producto ha cambiado, vuelva a leerlo', 'version': version}, 409
+
+async def actualizar_producto(id, nombre=None, precio=None, cantidad=None, categoria_id=None, version=None):
+    producto = await adb.session.get(Producto, id)
+    if not producto:
+        return {'msg': 'Producto no encontrado'}, 404
+    if version is not None and version != producto.version:
+        return await conflicto_version(id)
+    if nombre:
+        producto.nombre = nombre
+    if precio is not None:
+        producto.precio = precio
+    if cantidad is not None:
+        producto.cantidad = cantidad
+    if categoria_id:
+        producto.categoria_id = categoria_id
+    try:
+        await adb.session.commit()
+    except StaleDataError:
+        await adb.session.rollback()
+        return await conflicto_version(id)
+    return (await cargar_producto(id)).to_dict(), 200
+
+async def eliminar_producto(id, version=None):
+    producto = await adb.session.get(Producto, id)
+    if not producto:
+        return {'msg': 'Producto no encontrado'}, 404
+    if version is not None and version != producto.version:
+        return await conflicto_version(id)
+    await adb.session.delete(producto)
+    try:
+        await adb.session.commit()
+    except StaleDataError:
+        await adb.session.rollback()
+        return await conflicto_version(id)
+    return {'msg': 'Producto eliminado'}, 200
+
+# ------------------------- CATEGORÍAS -------------------------
+@cache.cached('categorias')
+async def obtener_categorias(limit=None, after=None):
+    return await obtener_listado(select(*COLUMNAS_CATEGORIA), Categoria.id, limit, after)
+
+async def stream_categorias():
+    return serializar_en_streaming_async(adb.session, select(*COLUMNAS_CATEGORIA), Categoria.id), 200
+
+async def obtener_categoria(id):
+    categoria = await adb.session.get(Categoria, id)
+    if not categoria:
+        return {'msg': 'Categoría no encontrada'}, 404
+    return categoria.to_dict(), 200
+
+async def crear_categoria(nombre):
+    nueva_categoria = Categoria(nombre=nombre)
+    adb.session.add(nueva_categoria)
+    await adb.session.commit()
+    return nueva_categoria.to_dict(), 201
+
+async def actualizar_categoria(id, nombre=None):
+    categoria = await adb.session.get(Categoria, id)
+    if not categoria:
+        return {'msg': 'Categoría no encontrada'}, 404
+    if nombre:
+        categoria.nombre = nombre
+    await adb.session.commit()
+    return categoria.to_dict(), 200
+
+async def eliminar_categoria(id):
+    return await eliminar_fila(Categoria, id, 'Categoría no encontrada', 'Categoría eliminada')
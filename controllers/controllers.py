@@ -1,31 +1,178 @@
-from flask import jsonify
-from flask_jwt_extended import create_access_token
-from werkzeug.security import generate_password_hash, check_password_hash
-from models.models import db, Usuario, Producto, Categoria
+import csv
+import math
+import os
+from itertools import islice
+from flask import current_app, g, jsonify
+from flask_jwt_extended import create_access_token, create_refresh_token
+from sqlalchemy import delete, func, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import aliased, joinedload
+from sqlalchemy.orm.exc import StaleDataError
+from config import auth, buscador, cache, credenciales, eventos, hasher, resumen, trabajos
+from models.models import db, Usuario, Producto, Categoria, ResumenCategoria, Trabajo, VersionTabla
+from utils.paginacion import (CursorInvalido, codificar_cursor, columnas_de_orden, decodificar_cursor,
+                              normalizar_limite, ordenar, paginar, serializar_en_streaming)
+from utils import exportacion
+from utils.credenciales import normalizar_email
+from utils.eventos import evento
+from utils.resumen import recalcular
+from utils.versiones import leer_versiones
 
 # ------------------------- AUTENTICACIÓN -------------------------
+# Login y registro buscan por el email normalizado (índice propio) y leen solo
+# las columnas que necesitan, sin crear instancias de Usuario. El registro
+# pregunta antes al filtro de emails registrados (utils.credenciales).
+def consulta_credenciales(clave):
+    return select(Usuario.id, Usuario.password).where(Usuario.email_normalizado == clave)
+
+def consulta_email_registrado(clave):
+    return select(Usuario.id).where(Usuario.email_normalizado == clave).limit(1)
+
 def login_usuario(email, password):
-    usuario = Usuario.query.filter_by(email=email).first()
-    if usuario and check_password_hash(usuario.password, password):
-        token = create_access_token(identity=usuario.id)
-        return {'access_token': token}, 200
+    fila = db.session.execute(consulta_credenciales(normalizar_email(email))).first()
+    if fila and hasher.verificar(fila.password, password):
+        return tokens_usuario(fila.id), 200
     return {'msg': 'Credenciales incorrectas'}, 401
 
+def tokens_usuario(id):
+    # La identidad (sub) de un JWT tiene que ser una cadena
+    return {
+        'access_token': create_access_token(identity=str(id)),
+        'refresh_token': create_refresh_token(identity=str(id))
+    }
+
+def refrescar_token():
+    return {'access_token': create_access_token(identity=auth.identidad())}, 200
+
+def cerrar_sesion():
+    auth.revocar(auth.claims())
+    return {'msg': 'Token revocado'}, 200
+
+def usuario_actual():
+    # El token solo lleva el id: el Usuario se lee la primera vez que un handler
+    # lo pide, y una sola vez por petición
+    if 'usuario_actual' not in g:
+        g.usuario_actual = db.session.get(Usuario, int(auth.identidad()))
+    return g.usuario_actual
+
 def registrar_usuario(nombre, email, password):
-    if Usuario.query.filter_by(email=email).first():
+    clave = normalizar_email(email)
+    if not clave:
+        return {'msg': 'Falta el email'}, 400
+    if credenciales.puede_existir(db.session, clave) and db.session.scalar(consulta_email_registrado(clave)):
         return {'msg': 'El usuario ya existe'}, 400
-    nuevo_usuario = Usuario(nombre=nombre, email=email, password=generate_password_hash(password))
+    nuevo_usuario = Usuario(nombre=nombre, email=email, password=password)
     db.session.add(nuevo_usuario)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # El filtro no la conocía (alta en otro proceso, o a la vez que esta)
+        db.session.rollback()
+        if not db.session.scalar(consulta_email_registrado(clave)):
+            raise
+        credenciales.conocida(db.session, clave)
+        return {'msg': 'El usuario ya existe'}, 400
     return {'msg': 'Usuario registrado exitosamente'}, 201
 
+# ------------------------- VERSIONES (ETag) -------------------------
+def sellos_tablas(*tablas):
+    return leer_versiones(db.session, VersionTabla, tablas)
+
+def sello_fila(modelo, id):
+    updated_at = db.session.scalar(select(modelo.updated_at).where(modelo.id == id))
+    return [(modelo.__tablename__, id, updated_at)] if updated_at else None
+
+def sello_usuario(id):
+    return sello_fila(Usuario, id)
+
+def sello_categoria(id):
+    return sello_fila(Categoria, id)
+
+def sello_producto(id):
+    fila = db.session.execute(
+        select(Producto.categoria_id, Producto.updated_at, Categoria.updated_at)
+        .outerjoin(Categoria, Producto.categoria_id == Categoria.id)
+        .where(Producto.id == id)
+    ).first()
+    if fila is None:
+        return None
+    return [('productos', id, fila[1]), ('categorias', fila[0], fila[2])]
+
+# ------------------------- ACTUALIZACIONES PARCIALES (PATCH) -------------------------
+# PATCH escribe con un solo UPDATE ... WHERE id = :id, solo con las columnas
+# enviadas, y devuelve la fila con RETURNING (sin RETURNING, en MySQL, se relee
+# con la fila ya bloqueada por el UPDATE). El WHERE exige además que alguna
+# columna cambie: un cuerpo que no cambia nada no escribe (ni cambian version,
+# updated_at o el ETag). Solo si el UPDATE no escribe se lee la fila, para
+# responder 404 o la fila tal como está.
+def valores_parciales(data, campos):
+    # (columnas enviadas, error); los campos ausentes o null no se tocan
+    if not isinstance(data, dict):
+        return None, 'Se esperaba un objeto'
+    valores = {}
+    for campo, tipos in campos.items():
+        if data.get(campo) is None:
+            continue
+        if isinstance(data[campo], bool) or not isinstance(data[campo], tipos):
+            return None, 'Valor no válido para %s' % campo
+        valores[campo] = data[campo]
+    return valores, None
+
+def actualizar_fila(modelo, id, valores, columnas, condiciones=(), extra=None):
+    # Fila con `columnas` tras el UPDATE, o None si no ha escrito: no existe,
+    # no cumple las condiciones o ya tenía esos valores
+    if not valores:
+        return None
+    sentencia = (
+        update(modelo)
+        .where(modelo.id == id, *condiciones,
+               or_(*[getattr(modelo, c).is_distinct_from(v) for c, v in valores.items()]))
+        .values(**valores, **(extra or {}))
+        .execution_options(synchronize_session=False)
+    )
+    if db.session.get_bind().dialect.update_returning:
+        return db.session.execute(sentencia.returning(*columnas)).first()
+    if db.session.execute(sentencia).rowcount:
+        return db.session.execute(select(*columnas).where(modelo.id == id)).first()
+    return None
+
+def leer_fila(modelo, id, columnas):
+    # Tras un UPDATE que no ha escrito: se cierra la transacción sin commit
+    # (no hay nada que confirmar ni versiones que incrementar) y se lee la fila
+    db.session.rollback()
+    return db.session.execute(select(*columnas).where(modelo.id == id)).first()
+
 # ------------------------- USUARIOS -------------------------
-def obtener_usuarios():
-    usuarios = Usuario.query.all()
-    return [u.to_dict() for u in usuarios], 200
+# Los listados seleccionan columnas (tuplas) en lugar de instancias del modelo;
+# cada fila se convierte en el mismo dict que to_dict()
+COLUMNAS_USUARIO = (Usuario.id, Usuario.nombre, Usuario.email)
+
+def obtener_usuarios(limit=None, after=None):
+    query = db.session.query(*COLUMNAS_USUARIO)
+    if limit is None and after is None:
+        return [fila._asdict() for fila in query.order_by(Usuario.id).all()], 200
+    try:
+        return paginar(query, Usuario.id, limit, after), 200
+    except CursorInvalido:
+        return {'msg': 'Cursor inválido'}, 400
+
+def stream_usuarios():
+    return serializar_en_streaming(db.session.query(*COLUMNAS_USUARIO), Usuario.id), 200
+
+def obtener_usuario(id):
+    usuario = db.session.get(Usuario, id)
+    if not usuario:
+        return {'msg': 'Usuario no encontrado'}, 404
+    return usuario.to_dict(), 200
+
+def obtener_usuario_actual():
+    usuario = usuario_actual()
+    if not usuario:
+        return {'msg': 'Usuario no encontrado'}, 404
+    return usuario.to_dict(), 200
 
 def crear_usuario(nombre, email, password):
-    nuevo_usuario = Usuario(nombre=nombre, email=email, password=generate_password_hash(password))
+    nuevo_usuario = Usuario(nombre=nombre, email=email, password=password)
     db.session.add(nuevo_usuario)
     db.session.commit()
     return nuevo_usuario.to_dict(), 201
@@ -39,10 +186,38 @@ def actualizar_usuario(id, nombre=None, email=None, password=None):
     if email:
         usuario.email = email
     if password:
-        usuario.password = generate_password_hash(password)
+        usuario.set_password(password)
     db.session.commit()
     return usuario.to_dict(), 200
 
+CAMPOS_ESCRITURA_USUARIO = {'nombre': (str,), 'email': (str,), 'password': (str,)}
+
+def actualizar_usuario_parcial(id, data):
+    valores, error = valores_parciales(data, CAMPOS_ESCRITURA_USUARIO)
+    if error:
+        return {'msg': error}, 400
+    if 'password' in valores:
+        # El hash lleva sal: una contraseña enviada siempre se escribe
+        valores['password'] = hasher.hashear(valores['password'])
+    if 'email' in valores:
+        valores['email_normalizado'] = normalizar_email(valores['email'])
+    try:
+        fila = actualizar_fila(Usuario, id, valores, COLUMNAS_USUARIO)
+    except IntegrityError:
+        db.session.rollback()
+        return {'msg': 'El email ya está registrado'}, 400
+    if fila is None:
+        fila = leer_fila(Usuario, id, COLUMNAS_USUARIO)
+        if fila is None:
+            return {'msg': 'Usuario no encontrado'}, 404
+        return fila._asdict(), 200
+    if 'nombre' in valores:
+        eventos.registrar(db.session, [evento('usuarios', 'actualizar', id, {'nombre': fila.nombre})])
+    if 'email' in valores:
+        credenciales.registrar(db.session, [valores['email_normalizado']], bajas=1)
+    db.session.commit()
+    return fila._asdict(), 200
+
 def eliminar_usuario(id):
     usuario = Usuario.query.get(id)
     if not usuario:
@@ -52,20 +227,225 @@ def eliminar_usuario(id):
     return {'msg': 'Usuario eliminado'}, 200
 
 # ------------------------- PRODUCTOS -------------------------
-def obtener_productos():
-    productos = Producto.query.all()
-    return [p.to_dict() for p in productos], 200
+CAMPOS_PRODUCTO = ('id', 'nombre', 'precio', 'cantidad', 'version', 'categoria_id', 'categoria')
+ORDEN_PRODUCTO = {
+    'id': Producto.id,
+    'nombre': Producto.nombre,
+    'precio': Producto.precio,
+    'cantidad': Producto.cantidad
+}
+
+CAMPOS_LISTADO_PRODUCTO = ('id', 'nombre', 'precio', 'cantidad', 'version', 'categoria')
+CAMPOS_CATEGORIA = ('id', 'nombre', 'descripcion')
+COLUMNAS_CATEGORIA_PRODUCTO = [getattr(Categoria, c).label('categoria__' + c) for c in CAMPOS_CATEGORIA]
+
+# El listado selecciona solo las columnas pedidas (más id y la de orden) y la
+# categoría en la misma fila (LEFT JOIN); no se crean instancias de Producto.
+# seleccionar construye la consulta: db.session.query, o select en modo asíncrono.
+def consulta_productos(fields=None, columnas_extra=(), seleccionar=None):
+    campos = CAMPOS_LISTADO_PRODUCTO if fields is None else fields
+    planos = [c for c in campos if c != 'categoria']
+    columnas = planos + [c for c in dict.fromkeys(['id', *columnas_extra]) if c not in planos]
+    query = (seleccionar or db.session.query)(
+        *[getattr(Producto, c) for c in columnas],
+        *(COLUMNAS_CATEGORIA_PRODUCTO if 'categoria' in campos else [])
+    ).select_from(Producto)
+    if 'categoria' not in campos:
+        return query, serializador_producto(planos)
+    query = query.outerjoin(Categoria, Producto.categoria_id == Categoria.id)
+    return query, serializador_producto(planos, len(columnas))
+
+def serializador_producto(planos, categoria=None):
+    # Mismo dict que Producto.to_dict(fields); categoria es la posición de las
+    # columnas de la categoría dentro de la fila
+    if categoria is None:
+        return lambda fila: dict(zip(planos, fila))
+    fin = categoria + len(CAMPOS_CATEGORIA)
+    def serializar(fila):
+        datos = dict(zip(planos, fila))
+        datos['categoria'] = dict(zip(CAMPOS_CATEGORIA, fila[categoria:fin])) \
+            if fila[categoria] is not None else None
+        return datos
+    return serializar
+
+def cargar_producto(id):
+    return db.session.get(
+        Producto, id,
+        options=[joinedload(Producto.categoria)],
+        populate_existing=True
+    )
+
+def filtrar_productos(query, categoria_id=None, precio_min=None, precio_max=None,
+                      cantidad_min=None, q=None):
+    if categoria_id is not None:
+        query = query.filter(Producto.categoria_id == categoria_id)
+    if precio_min is not None:
+        query = query.filter(Producto.precio >= precio_min)
+    if precio_max is not None:
+        query = query.filter(Producto.precio <= precio_max)
+    if cantidad_min is not None:
+        query = query.filter(Producto.cantidad >= cantidad_min)
+    if q:
+        # Prefijo (LIKE 'q%') para que pueda usarse el índice sobre nombre
+        query = query.filter(Producto.nombre.startswith(q, autoescape=True))
+    return query
+
+FILTROS_NUMERICOS_PRODUCTO = (
+    ('categoria_id', int), ('precio_min', float), ('precio_max', float), ('cantidad_min', int)
+)
+
+def leer_filtros_productos(parametros):
+    # Filtros de los listados desde la query string (request.args o, en ASGI,
+    # query_params). Un número mal escrito lanza ValueError (400), como un
+    # orden o unos campos no válidos, en lugar de ignorarse en silencio.
+    filtros = {'q': parametros.get('q')}
+    for nombre, tipo in FILTROS_NUMERICOS_PRODUCTO:
+        valor = parametros.get(nombre)
+        if valor is None or valor == '':
+            filtros[nombre] = None
+            continue
+        try:
+            filtros[nombre] = tipo(valor)
+        except ValueError:
+            raise ValueError('Filtro no válido: %s' % nombre)
+        if not math.isfinite(filtros[nombre]):
+            raise ValueError('Filtro no válido: %s' % nombre)
+    return filtros
+
+def campos_pedidos(fields):
+    # "id,nombre" -> ['id', 'nombre'], o ValueError; None: todos los campos
+    if fields is None:
+        return None
+    fields = [f.strip() for f in fields.split(',') if f.strip()]
+    if not fields or any(f not in CAMPOS_PRODUCTO for f in fields):
+        raise ValueError('Campos no válidos')
+    return fields
+
+def preparar_listado_productos(sort=None, fields=None, seleccionar=None, **filtros):
+    # Devuelve (query, columna de orden, descendente, serializador) o lanza ValueError
+    descendente = bool(sort) and sort.startswith('-')
+    ordenar_por = ORDEN_PRODUCTO.get((sort or 'id').lstrip('-'))
+    if ordenar_por is None:
+        raise ValueError('Orden no válido')
+    query, serializar = consulta_productos(campos_pedidos(fields), [ordenar_por.key], seleccionar)
+    return filtrar_productos(query, **filtros), ordenar_por, descendente, serializar
+
+@cache.cached('productos')
+def obtener_productos(limit=None, after=None, sort=None, fields=None, **filtros):
+    try:
+        query, ordenar_por, descendente, serializar = preparar_listado_productos(sort, fields, **filtros)
+    except ValueError as e:
+        return {'msg': str(e)}, 400
+    if limit is None and after is None:
+        productos = ordenar(query, columnas_de_orden(Producto.id, ordenar_por), descendente).all()
+        return [serializar(p) for p in productos], 200
+    try:
+        return paginar(query, Producto.id, limit, after, serializar, ordenar_por, descendente), 200
+    except CursorInvalido:
+        return {'msg': 'Cursor inválido'}, 400
+
+def stream_productos(sort=None, fields=None, **filtros):
+    try:
+        query, ordenar_por, descendente, serializar = preparar_listado_productos(sort, fields, **filtros)
+    except ValueError as e:
+        return {'msg': str(e)}, 400
+    return serializar_en_streaming(query, Producto.id, serializar=serializar,
+                                   ordenar_por=ordenar_por, descendente=descendente), 200
+
+# Búsqueda por nombre ordenada por relevancia (utils.busqueda). El orden no es
+# una columna, así que el cursor guarda la posición en los resultados.
+@cache.cached('productos')
+def buscar_productos(q=None, limit=None, after=None, fields=None):
+    if not q or not q.strip():
+        return {'msg': 'Falta el texto a buscar (q)'}, 400
+    try:
+        fields = campos_pedidos(fields)
+    except ValueError as e:
+        return {'msg': str(e)}, 400
+    try:
+        offset = decodificar_cursor(after) if after else 0
+    except CursorInvalido:
+        offset = None
+    if isinstance(offset, bool) or not isinstance(offset, int) or offset < 0:
+        return {'msg': 'Cursor inválido'}, 400
+    limit = normalizar_limite(limit)
+    total, ids = buscador.buscar(db.session, q, limit + 1, offset)
+    siguiente = codificar_cursor(offset + limit) if len(ids) > limit else None
+    ids = ids[:limit]
+    query, serializar = consulta_productos(fields)
+    filas = {fila.id: fila for fila in query.filter(Producto.id.in_(ids))} if ids else {}
+    # Un id del índice puede no existir ya (borrado desde otro proceso)
+    return {
+        'items': [serializar(filas[id]) for id in ids if id in filas],
+        'total': total,
+        'next_cursor': siguiente
+    }, 200
+
+# Exportación del catálogo completo (utils.exportacion): columnas sueltas con el
+# nombre de la categoría en la misma fila, leídas por lotes de un cursor de
+# servidor. La cabecera del CSV es válida para POST /jobs/import-productos.
+COLUMNAS_EXPORTACION = (
+    ('id', Producto.id, int),
+    ('nombre', Producto.nombre, str),
+    ('precio', Producto.precio, float),
+    ('cantidad', Producto.cantidad, int),
+    ('version', Producto.version, int),
+    ('categoria_id', Producto.categoria_id, int),
+    ('categoria', Categoria.nombre, str)
+)
+
+def lotes_exportacion(consulta):
+    # Se ejecuta al empezar a enviar la respuesta; si el cliente corta, el
+    # cursor se cierra al cerrar el generador
+    resultado = db.session.execute(consulta, execution_options={'yield_per': exportacion.tamano_lote()})
+    try:
+        yield from resultado.partitions()
+    finally:
+        resultado.close()
+
+def exportar_productos(formato=None, **filtros):
+    formato = formato or 'csv'
+    if formato not in exportacion.formatos_disponibles():
+        return {'msg': 'Formato no válido; disponibles: ' + ', '.join(exportacion.formatos_disponibles())}, 400
+    consulta = filtrar_productos(
+        select(*[columna for _, columna, _ in COLUMNAS_EXPORTACION])
+        .select_from(Producto)
+        .outerjoin(Categoria, Producto.categoria_id == Categoria.id),
+        **filtros
+    ).order_by(Producto.id)
+    columnas = [(nombre, tipo) for nombre, _, tipo in COLUMNAS_EXPORTACION]
+    return exportacion.exportar(formato, columnas, lotes_exportacion(consulta)), 200
+
+def obtener_producto(id):
+    producto = cargar_producto(id)
+    if not producto:
+        return {'msg': 'Producto no encontrado'}, 404
+    return producto.to_dict(), 200
 
 def crear_producto(nombre, precio, cantidad, categoria_id):
     nuevo_producto = Producto(nombre=nombre, precio=precio, cantidad=cantidad, categoria_id=categoria_id)
     db.session.add(nuevo_producto)
+    db.session.flush()
+    # El id se lee antes del commit, que expira el objeto: leerlo después
+    # costaría un SELECT más antes del de cargar_producto
+    id = nuevo_producto.id
     db.session.commit()
-    return nuevo_producto.to_dict(), 201
+    return cargar_producto(id).to_dict(), 201
 
-def actualizar_producto(id, nombre=None, precio=None, cantidad=None, categoria_id=None):
-    producto = Producto.query.get(id)
+def conflicto_version(id):
+    version = db.session.scalar(select(Producto.version).where(Producto.id == id))
+    if version is None:
+        return {'msg': 'Producto no encontrado'}, 404
+    return {'msg': 'El producto ha cambiado, vuelva a leerlo', 'version': version}, 409
+
+def actualizar_producto(id, nombre=None, precio=None, cantidad=None, categoria_id=None, version=None):
+    # version: la que leyó el cliente; si ya no es la actual se responde 409 en
+    # lugar de sobrescribir los cambios de otro
+    producto = db.session.get(Producto, id)
     if not producto:
         return {'msg': 'Producto no encontrado'}, 404
+    if version is not None and version != producto.version:
+        return conflicto_version(id)
     if nombre:
         producto.nombre = nombre
     if precio is not None:
@@ -74,21 +454,425 @@ def actualizar_producto(id, nombre=None, precio=None, cantidad=None, categoria_i
         producto.cantidad = cantidad
     if categoria_id:
         producto.categoria_id = categoria_id
+    try:
+        db.session.commit()
+    except StaleDataError:
+        db.session.rollback()
+        return conflicto_version(id)
+    return cargar_producto(id).to_dict(), 200
+
+# PATCH devuelve lo mismo que to_dict(): la categoría se lee en el propio
+# RETURNING con subconsultas por clave primaria. Solo con el resumen por
+# categoría activo (STATS_SOURCE=summary), si cambian precio, cantidad o
+# categoría, hacen falta los valores anteriores: se lee antes la fila (que
+# también decide 404, 409 y sin cambios) y el UPDATE exige que la versión siga
+# siendo la leída. Si no, el UPDATE va directamente con la versión del cliente.
+CAMPOS_PATCH_PRODUCTO = ('id', 'nombre', 'precio', 'cantidad', 'version')
+CATEGORIA_PATCH = aliased(Categoria, name='categoria_actual')
+COLUMNAS_PATCH_PRODUCTO = (
+    *[getattr(Producto, c) for c in CAMPOS_PATCH_PRODUCTO],
+    *[
+        select(getattr(CATEGORIA_PATCH, c)).where(CATEGORIA_PATCH.id == Producto.categoria_id)
+        .scalar_subquery().label('categoria__' + c)
+        for c in CAMPOS_CATEGORIA
+    ],
+    Producto.categoria_id
+)
+serializar_patch_producto = serializador_producto(CAMPOS_PATCH_PRODUCTO, len(CAMPOS_PATCH_PRODUCTO))
+
+def actualizar_producto_parcial(id, data):
+    valores, error = valores_parciales(data, CAMPOS_ESCRITURA_PRODUCTO)
+    if error:
+        return {'msg': error}, 400
+    version = data.get('version')
+    if version is not None and not es_entero(version):
+        return {'msg': 'Valor no válido para version'}, 400
+    condiciones = [] if version is None else [Producto.version == version]
+    actual = None
+    if resumen.activo and (not valores or valores.keys() & {'precio', 'cantidad', 'categoria_id'}):
+        actual = db.session.execute(select(*COLUMNAS_PATCH_PRODUCTO).where(Producto.id == id)).first()
+        if actual is None:
+            return {'msg': 'Producto no encontrado'}, 404
+        if version is not None and version != actual.version:
+            return {'msg': 'El producto ha cambiado, vuelva a leerlo', 'version': actual.version}, 409
+        if all(getattr(actual, c) == v for c, v in valores.items()):
+            return serializar_patch_producto(actual), 200
+        condiciones = [Producto.version == actual.version]
+    try:
+        fila = actualizar_fila(Producto, id, valores, COLUMNAS_PATCH_PRODUCTO, condiciones,
+                               {'version': Producto.version + 1})
+    except IntegrityError:
+        db.session.rollback()
+        return {'msg': 'Categoría no encontrada'}, 400
+    if fila is None:
+        fila = leer_fila(Producto, id, COLUMNAS_PATCH_PRODUCTO)
+        if fila is None:
+            return {'msg': 'Producto no encontrado'}, 404
+        # Sin escribir: otra escritura se adelantó a la versión esperada, o el
+        # cuerpo no cambiaba nada
+        esperada = version if actual is None else actual.version
+        if esperada is not None and fila.version != esperada:
+            return {'msg': 'El producto ha cambiado, vuelva a leerlo', 'version': fila.version}, 409
+        return serializar_patch_producto(fila), 200
+    if 'categoria_id' in valores and fila.categoria__id is None:
+        db.session.rollback()
+        return {'msg': 'Categoría no encontrada'}, 400
+    if actual is not None:
+        resumen.registrar_filas(db.session, [(actual.categoria_id, actual.precio, actual.cantidad)],
+                                [(fila.categoria_id, fila.precio, fila.cantidad)])
+    if 'nombre' in valores:
+        buscador.registrar(db.session, {id: fila.nombre})
+    eventos.registrar(db.session, [evento('productos', 'actualizar', id, dict(valores, version=fila.version))])
     db.session.commit()
-    return producto.to_dict(), 200
+    return serializar_patch_producto(fila), 200
 
-def eliminar_producto(id):
-    producto = Producto.query.get(id)
+def leer_version(valor):
+    # ?version= de DELETE (no lleva cuerpo): None si no viene, ValueError si
+    # no es un entero
+    if valor is None or valor == '':
+        return None
+    try:
+        return int(valor)
+    except ValueError:
+        raise ValueError('Valor no válido para version')
+
+def eliminar_producto(id, version=None):
+    # version: como en PUT, 409 si el producto ha cambiado desde que se leyó
+    producto = db.session.get(Producto, id)
     if not producto:
         return {'msg': 'Producto no encontrado'}, 404
+    if version is not None and version != producto.version:
+        return conflicto_version(id)
     db.session.delete(producto)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except StaleDataError:
+        db.session.rollback()
+        return conflicto_version(id)
     return {'msg': 'Producto eliminado'}, 200
 
+# ------------------------- PRODUCTOS (OPERACIONES MASIVAS) -------------------------
+# Todas las operaciones masivas escriben en una sola transacción, por lotes de
+# BULK_BATCH_SIZE filas con executemany. Cada lote va en un SAVEPOINT: si falla,
+# se reintenta elemento a elemento para que solo se rechacen los que fallan.
+CAMPOS_ESCRITURA_PRODUCTO = {
+    'nombre': (str,),
+    'precio': (int, float),
+    'cantidad': (int,),
+    'categoria_id': (int,)
+}
+
+def tamano_lote():
+    return current_app.config.get('BULK_BATCH_SIZE', 1000)
+
+def en_lotes(elementos, tamano):
+    for i in range(0, len(elementos), tamano):
+        yield elementos[i:i + tamano]
+
+def validar_producto(item, parcial=False):
+    if not isinstance(item, dict):
+        return 'Elemento no válido'
+    for campo, tipos in CAMPOS_ESCRITURA_PRODUCTO.items():
+        if item.get(campo) is None:
+            if not parcial:
+                return 'Falta el campo %s' % campo
+            continue
+        if isinstance(item[campo], bool) or not isinstance(item[campo], tipos):
+            return 'Valor no válido para %s' % campo
+    return None
+
+def resultado_error(indice, status, msg):
+    return {'indice': indice, 'status': status, 'msg': msg}
+
+def ids_existentes(columna, ids):
+    ids = set(ids)
+    if not ids:
+        return set()
+    return set(db.session.scalars(select(columna).where(columna.in_(ids))))
+
+# Las sentencias masivas no pasan por los objetos de la sesión: cada operación
+# anota en el resumen por categoría las filas que añade, cambia o quita, y los
+# eventos del feed de cambios
+def filas_actuales(ids):
+    # id -> (categoria_id, precio, cantidad, version)
+    return {
+        fila.id: tuple(fila[1:])
+        for fila in db.session.execute(
+            select(Producto.id, Producto.categoria_id, Producto.precio, Producto.cantidad, Producto.version)
+            .where(Producto.id.in_(ids))
+        )
+    }
+
+def insertar_lote_productos(mappings):
+    if len(mappings) == 1:
+        ids = [db.session.execute(insert(Producto.__table__), mappings[0]).inserted_primary_key[0]]
+    elif db.session.get_bind().dialect.insert_executemany_returning:
+        ids = list(db.session.scalars(
+            insert(Producto).returning(Producto.id, sort_by_parameter_order=True), mappings
+        ))
+    else:
+        # Sin RETURNING (MySQL) el INSERT multi-fila no informa de los ids generados
+        db.session.execute(insert(Producto), mappings)
+        ids = [None] * len(mappings)
+    resumen.registrar_filas(
+        db.session, despues=[(m['categoria_id'], m['precio'], m['cantidad']) for m in mappings]
+    )
+    # Sin RETURNING el evento sale con id null
+    eventos.registrar(db.session, [
+        evento('productos', 'crear', id_, dict(m, version=1)) for m, id_ in zip(mappings, ids)
+    ])
+    return ids
+
+def actualizar_lote_productos(mappings):
+    antes = filas_actuales([m['id'] for m in mappings])
+    # Con version_id_col el UPDATE por clave primaria necesita la versión
+    # esperada de cada fila: la que envía el cliente o la recién leída
+    mappings = [{'version': antes.get(m['id'], (None,) * 4)[3], **m} for m in mappings]
+    db.session.execute(update(Producto), mappings)
+    resumen.registrar_filas(db.session, [antes[m['id']][:3] for m in mappings], [
+        (m.get('categoria_id', antes[m['id']][0]), m.get('precio', antes[m['id']][1]),
+         m.get('cantidad', antes[m['id']][2]))
+        for m in mappings
+    ])
+    eventos.registrar(db.session, [
+        evento('productos', 'actualizar', m['id'],
+               {c: v for c, v in m.items() if c != 'id'} | {'version': m['version'] + 1})
+        for m in mappings
+    ])
+    return [m['id'] for m in mappings]
+
+def eliminar_lote_productos(mappings):
+    ids = [m['id'] for m in mappings]
+    antes = filas_actuales(ids)
+    db.session.execute(
+        delete(Producto).where(Producto.id.in_(ids)),
+        execution_options={'synchronize_session': False}
+    )
+    resumen.registrar_filas(db.session, antes=[fila[:3] for fila in antes.values()])
+    eventos.registrar(db.session, [evento('productos', 'eliminar', id_) for id_ in antes])
+    return ids
+
+def nombres_escritos(mappings, ids):
+    # Cambios para el índice de búsqueda, que no ve las sentencias masivas.
+    # Un id None (INSERT sin RETURNING) fuerza a releer la tabla.
+    return {id_: m['nombre'] for m, id_ in zip(mappings, ids) if 'nombre' in m}
+
+def ids_eliminados(mappings, ids):
+    return dict.fromkeys(ids)
+
+def escribir_por_lotes(pendientes, operacion, status_ok, resultados, cambios_busqueda):
+    for lote in en_lotes(pendientes, tamano_lote()):
+        mappings = [mapping for _, mapping in lote]
+        try:
+            with db.session.begin_nested():
+                ids = operacion(mappings)
+        except SQLAlchemyError:
+            for indice, mapping in lote:
+                try:
+                    with db.session.begin_nested():
+                        id_ = operacion([mapping])[0]
+                except SQLAlchemyError:
+                    resultados.append(resultado_error(indice, 409, 'Error al escribir el producto'))
+                else:
+                    buscador.registrar(db.session, cambios_busqueda([mapping], [id_]))
+                    resultados.append({'indice': indice, 'status': status_ok, 'id': id_})
+        else:
+            buscador.registrar(db.session, cambios_busqueda(mappings, ids))
+            resultados.extend(
+                {'indice': indice, 'status': status_ok, 'id': id_}
+                for (indice, _), id_ in zip(lote, ids)
+            )
+    db.session.commit()
+    resultados.sort(key=lambda r: r['indice'])
+    correctos = sum(1 for r in resultados if r['status'] == status_ok)
+    return {
+        'resultados': resultados,
+        'correctos': correctos,
+        'fallidos': len(resultados) - correctos
+    }, 200
+
+def crear_productos(items):
+    if not isinstance(items, list):
+        return {'msg': 'Se esperaba una lista de productos'}, 400
+    resultados, pendientes = [], []
+    for indice, item in enumerate(items):
+        error = validar_producto(item)
+        if error:
+            resultados.append(resultado_error(indice, 400, error))
+        else:
+            pendientes.append((indice, {c: item[c] for c in CAMPOS_ESCRITURA_PRODUCTO}))
+    categorias = ids_existentes(Categoria.id, [m['categoria_id'] for _, m in pendientes])
+    validos = []
+    for indice, mapping in pendientes:
+        if mapping['categoria_id'] in categorias:
+            validos.append((indice, mapping))
+        else:
+            resultados.append(resultado_error(indice, 400, 'Categoría no encontrada'))
+    return escribir_por_lotes(validos, insertar_lote_productos, 201, resultados, nombres_escritos)
+
+def actualizar_productos(items):
+    if not isinstance(items, list):
+        return {'msg': 'Se esperaba una lista de productos'}, 400
+    resultados, pendientes = [], []
+    for indice, item in enumerate(items):
+        error = validar_producto(item, parcial=True)
+        if not error and (isinstance(item.get('id'), bool) or not isinstance(item.get('id'), int)):
+            error = 'Falta el campo id'
+        if error:
+            resultados.append(resultado_error(indice, 400, error))
+            continue
+        mapping = {c: item[c] for c in CAMPOS_ESCRITURA_PRODUCTO if item.get(c) is not None}
+        mapping['id'] = item['id']
+        if isinstance(item.get('version'), int) and not isinstance(item['version'], bool):
+            mapping['version'] = item['version']
+        pendientes.append((indice, mapping))
+    existentes = ids_existentes(Producto.id, [m['id'] for _, m in pendientes])
+    categorias = ids_existentes(
+        Categoria.id, [m['categoria_id'] for _, m in pendientes if 'categoria_id' in m]
+    )
+    validos = []
+    for indice, mapping in pendientes:
+        if mapping['id'] not in existentes:
+            resultados.append(resultado_error(indice, 404, 'Producto no encontrado'))
+        elif 'categoria_id' in mapping and mapping['categoria_id'] not in categorias:
+            resultados.append(resultado_error(indice, 400, 'Categoría no encontrada'))
+        elif set(mapping) - {'id', 'version'}:
+            validos.append((indice, mapping))
+        else:
+            resultados.append({'indice': indice, 'status': 200, 'id': mapping['id']})
+    return escribir_por_lotes(validos, actualizar_lote_productos, 200, resultados, nombres_escritos)
+
+def eliminar_productos(items):
+    if not isinstance(items, list):
+        return {'msg': 'Se esperaba una lista de ids'}, 400
+    resultados, pendientes, vistos = [], [], set()
+    for indice, item in enumerate(items):
+        id_ = item.get('id') if isinstance(item, dict) else item
+        if isinstance(id_, bool) or not isinstance(id_, int):
+            resultados.append(resultado_error(indice, 400, 'Id no válido'))
+        elif id_ in vistos:
+            # Solo la primera aparición borra la fila: la repetición no se
+            # cuenta como otro producto eliminado
+            resultados.append(resultado_error(indice, 400, 'Id repetido'))
+        else:
+            vistos.add(id_)
+            pendientes.append((indice, {'id': id_}))
+    existentes = ids_existentes(Producto.id, [m['id'] for _, m in pendientes])
+    validos = []
+    for indice, mapping in pendientes:
+        if mapping['id'] in existentes:
+            validos.append((indice, mapping))
+        else:
+            resultados.append(resultado_error(indice, 404, 'Producto no encontrado'))
+    return escribir_por_lotes(validos, eliminar_lote_productos, 200, resultados, ids_eliminados)
+
+# ------------------------- PRODUCTOS (STOCK) -------------------------
+# Ajustes de stock como incrementos, en un solo UPDATE condicional y sin leer
+# antes la fila:
+#   UPDATE productos SET cantidad = cantidad + :delta, version = version + 1
+#   WHERE id = :id AND cantidad + :delta >= 0
+# Dos pedidos concurrentes se serializan en la fila (no se pierde ninguno) y el
+# stock no puede quedar negativo.
+def es_entero(valor):
+    return isinstance(valor, int) and not isinstance(valor, bool)
+
+def aplicar_ajuste(id, delta):
+    # Fila (cantidad, version, categoria_id, precio) tras el ajuste, o None si
+    # el producto no existe o no hay stock suficiente
+    columnas = (Producto.cantidad, Producto.version, Producto.categoria_id, Producto.precio)
+    sentencia = (
+        update(Producto)
+        .where(Producto.id == id, Producto.cantidad + delta >= 0)
+        .values(cantidad=Producto.cantidad + delta, version=Producto.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    if db.session.get_bind().dialect.update_returning:
+        fila = db.session.execute(sentencia.returning(*columnas)).first()
+    elif db.session.execute(sentencia).rowcount:
+        # Sin RETURNING (MySQL): la fila ya está bloqueada por el UPDATE
+        fila = db.session.execute(select(*columnas).where(Producto.id == id)).first()
+    else:
+        fila = None
+    if fila is not None:
+        resumen.registrar_filas(
+            db.session,
+            [(fila.categoria_id, fila.precio, fila.cantidad - delta)],
+            [(fila.categoria_id, fila.precio, fila.cantidad)]
+        )
+        eventos.registrar(db.session, [
+            evento('productos', 'actualizar', id, {'cantidad': fila.cantidad, 'version': fila.version})
+        ])
+    return fila
+
+def error_ajuste(id, cantidad):
+    if cantidad is None:
+        return {'id': id, 'status': 404, 'msg': 'Producto no encontrado'}
+    return {'id': id, 'status': 409, 'msg': 'Stock insuficiente', 'cantidad': cantidad}
+
+def ajustar_stock(id, delta):
+    if not es_entero(delta) or delta == 0:
+        return {'msg': 'Valor no válido para delta'}, 400
+    fila = aplicar_ajuste(id, delta)
+    if fila is None:
+        db.session.rollback()
+        error = error_ajuste(id, db.session.scalar(select(Producto.cantidad).where(Producto.id == id)))
+        return {'msg': error['msg'], 'cantidad': error.get('cantidad')}, error['status']
+    db.session.commit()
+    return {'id': id, 'cantidad': fila.cantidad, 'version': fila.version}, 200
+
+def ajustar_stock_lote(items):
+    # Todas las líneas de un pedido o ninguna: si alguna falla se deshace el resto
+    if not isinstance(items, list) or not items:
+        return {'msg': 'Se esperaba una lista de ajustes'}, 400
+    deltas = {}
+    for indice, item in enumerate(items):
+        id_ = item.get('id') if isinstance(item, dict) else None
+        delta = item.get('delta') if isinstance(item, dict) else None
+        if not es_entero(id_) or not es_entero(delta):
+            return {'msg': 'Ajuste no válido', 'indice': indice}, 400
+        deltas[id_] = deltas.get(id_, 0) + delta
+    # Siempre en orden de id, para que dos pedidos concurrentes bloqueen las
+    # filas en el mismo orden y no se interbloqueen
+    aplicados, fallidos = [], []
+    for id_ in sorted(deltas):
+        fila = aplicar_ajuste(id_, deltas[id_])
+        if fila is None:
+            fallidos.append(id_)
+        else:
+            aplicados.append({'id': id_, 'cantidad': fila.cantidad, 'version': fila.version})
+    if fallidos:
+        db.session.rollback()
+        actuales = dict(db.session.execute(
+            select(Producto.id, Producto.cantidad).where(Producto.id.in_(fallidos))
+        ).all())
+        return {
+            'msg': 'No se ha aplicado ningún ajuste',
+            'errores': [error_ajuste(id_, actuales.get(id_)) for id_ in fallidos]
+        }, 409
+    db.session.commit()
+    return {'productos': aplicados}, 200
+
 # ------------------------- CATEGORÍAS -------------------------
-def obtener_categorias():
-    categorias = Categoria.query.all()
-    return [c.to_dict() for c in categorias], 200
+COLUMNAS_CATEGORIA = (Categoria.id, Categoria.nombre, Categoria.descripcion)
+
+@cache.cached('categorias')
+def obtener_categorias(limit=None, after=None):
+    query = db.session.query(*COLUMNAS_CATEGORIA)
+    if limit is None and after is None:
+        return [fila._asdict() for fila in query.order_by(Categoria.id).all()], 200
+    try:
+        return paginar(query, Categoria.id, limit, after), 200
+    except CursorInvalido:
+        return {'msg': 'Cursor inválido'}, 400
+
+def stream_categorias():
+    return serializar_en_streaming(db.session.query(*COLUMNAS_CATEGORIA), Categoria.id), 200
+
+def obtener_categoria(id):
+    categoria = db.session.get(Categoria, id)
+    if not categoria:
+        return {'msg': 'Categoría no encontrada'}, 404
+    return categoria.to_dict(), 200
 
 def crear_categoria(nombre):
     nueva_categoria = Categoria(nombre=nombre)
@@ -105,6 +889,26 @@ def actualizar_categoria(id, nombre=None):
     db.session.commit()
     return categoria.to_dict(), 200
 
+CAMPOS_ESCRITURA_CATEGORIA = {'nombre': (str,), 'descripcion': (str,)}
+
+def actualizar_categoria_parcial(id, data):
+    valores, error = valores_parciales(data, CAMPOS_ESCRITURA_CATEGORIA)
+    if error:
+        return {'msg': error}, 400
+    try:
+        fila = actualizar_fila(Categoria, id, valores, COLUMNAS_CATEGORIA)
+    except IntegrityError:
+        db.session.rollback()
+        return {'msg': 'Ya existe una categoría con ese nombre'}, 400
+    if fila is None:
+        fila = leer_fila(Categoria, id, COLUMNAS_CATEGORIA)
+        if fila is None:
+            return {'msg': 'Categoría no encontrada'}, 404
+        return fila._asdict(), 200
+    eventos.registrar(db.session, [evento('categorias', 'actualizar', id, valores)])
+    db.session.commit()
+    return fila._asdict(), 200
+
 def eliminar_categoria(id):
     categoria = Categoria.query.get(id)
     if not categoria:
@@ -112,3 +916,158 @@ def eliminar_categoria(id):
     db.session.delete(categoria)
     db.session.commit()
     return {'msg': 'Categoría eliminada'}, 200
+
+# ------------------------- ESTADÍSTICAS -------------------------
+# Inventario por categoría: con STATS_SOURCE = 'summary' se lee la tabla de
+# resumen (una fila por categoría); con 'query', un GROUP BY sobre productos.
+# Las categorías sin productos aparecen con ceros.
+def consulta_estadisticas():
+    if current_app.config.get('STATS_SOURCE') == 'summary':
+        r = ResumenCategoria
+        return select(
+            Categoria.id.label('categoria_id'),
+            Categoria.nombre,
+            func.coalesce(r.productos, 0).label('productos'),
+            func.coalesce(r.unidades, 0).label('unidades'),
+            func.coalesce(r.valor_stock, 0).label('valor_stock'),
+            r.precio_min,
+            (r.suma_precios / func.nullif(r.productos, 0)).label('precio_medio'),
+            r.precio_max
+        ).outerjoin(r, r.categoria_id == Categoria.id)
+    return select(
+        Categoria.id.label('categoria_id'),
+        Categoria.nombre,
+        func.count(Producto.id).label('productos'),
+        func.coalesce(func.sum(Producto.cantidad), 0).label('unidades'),
+        func.coalesce(func.sum(Producto.precio * Producto.cantidad), 0).label('valor_stock'),
+        func.min(Producto.precio).label('precio_min'),
+        func.avg(Producto.precio).label('precio_medio'),
+        func.max(Producto.precio).label('precio_max')
+    ).outerjoin(Producto, Producto.categoria_id == Categoria.id).group_by(Categoria.id, Categoria.nombre)
+
+def redondear(datos):
+    # Sumas de float: el resumen incremental y el GROUP BY pueden diferir en el último decimal
+    for campo in ('valor_stock', 'precio_medio'):
+        if datos[campo] is not None:
+            datos[campo] = round(float(datos[campo]), 2)
+    return datos
+
+@cache.cached('productos')
+def estadisticas_categoria(id):
+    fila = db.session.execute(consulta_estadisticas().where(Categoria.id == id)).first()
+    if fila is None:
+        return {'msg': 'Categoría no encontrada'}, 404
+    return redondear(fila._asdict()), 200
+
+@cache.cached('productos')
+def estadisticas_inventario():
+    categorias = [fila._asdict() for fila in db.session.execute(consulta_estadisticas().order_by(Categoria.id))]
+    productos = sum(c['productos'] for c in categorias)
+    total = {
+        'productos': productos,
+        'unidades': sum(c['unidades'] for c in categorias),
+        'valor_stock': sum(c['valor_stock'] for c in categorias),
+        'precio_min': min((c['precio_min'] for c in categorias if c['precio_min'] is not None), default=None),
+        'precio_medio': sum(c['precio_medio'] * c['productos'] for c in categorias if c['productos'])
+                        / productos if productos else None,
+        'precio_max': max((c['precio_max'] for c in categorias if c['precio_max'] is not None), default=None)
+    }
+    return {'categorias': [redondear(c) for c in categorias], 'total': redondear(total)}, 200
+
+def reconstruir_resumen():
+    categorias = recalcular(db.session, ResumenCategoria, Producto)
+    db.session.commit()
+    return categorias
+
+# ------------------------- TRABAJOS -------------------------
+# Importación de productos desde un CSV con cabecera: nombre, precio, cantidad
+# y categoria_id o categoria (el nombre de una categoría existente). Se ejecuta
+# en un trabajador (utils.trabajos), por lotes de BULK_BATCH_SIZE filas que se
+# escriben y confirman como POST /productos/bulk. Cada error lleva la línea del CSV.
+COLUMNAS_IMPORTACION = (('nombre', str), ('precio', float), ('cantidad', int))
+
+def abrir_csv(archivo):
+    return open(archivo, newline='', encoding='utf-8-sig')
+
+def columnas_que_faltan(archivo):
+    with abrir_csv(archivo) as f:
+        cabecera = next(csv.reader(f), [])
+    faltan = [c for c, _ in COLUMNAS_IMPORTACION if c not in cabecera]
+    if 'categoria_id' not in cabecera and 'categoria' not in cabecera:
+        faltan.append('categoria_id')
+    return faltan
+
+def encolar_importacion(archivo, nombre=None):
+    # archivo: el CSV ya guardado en JOBS_DIR; se borra al terminar el trabajo
+    try:
+        faltan = columnas_que_faltan(archivo)
+    except UnicodeDecodeError:
+        faltan = None
+    if faltan is None or faltan:
+        os.remove(archivo)
+        return {'msg': 'El CSV no es válido' if faltan is None else 'Faltan columnas: ' + ', '.join(faltan)}, 400
+    trabajo = trabajos.encolar('import-productos', {'archivo': archivo, 'nombre': nombre},
+                               int(auth.identidad()))
+    return trabajo.to_dict(), 202
+
+def obtener_trabajo(id):
+    # Solo lo ve quien lo encoló; para los demás no existe (404, no 403)
+    trabajo = db.session.get(Trabajo, id)
+    if not trabajo or trabajo.usuario_id != int(auth.identidad()):
+        return {'msg': 'Trabajo no encontrado'}, 404
+    return trabajo.to_dict(), 200
+
+def fila_importacion(fila, categorias):
+    # Fila del CSV -> (elemento para crear_productos, error)
+    item = {}
+    for campo, tipo in COLUMNAS_IMPORTACION:
+        valor = (fila.get(campo) or '').strip()
+        if not valor:
+            return None, 'Falta el campo %s' % campo
+        try:
+            item[campo] = tipo(valor)
+        except ValueError:
+            return None, 'Valor no válido para %s' % campo
+        # float() acepta nan e inf
+        if tipo is float and not math.isfinite(item[campo]):
+            return None, 'Valor no válido para %s' % campo
+    if (fila.get('categoria_id') or '').strip():
+        try:
+            item['categoria_id'] = int(fila['categoria_id'])
+        except ValueError:
+            return None, 'Valor no válido para categoria_id'
+    elif (fila.get('categoria') or '').strip() in categorias:
+        item['categoria_id'] = categorias[fila['categoria'].strip()]
+    else:
+        return None, 'Categoría no encontrada'
+    return item, None
+
+@trabajos.tarea('import-productos', tablas=('productos',))
+def importar_productos(parametros, progreso):
+    archivo = parametros['archivo']
+    try:
+        with abrir_csv(archivo) as f:
+            progreso.iniciar(max(sum(1 for _ in csv.reader(f)) - 1, 0))
+        categorias = dict(db.session.execute(select(Categoria.nombre, Categoria.id)).all())
+        db.session.rollback()
+        with abrir_csv(archivo) as f:
+            # Las líneas de datos empiezan en la 2 (la 1 es la cabecera)
+            filas = enumerate(csv.DictReader(f), 2)
+            while lote := list(islice(filas, tamano_lote())):
+                items, lineas, errores = [], [], []
+                for linea, fila in lote:
+                    item, error = fila_importacion(fila, categorias)
+                    if error:
+                        errores.append({'linea': linea, 'status': 400, 'msg': error})
+                    else:
+                        items.append(item)
+                        lineas.append(linea)
+                respuesta, _ = crear_productos(items)
+                errores.extend(
+                    {'linea': lineas[r['indice']], 'status': r['status'], 'msg': r['msg']}
+                    for r in respuesta['resultados'] if r['status'] != 201
+                )
+                errores.sort(key=lambda e: e['linea'])
+                progreso.avanzar(len(lote), respuesta['correctos'], errores)
+    finally:
+        os.remove(archivo)
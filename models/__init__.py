@@ -1 +1 @@
-from .models import Usuario, Categoria, Producto
+from .models import Usuario, Categoria, Producto, ResumenCategoria, Trabajo, VersionTabla
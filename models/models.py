@@ -1,22 +1,45 @@
-from config import db
-from werkzeug.security import generate_password_hash, check_password_hash
+from config import adb, buscador, credenciales, db, eventos, hasher, replicas, resumen, trabajos
+from sqlalchemy import event
+from sqlalchemy.dialects import mysql
+from sqlalchemy.orm import validates
+from utils.credenciales import normalizar_email
+from utils.versiones import ahora, sembrar_versiones, versionar_en_commit
+
+# Marca de tiempo con microsegundos (MySQL solo guarda segundos por defecto),
+# usada para los ETag / Last-Modified
+FechaHora = db.DateTime().with_variant(mysql.DATETIME(fsp=6), 'mysql')
 
 # Modelo de Usuario
 class Usuario(db.Model):
     __tablename__ = 'usuarios'
+    # Login y registro buscan por el email normalizado (utils.credenciales)
+    __table_args__ = (db.Index('ix_usuarios_email_normalizado', 'email_normalizado', unique=True),)
     
     id = db.Column(db.Integer, primary_key=True)
     nombre = db.Column(db.String(50), nullable=False)
     email = db.Column(db.String(50), unique=True, nullable=False)
+    email_normalizado = db.Column(db.String(50), nullable=False)
     password = db.Column(db.String(200), nullable=False)
+    updated_at = db.Column(FechaHora, nullable=False, default=ahora, onupdate=ahora)
 
+    # password es la contraseña en claro: se hashea una sola vez, aquí
     def __init__(self, nombre, email, password):
         self.nombre = nombre
         self.email = email
-        self.password = generate_password_hash(password)
+        self.set_password(password)
+
+    # Cada asignación de email actualiza la clave; los UPDATE con sentencias
+    # (PATCH) la escriben ellos mismos
+    @validates('email')
+    def validar_email(self, clave, email):
+        self.email_normalizado = normalizar_email(email)
+        return email
+
+    def set_password(self, password):
+        self.password = hasher.hashear(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password, password)
+        return hasher.verificar(self.password, password)
 
     def to_dict(self):
         return {
@@ -32,6 +55,7 @@ class Categoria(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     nombre = db.Column(db.String(50), unique=True, nullable=False)
     descripcion = db.Column(db.String(255))
+    updated_at = db.Column(FechaHora, nullable=False, default=ahora, onupdate=ahora)
 
     def __init__(self, nombre, descripcion=None):
         self.nombre = nombre
@@ -47,13 +71,29 @@ class Categoria(db.Model):
 # Modelo de Producto
 class Producto(db.Model):
     __tablename__ = 'productos'
+    # Índices para los filtros y ordenaciones de GET /productos
+    __table_args__ = (
+        db.Index('ix_productos_categoria_precio', 'categoria_id', 'precio'),
+        db.Index('ix_productos_nombre', 'nombre'),
+        db.Index('ix_productos_precio', 'precio'),
+        db.Index('ix_productos_cantidad', 'cantidad'),
+        # Filas modificadas recientemente, para poner al día el índice de búsqueda en memoria
+        db.Index('ix_productos_updated_at', 'updated_at'),
+        # GET /productos/search en MySQL; en el resto, índice en memoria (utils.busqueda)
+        db.Index('ft_productos_nombre', 'nombre', mysql_prefix='FULLTEXT').ddl_if(dialect='mysql'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     nombre = db.Column(db.String(100), nullable=False)
     precio = db.Column(db.Float, nullable=False)
     cantidad = db.Column(db.Integer, nullable=False)
     categoria_id = db.Column(db.Integer, db.ForeignKey('categorias.id'), nullable=False)
+    updated_at = db.Column(FechaHora, nullable=False, default=ahora, onupdate=ahora)
+    # Bloqueo optimista: cada UPDATE del ORM añade WHERE version = :leída y la
+    # incrementa; si otra escritura se adelantó, el commit lanza StaleDataError
+    version = db.Column(db.Integer, nullable=False, server_default='1')
     categoria = db.relationship('Categoria', backref=db.backref('productos', lazy=True))
+    __mapper_args__ = {'version_id_col': version}
 
     def __init__(self, nombre, precio, cantidad, categoria_id):
         self.nombre = nombre
@@ -61,11 +101,117 @@ class Producto(db.Model):
         self.cantidad = cantidad
         self.categoria_id = categoria_id
 
-    def to_dict(self):
+    def to_dict(self, fields=None):
+        if fields is not None:
+            return {campo: self._valor(campo) for campo in fields}
         return {
             "id": self.id,
             "nombre": self.nombre,
             "precio": self.precio,
             "cantidad": self.cantidad,
+            "version": self.version,
             "categoria": self.categoria.to_dict() if self.categoria else None
         }
+
+    def _valor(self, campo):
+        if campo == "categoria":
+            return self.categoria.to_dict() if self.categoria else None
+        return getattr(self, campo)
+
+
+# Resumen del inventario por categoría (GET /stats/inventario), mantenido en la
+# misma transacción que cada escritura de productos (utils.resumen)
+class ResumenCategoria(db.Model):
+    __tablename__ = 'resumen_categorias'
+
+    categoria_id = db.Column(db.Integer, db.ForeignKey('categorias.id', ondelete='CASCADE'), primary_key=True)
+    productos = db.Column(db.Integer, nullable=False, default=0)
+    unidades = db.Column(db.BigInteger, nullable=False, default=0)
+    valor_stock = db.Column(db.Float, nullable=False, default=0)
+    suma_precios = db.Column(db.Float, nullable=False, default=0)
+    precio_min = db.Column(db.Float)
+    precio_max = db.Column(db.Float)
+    updated_at = db.Column(FechaHora, nullable=False, default=ahora, onupdate=ahora)
+
+
+# Versión por tabla: se incrementa en cada commit que escribe en la tabla y
+# permite calcular el ETag de los listados sin leer sus filas
+class VersionTabla(db.Model):
+    __tablename__ = 'versiones_tabla'
+
+    tabla = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(FechaHora, nullable=False, default=ahora)
+
+
+# Trabajos en segundo plano (utils.trabajos): cada fila es un elemento de la
+# cola y guarda el estado y el progreso que consulta GET /jobs/<id>
+class Trabajo(db.Model):
+    __tablename__ = 'trabajos'
+    # Los trabajadores buscan el pendiente más antiguo
+    __table_args__ = (db.Index('ix_trabajos_estado_id', 'estado', 'id'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(50), nullable=False)
+    estado = db.Column(db.String(20), nullable=False, default='pendiente')
+    parametros = db.Column(db.JSON)
+    usuario_id = db.Column(db.Integer)
+    total = db.Column(db.Integer)
+    procesados = db.Column(db.Integer, nullable=False, default=0)
+    correctos = db.Column(db.Integer, nullable=False, default=0)
+    fallidos = db.Column(db.Integer, nullable=False, default=0)
+    errores = db.Column(db.JSON)
+    resultado = db.Column(db.JSON)
+    mensaje = db.Column(db.String(500))
+    created_at = db.Column(FechaHora, nullable=False, default=ahora)
+    started_at = db.Column(FechaHora)
+    # Concesión del trabajador que lo ejecuta: la renueva con cada lote
+    reclamado_en = db.Column(FechaHora)
+    finished_at = db.Column(FechaHora)
+    updated_at = db.Column(FechaHora, nullable=False, default=ahora, onupdate=ahora)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "tipo": self.tipo,
+            "estado": self.estado,
+            "total": self.total,
+            "procesados": self.procesados,
+            "correctos": self.correctos,
+            "fallidos": self.fallidos,
+            "progreso": round(self.procesados / self.total, 4) if self.total else None,
+            "errores": self.errores or [],
+            "resultado": self.resultado,
+            "mensaje": self.mensaje,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+TABLAS_VERSIONADAS = ['usuarios', 'categorias', 'productos']
+event.listen(
+    VersionTabla.__table__, 'after_create',
+    lambda tabla, conexion, **kw: sembrar_versiones(conexion, VersionTabla, TABLAS_VERSIONADAS)
+)
+buscador.seguir(db.session, Producto, 'nombre', VersionTabla)
+buscador.seguir(adb.clase_sesion, Producto, 'nombre', VersionTabla)
+replicas.seguir(db.session, VersionTabla)
+credenciales.seguir(db.session, Usuario)
+credenciales.seguir(adb.clase_sesion, Usuario)
+resumen.seguir(db.session, ResumenCategoria, Producto, Categoria)
+resumen.seguir(adb.clase_sesion, ResumenCategoria, Producto, Categoria)
+# El último hook before_commit: la versión se incrementa justo antes del COMMIT
+versionar_en_commit(db.session, VersionTabla, TABLAS_VERSIONADAS)
+versionar_en_commit(adb.clase_sesion, VersionTabla, TABLAS_VERSIONADAS)
+
+# Columnas cuyo valor viaja en los eventos del feed de cambios (de usuarios,
+# solo el nombre: nunca email ni password)
+CAMPOS_EVENTOS = {
+    Producto: ('nombre', 'precio', 'cantidad', 'categoria_id', 'version'),
+    Categoria: ('nombre', 'descripcion'),
+    Usuario: ('nombre',)
+}
+eventos.seguir(db.session, CAMPOS_EVENTOS)
+eventos.seguir(adb.clase_sesion, CAMPOS_EVENTOS)
+trabajos.seguir(db.session, Trabajo)
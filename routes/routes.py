@@ -1,9 +1,226 @@
-from flask import Blueprint, request, jsonify
-from flasgger import swag_from
+import json
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from sqlalchemy.exc import TimeoutError as TimeoutPool
 import controllers.controllers as controllers
+from config import adb, auth, cache, compresion, db, eventos, limitador, metricas, replicas, trabajos
+from utils import exportacion
+from utils.condicional import responder_condicional
+from utils.eventos import StreamSaturado
+from utils.auth import ErrorAutenticacion
+from utils.limites import LimiteExcedido
+from utils.paginacion import LimiteInvalido, leer_limite
+from utils.passwords import PoolSaturado
+from utils.pool import resumen_pools
+from utils.swagger import swag_from
 
 routes = Blueprint('routes', __name__)
 
+# Parámetros comunes de los listados: paginación por cursor y modo streaming
+PARAMETROS_LISTADO = [
+    {
+        'name': 'limit',
+        'in': 'query',
+        'type': 'integer',
+        'required': False,
+        'description': 'Número máximo de elementos por página (entero positivo; activa la paginación)',
+        'example': 100
+    },
+    {
+        'name': 'after',
+        'in': 'query',
+        'type': 'string',
+        'required': False,
+        'description': 'Cursor opaco devuelto como next_cursor en la página anterior'
+    },
+    {
+        'name': 'stream',
+        'in': 'query',
+        'type': 'boolean',
+        'required': False,
+        'description': 'Devuelve el listado completo serializado por trozos'
+    }
+]
+
+# Filtros, orden y proyección de GET /productos
+PARAMETROS_FILTRO_PRODUCTOS = [
+    {
+        'name': 'categoria_id',
+        'in': 'query',
+        'type': 'integer',
+        'required': False,
+        'example': 2
+    },
+    {
+        'name': 'precio_min',
+        'in': 'query',
+        'type': 'number',
+        'required': False,
+        'example': 10.0
+    },
+    {
+        'name': 'precio_max',
+        'in': 'query',
+        'type': 'number',
+        'required': False,
+        'example': 50.0
+    },
+    {
+        'name': 'cantidad_min',
+        'in': 'query',
+        'type': 'integer',
+        'required': False,
+        'example': 1
+    },
+    {
+        'name': 'q',
+        'in': 'query',
+        'type': 'string',
+        'required': False,
+        'description': 'Prefijo del nombre del producto',
+        'example': 'Cami'
+    },
+    {
+        'name': 'sort',
+        'in': 'query',
+        'type': 'string',
+        'required': False,
+        'description': 'Campo de orden (id, nombre, precio, cantidad); prefijo - para descendente',
+        'example': '-precio'
+    },
+    {
+        'name': 'fields',
+        'in': 'query',
+        'type': 'string',
+        'required': False,
+        'description': 'Campos a devolver separados por comas',
+        'example': 'id,nombre,precio'
+    }
+]
+
+# Respuesta de las estadísticas de inventario (por categoría y total)
+ESQUEMA_ESTADISTICAS = {
+    'type': 'object',
+    'properties': {
+        'productos': {'type': 'integer', 'example': 120},
+        'unidades': {'type': 'integer', 'example': 3400},
+        'valor_stock': {'type': 'number', 'example': 85210.5},
+        'precio_min': {'type': 'number', 'example': 2.5},
+        'precio_medio': {'type': 'number', 'example': 25.06},
+        'precio_max': {'type': 'number', 'example': 480.0}
+    }
+}
+
+def responder_listado(obtener, stream, **parametros):
+    if request.args.get('stream', '').lower() in ('1', 'true'):
+        response, status = stream(**parametros)
+        if status != 200:
+            return jsonify(response), status
+        return Response(stream_with_context(response), mimetype='application/json')
+    response, status = obtener(
+        limit=leer_limite(request.args.get('limit')),
+        after=request.args.get('after'),
+        **parametros
+    )
+    return jsonify(response), status
+
+# Cuerpo de las operaciones masivas: array JSON o NDJSON (un objeto por línea)
+def leer_elementos():
+    if request.mimetype == 'application/x-ndjson':
+        elementos = []
+        for linea in request.stream:
+            linea = linea.strip()
+            if not linea:
+                continue
+            try:
+                elementos.append(json.loads(linea))
+            except ValueError:
+                elementos.append(None)
+        return elementos
+    return request.get_json(silent=True)
+
+PARAMETROS_MASIVOS = [
+    {
+        'name': 'body',
+        'in': 'body',
+        'required': True,
+        'description': 'Array JSON o NDJSON (Content-Type: application/x-ndjson)',
+        'schema': {
+            'type': 'array',
+            'items': {
+                'type': 'object',
+                'properties': {
+                    'id': {
+                        'type': 'integer',
+                        'example': 1
+                    },
+                    'nombre': {
+                        'type': 'string',
+                        'example': 'Camiseta'
+                    },
+                    'precio': {
+                        'type': 'number',
+                        'format': 'float',
+                        'example': 25.5
+                    },
+                    'cantidad': {
+                        'type': 'integer',
+                        'example': 100
+                    },
+                    'categoria_id': {
+                        'type': 'integer',
+                        'example': 2
+                    }
+                }
+            }
+        }
+    }
+]
+
+RESPUESTAS_MASIVAS = {
+    '200': {
+        'description': 'Resultado por elemento (indice, status, id o msg)'
+    },
+    '400': {
+        'description': 'El cuerpo no es una lista'
+    }
+}
+
+# Rutas que modifican datos: requieren un token de acceso (Authorization: Bearer)
+SEGURIDAD = [{'Bearer': []}]
+
+@routes.errorhandler(ErrorAutenticacion)
+def no_autenticado(error):
+    return jsonify({'msg': str(error)}), 401
+
+@routes.errorhandler(LimiteInvalido)
+def limite_invalido(error):
+    return jsonify({'msg': str(error)}), 400
+
+# Límites de peticiones (token bucket) por IP, usuario o email de login. Se
+# comprueban antes del handler: un rechazo no consulta la base de datos ni
+# calcula hashes. Las tasas se pueden cambiar con RATE_LIMITS.
+@routes.errorhandler(LimiteExcedido)
+def limite_excedido(error):
+    respuesta = jsonify({'msg': str(error)})
+    respuesta.headers['Retry-After'] = error.retry_after
+    return respuesta, 429
+
+# El pool de hash de contraseñas o el de conexiones están llenos: se rechaza
+# la petición sin encolar más trabajo
+@routes.errorhandler(PoolSaturado)
+@routes.errorhandler(TimeoutPool)
+@routes.errorhandler(StreamSaturado)
+def pool_saturado(error):
+    respuesta = jsonify({'msg': 'Servidor ocupado, inténtelo de nuevo más tarde'})
+    respuesta.headers['Retry-After'] = '1'
+    return respuesta, 503
+
+# Compresión de las respuestas del blueprint (gzip, br, zstd) según
+# Accept-Encoding; las de responder_condicional llegan ya comprimidas
+@routes.after_request
+def comprimir(respuesta):
+    return compresion.comprimir_respuesta(respuesta)
+
 # ------------------------- RUTA PRINCIPAL -------------------------
 @routes.route('/')
 def index():
@@ -40,9 +257,13 @@ def index():
             'schema': {
                 'type': 'object',
                 'properties': {
-                    'token': {
+                    'access_token': {
                         'type': 'string',
                         'example': 'jwt_token_aqui'
+                    },
+                    'refresh_token': {
+                        'type': 'string',
+                        'example': 'jwt_refresh_token_aqui'
                     }
                 }
             }
@@ -52,6 +273,8 @@ def index():
         }
     }
 })
+@limitador.limite('10/minute', 'ip')
+@limitador.limite('5/minute', 'email')
 def login():
     data = request.get_json()
     response, status = controllers.login_usuario(
@@ -97,6 +320,7 @@ def login():
         }
     }
 })
+@limitador.limite('5/minute', 'ip')
 def registrar():
     data = request.get_json()
     response, status = controllers.registrar_usuario(
@@ -106,11 +330,89 @@ def registrar():
     )
     return jsonify(response), status
 
+@routes.route('/refresh', methods=['POST'])
+@swag_from({
+    'summary': 'Renovar el token de acceso',
+    'description': 'Emite un nuevo token de acceso a partir de un token de refresco (Authorization: Bearer <refresh_token>).',
+    'security': SEGURIDAD,
+    'responses': {
+        '200': {
+            'description': 'Nuevo token de acceso'
+        },
+        '401': {
+            'description': 'Token de refresco ausente, caducado o revocado'
+        }
+    }
+})
+@auth.requerido(refresh=True)
+@limitador.limite('30/minute', 'usuario')
+def refresh():
+    response, status = controllers.refrescar_token()
+    return jsonify(response), status
+
+@routes.route('/logout', methods=['POST'])
+@swag_from({
+    'summary': 'Cerrar sesión',
+    'description': 'Revoca el token de acceso enviado; para revocar el de refresco, llamar a /logout/refresh con él.',
+    'security': SEGURIDAD,
+    'responses': {
+        '200': {
+            'description': 'Token revocado'
+        },
+        '401': {
+            'description': 'Token ausente, caducado o ya revocado'
+        }
+    }
+})
+@auth.requerido()
+def logout():
+    response, status = controllers.cerrar_sesion()
+    return jsonify(response), status
+
+@routes.route('/logout/refresh', methods=['POST'])
+@swag_from({
+    'summary': 'Revocar el token de refresco',
+    'description': 'Revoca el token de refresco enviado en Authorization.',
+    'security': SEGURIDAD,
+    'responses': {
+        '200': {
+            'description': 'Token revocado'
+        },
+        '401': {
+            'description': 'Token ausente, caducado o ya revocado'
+        }
+    }
+})
+@auth.requerido(refresh=True)
+def logout_refresh():
+    response, status = controllers.cerrar_sesion()
+    return jsonify(response), status
+
 # ------------------------- USUARIOS -------------------------
+@routes.route('/usuarios/me', methods=['GET'])
+@swag_from({
+    'summary': 'Obtener el usuario autenticado',
+    'description': 'Devuelve el usuario del token de acceso.',
+    'security': SEGURIDAD,
+    'responses': {
+        '200': {
+            'description': 'Usuario autenticado'
+        },
+        '401': {
+            'description': 'Token ausente, caducado o revocado'
+        }
+    }
+})
+@auth.requerido()
+def obtener_usuario_actual():
+    response, status = controllers.obtener_usuario_actual()
+    return jsonify(response), status
+
 @routes.route('/usuarios', methods=['GET'])
 @swag_from({
     'summary': 'Obtener lista de usuarios',
     'description': 'Devuelve todos los usuarios registrados.',
+    'parameters': PARAMETROS_LISTADO,
     'responses': {
         '200': {
             'description': 'Lista de usuarios obtenida correctamente',
@@ -141,13 +443,47 @@ def registrar():
     }
 })
 def obtener_usuarios():
-    response, status = controllers.obtener_usuarios()
-    return jsonify(response), status
+    return responder_condicional(
+        controllers.sellos_tablas('usuarios'),
+        lambda: responder_listado(controllers.obtener_usuarios, controllers.stream_usuarios)
+    )
+
+@routes.route('/usuarios/<int:id>', methods=['GET'])
+@swag_from({
+    'summary': 'Obtener un usuario',
+    'description': 'Devuelve un usuario por su id. Admite If-None-Match / If-Modified-Since.',
+    'parameters': [
+        {
+            'name': 'id',
+            'in': 'path',
+            'type': 'integer',
+            'required': True,
+            'example': 1
+        }
+    ],
+    'responses': {
+        '200': {
+            'description': 'Usuario obtenido correctamente'
+        },
+        '304': {
+            'description': 'El usuario no ha cambiado'
+        },
+        '404': {
+            'description': 'Usuario no encontrado'
+        }
+    }
+})
+def obtener_usuario(id):
+    def generar():
+        response, status = controllers.obtener_usuario(id)
+        return jsonify(response), status
+    return responder_condicional(controllers.sello_usuario(id), generar)
 
 @routes.route('/usuarios', methods=['POST'])
 @swag_from({
     'summary': 'Crear un nuevo usuario',
     'description': 'Permite crear un nuevo usuario en la plataforma.',
+    'security': SEGURIDAD,
     'parameters': [
         {
             'name': 'body',
@@ -181,6 +517,8 @@ def obtener_usuarios():
         }
     }
 })
+@auth.requerido()
+@limitador.limite('60/minute', 'usuario')
 def crear_usuario():
     data = request.get_json()
     response, status = controllers.crear_usuario(
@@ -194,6 +532,7 @@ def crear_usuario():
 @swag_from({
     'summary': 'Actualizar datos de un usuario',
     'description': 'Permite actualizar la información de un usuario existente.',
+    'security': SEGURIDAD,
     'parameters': [
         {
             'name': 'id',
@@ -234,6 +573,8 @@ def crear_usuario():
         }
     }
 })
+@auth.requerido()
+@limitador.limite('60/minute', 'usuario')
 def actualizar_usuario(id):
     data = request.get_json()
     response, status = controllers.actualizar_usuario(
@@ -244,10 +585,66 @@ def actualizar_usuario(id):
     )
     return jsonify(response), status
 
+@routes.route('/usuarios/<int:id>', methods=['PATCH'])
+@swag_from({
+    'summary': 'Actualizar parcialmente un usuario',
+    'description': 'Actualiza solo los campos enviados con un único UPDATE y devuelve el usuario. '
+                   'Si los valores enviados ya son los actuales no se escribe nada.',
+    'security': SEGURIDAD,
+    'parameters': [
+        {
+            'name': 'id',
+            'in': 'path',
+            'type': 'integer',
+            'required': True,
+            'example': 1
+        },
+        {
+            'name': 'body',
+            'in': 'body',
+            'required': True,
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'nombre': {
+                        'type': 'string',
+                        'example': 'Juan Pérez'
+                    },
+                    'email': {
+                        'type': 'string',
+                        'example': 'juan@correo.com'
+                    },
+                    'password': {
+                        'type': 'string',
+                        'example': 'contraseña123'
+                    }
+                }
+            }
+        }
+    ],
+    'responses': {
+        '200': {
+            'description': 'Usuario actualizado (o sin cambios)'
+        },
+        '400': {
+            'description': 'Valor no válido o email ya registrado'
+        },
+        '404': {
+            'description': 'Usuario no encontrado'
+        }
+    }
+})
+@auth.requerido()
+@limitador.limite('60/minute', 'usuario')
+def actualizar_usuario_parcial(id):
+    response, status = controllers.actualizar_usuario_parcial(id, request.get_json(silent=True))
+    return jsonify(response), status
+
 @routes.route('/usuarios/<int:id>', methods=['DELETE'])
 @swag_from({
     'summary': 'Eliminar un usuario',
     'description': 'Permite eliminar un usuario de la plataforma.',
+    'security': SEGURIDAD,
     'parameters': [
         {
             'name': 'id',
@@ -266,6 +663,8 @@ def actualizar_usuario(id):
         }
     }
 })
+@auth.requerido()
+@limitador.limite('60/minute', 'usuario')
 def eliminar_usuario(id):
     response, status = controllers.eliminar_usuario(id)
     return jsonify(response), status
@@ -275,6 +674,7 @@ def eliminar_usuario(id):
 @swag_from({
     'summary': 'Obtener lista de productos',
     'description': 'Devuelve todos los productos registrados en la plataforma.',
+    'parameters': PARAMETROS_LISTADO + PARAMETROS_FILTRO_PRODUCTOS,
     'responses': {
         '200': {
             'description': 'Lista de productos obtenida correctamente',
@@ -300,6 +700,10 @@ def eliminar_usuario(id):
                             'type': 'integer',
                             'example': 100
                         },
+                        'version': {
+                            'type': 'integer',
+                            'example': 3
+                        },
                         'categoria_id': {
                             'type': 'integer',
                             'example': 2
@@ -314,13 +718,167 @@ def eliminar_usuario(id):
     }
 })
 def obtener_productos():
-    response, status = controllers.obtener_productos()
-    return jsonify(response), status
+    try:
+        filtros = controllers.leer_filtros_productos(request.args)
+    except ValueError as e:
+        return jsonify({'msg': str(e)}), 400
+    # Los productos incluyen su categoría: el ETag depende de ambas tablas
+    return responder_condicional(
+        controllers.sellos_tablas('productos', 'categorias'),
+        lambda: responder_listado(
+            controllers.obtener_productos,
+            controllers.stream_productos,
+            sort=request.args.get('sort'),
+            fields=request.args.get('fields'),
+            **filtros
+        )
+    )
+
+@routes.route('/productos/search', methods=['GET'])
+@swag_from({
+    'summary': 'Buscar productos por nombre',
+    'description': 'Búsqueda de texto sobre el nombre, sin distinguir mayúsculas ni acentos. '
+                   'Todas las palabras deben aparecer (la última puede ser un prefijo) y los '
+                   'resultados se ordenan por relevancia.',
+    'parameters': [
+        {
+            'name': 'q',
+            'in': 'query',
+            'type': 'string',
+            'required': True,
+            'example': 'camiseta algod'
+        },
+        {
+            'name': 'limit',
+            'in': 'query',
+            'type': 'integer',
+            'required': False,
+            'description': 'Tamaño de página (entero positivo; por defecto 100, máximo 1000)'
+        },
+        {
+            'name': 'after',
+            'in': 'query',
+            'type': 'string',
+            'required': False,
+            'description': 'Cursor opaco devuelto como next_cursor en la página anterior'
+        },
+        {
+            'name': 'fields',
+            'in': 'query',
+            'type': 'string',
+            'required': False,
+            'description': 'Campos a devolver separados por comas',
+            'example': 'id,nombre,precio'
+        }
+    ],
+    'responses': {
+        '200': {
+            'description': 'Página de resultados: items, total y next_cursor'
+        },
+        '304': {
+            'description': 'Los productos no han cambiado'
+        },
+        '400': {
+            'description': 'Falta q, o campos o cursor no válidos'
+        }
+    }
+})
+def buscar_productos():
+    def generar():
+        response, status = controllers.buscar_productos(
+            q=request.args.get('q'),
+            limit=leer_limite(request.args.get('limit')),
+            after=request.args.get('after'),
+            fields=request.args.get('fields')
+        )
+        return jsonify(response), status
+    return responder_condicional(controllers.sellos_tablas('productos', 'categorias'), generar)
+
+@routes.route('/productos/export', methods=['GET'])
+@swag_from({
+    'summary': 'Exportar el catálogo de productos',
+    'description': 'Devuelve todos los productos (o los que cumplen los filtros) ordenados por id, '
+                   'con el nombre de su categoría, como fichero CSV, NDJSON o Parquet. El fichero '
+                   'se genera por trozos mientras se envía; CSV y NDJSON se comprimen según '
+                   'Accept-Encoding. Parquet requiere pyarrow en el servidor.',
+    'produces': ['text/csv', 'application/x-ndjson', 'application/vnd.apache.parquet'],
+    'parameters': [
+        {
+            'name': 'format',
+            'in': 'query',
+            'type': 'string',
+            'enum': ['csv', 'ndjson', 'parquet'],
+            'required': False,
+            'default': 'csv'
+        }
+    ] + [p for p in PARAMETROS_FILTRO_PRODUCTOS if p['name'] not in ('sort', 'fields')],
+    'responses': {
+        '200': {
+            'description': 'Fichero con id, nombre, precio, cantidad, version, categoria_id y categoria',
+            'examples': {
+                'text/csv': 'id,nombre,precio,cantidad,version,categoria_id,categoria\n'
+                            '1,Camiseta,25.5,100,3,2,Ropa\n'
+            }
+        },
+        '400': {
+            'description': 'Formato no válido o no disponible, o filtro no numérico'
+        },
+        '429': {
+            'description': 'Demasiadas exportaciones'
+        }
+    }
+})
+@limitador.limite('10/minute', 'ip')
+def exportar_productos():
+    formato = request.args.get('format', 'csv')
+    try:
+        filtros = controllers.leer_filtros_productos(request.args)
+    except ValueError as e:
+        return jsonify({'msg': str(e)}), 400
+    response, status = controllers.exportar_productos(formato, **filtros)
+    if status != 200:
+        return jsonify(response), status
+    mimetype, extension = exportacion.FORMATOS[formato]
+    respuesta = Response(stream_with_context(response), mimetype=mimetype)
+    respuesta.headers['Content-Disposition'] = 'attachment; filename="productos%s"' % extension
+    return compresion.comprimir_streaming(respuesta)
+
+@routes.route('/productos/<int:id>', methods=['GET'])
+@swag_from({
+    'summary': 'Obtener un producto',
+    'description': 'Devuelve un producto por su id. Admite If-None-Match / If-Modified-Since.',
+    'parameters': [
+        {
+            'name': 'id',
+            'in': 'path',
+            'type': 'integer',
+            'required': True,
+            'example': 1
+        }
+    ],
+    'responses': {
+        '200': {
+            'description': 'Producto obtenido correctamente'
+        },
+        '304': {
+            'description': 'El producto no ha cambiado'
+        },
+        '404': {
+            'description': 'Producto no encontrado'
+        }
+    }
+})
+def obtener_producto(id):
+    def generar():
+        response, status = controllers.obtener_producto(id)
+        return jsonify(response), status
+    return responder_condicional(controllers.sello_producto(id), generar)
 
 @routes.route('/productos', methods=['POST'])
 @swag_from({
     'summary': 'Crear un nuevo producto',
     'description': 'Permite crear un nuevo producto en la plataforma.',
+    'security': SEGURIDAD,
     'parameters': [
         {
             'name': 'body',
@@ -359,6 +917,8 @@ def obtener_productos():
         }
     }
 })
+@auth.requerido()
+@limitador.limite('60/minute', 'usuario')
 def crear_producto():
     data = request.get_json()
     response, status = controllers.crear_producto(
@@ -373,6 +933,7 @@ def crear_producto():
 @swag_from({
     'summary': 'Actualizar datos de un producto',
     'description': 'Permite actualizar la información de un producto existente.',
+    'security': SEGURIDAD,
     'parameters': [
         {
             'name': 'id',
@@ -404,6 +965,11 @@ def crear_producto():
                     'categoria_id': {
                         'type': 'integer',
                         'example': 2
+                    },
+                    'version': {
+                        'type': 'integer',
+                        'description': 'Versión leída del producto; si ha cambiado se responde 409',
+                        'example': 3
                     }
                 }
             }
@@ -415,9 +981,14 @@ def crear_producto():
         },
         '400': {
             'description': 'Error al actualizar producto'
+        },
+        '409': {
+            'description': 'El producto ha cambiado desde que se leyó (devuelve la versión actual)'
         }
     }
 })
+@auth.requerido()
+@limitador.limite('60/minute', 'usuario')
 def actualizar_producto(id):
     data = request.get_json()
     response, status = controllers.actualizar_producto(
@@ -425,14 +996,85 @@ def actualizar_producto(id):
         data.get('nombre'),
         data.get('precio'),
         data.get('cantidad'),
-        data.get('categoria_id')
+        data.get('categoria_id'),
+        data.get('version')
     )
     return jsonify(response), status
 
+@routes.route('/productos/<int:id>', methods=['PATCH'])
+@swag_from({
+    'summary': 'Actualizar parcialmente un producto',
+    'description': 'Actualiza solo los campos enviados con un único UPDATE y devuelve el producto, '
+                   'con su categoría, en la misma sentencia (RETURNING). Si los valores enviados ya '
+                   'son los actuales no se escribe nada ni cambia la versión.',
+    'security': SEGURIDAD,
+    'parameters': [
+        {
+            'name': 'id',
+            'in': 'path',
+            'type': 'integer',
+            'required': True,
+            'example': 1
+        },
+        {
+            'name': 'body',
+            'in': 'body',
+            'required': True,
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'nombre': {
+                        'type': 'string',
+                        'example': 'Camiseta'
+                    },
+                    'precio': {
+                        'type': 'number',
+                        'format': 'float',
+                        'example': 30.0
+                    },
+                    'cantidad': {
+                        'type': 'integer',
+                        'example': 120
+                    },
+                    'categoria_id': {
+                        'type': 'integer',
+                        'example': 2
+                    },
+                    'version': {
+                        'type': 'integer',
+                        'description': 'Versión leída del producto; si ha cambiado se responde 409',
+                        'example': 3
+                    }
+                }
+            }
+        }
+    ],
+    'responses': {
+        '200': {
+            'description': 'Producto actualizado (o sin cambios)'
+        },
+        '400': {
+            'description': 'Valor no válido o categoría inexistente'
+        },
+        '404': {
+            'description': 'Producto no encontrado'
+        },
+        '409': {
+            'description': 'El producto ha cambiado desde que se leyó (devuelve la versión actual)'
+        }
+    }
+})
+@auth.requerido()
+@limitador.limite('60/minute', 'usuario')
+def actualizar_producto_parcial(id):
+    response, status = controllers.actualizar_producto_parcial(id, request.get_json(silent=True))
+    return jsonify(response), status
+
 @routes.route('/productos/<int:id>', methods=['DELETE'])
 @swag_from({
     'summary': 'Eliminar un producto',
     'description': 'Permite eliminar un producto de la plataforma.',
+    'security': SEGURIDAD,
     'parameters': [
         {
             'name': 'id',
@@ -440,6 +1082,13 @@ def actualizar_producto(id):
             'type': 'integer',
             'required': True,
             'example': 1
+        },
+        {
+            'name': 'version',
+            'in': 'query',
+            'type': 'integer',
+            'required': False,
+            'description': 'Versión leída del producto: si ha cambiado, no se elimina (409)'
         }
     ],
     'responses': {
@@ -448,11 +1097,158 @@ def actualizar_producto(id):
         },
         '400': {
             'description': 'Error al eliminar el producto'
+        },
+        '409': {
+            'description': 'El producto ha cambiado desde que se leyó (devuelve la versión actual)'
         }
     }
 })
+@auth.requerido()
+@limitador.limite('60/minute', 'usuario')
 def eliminar_producto(id):
-    response, status = controllers.eliminar_producto(id)
+    try:
+        version = controllers.leer_version(request.args.get('version'))
+    except ValueError as e:
+        return jsonify({'msg': str(e)}), 400
+    response, status = controllers.eliminar_producto(id, version)
+    return jsonify(response), status
+
+@routes.route('/productos/<int:id>/stock', methods=['POST'])
+@swag_from({
+    'summary': 'Ajustar el stock de un producto',
+    'description': 'Suma delta (negativo para retirar unidades) a la cantidad en un solo UPDATE '
+                   'condicional: las peticiones concurrentes no se pisan y el stock nunca queda '
+                   'negativo.',
+    'security': SEGURIDAD,
+    'parameters': [
+        {
+            'name': 'id',
+            'in': 'path',
+            'type': 'integer',
+            'required': True,
+            'example': 1
+        },
+        {
+            'name': 'body',
+            'in': 'body',
+            'required': True,
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'delta': {
+                        'type': 'integer',
+                        'example': -3
+                    }
+                }
+            }
+        }
+    ],
+    'responses': {
+        '200': {
+            'description': 'Stock ajustado: id, cantidad y version resultantes'
+        },
+        '400': {
+            'description': 'delta no válido'
+        },
+        '404': {
+            'description': 'Producto no encontrado'
+        },
+        '409': {
+            'description': 'Stock insuficiente (devuelve la cantidad actual)'
+        }
+    }
+})
+@auth.requerido()
+@limitador.limite('60/minute', 'usuario')
+def ajustar_stock(id):
+    data = request.get_json(silent=True) or {}
+    response, status = controllers.ajustar_stock(id, data.get('delta'))
+    return jsonify(response), status
+
+@routes.route('/productos/stock', methods=['POST'])
+@swag_from({
+    'summary': 'Ajustar el stock de varios productos (pedido)',
+    'description': 'Aplica todas las líneas en una sola transacción o ninguna. Las líneas del '
+                   'mismo producto se suman. Acepta un array JSON o NDJSON.',
+    'security': SEGURIDAD,
+    'parameters': [
+        {
+            'name': 'body',
+            'in': 'body',
+            'required': True,
+            'schema': {
+                'type': 'array',
+                'items': {
+                    'type': 'object',
+                    'properties': {
+                        'id': {'type': 'integer', 'example': 1},
+                        'delta': {'type': 'integer', 'example': -2}
+                    }
+                }
+            }
+        }
+    ],
+    'responses': {
+        '200': {
+            'description': 'Ajustes aplicados: cantidad y version de cada producto'
+        },
+        '400': {
+            'description': 'Ajuste no válido'
+        },
+        '409': {
+            'description': 'Alguna línea no se pudo aplicar (stock insuficiente o producto inexistente)'
+        }
+    }
+})
+@auth.requerido()
+@limitador.limite('60/minute', 'usuario')
+def ajustar_stock_lote():
+    response, status = controllers.ajustar_stock_lote(leer_elementos())
+    return jsonify(response), status
+
+@routes.route('/productos/bulk', methods=['POST'])
+@swag_from({
+    'summary': 'Crear productos de forma masiva',
+    'description': 'Inserta una lista de productos por lotes en una sola transacción.',
+    'security': SEGURIDAD,
+    'consumes': ['application/json', 'application/x-ndjson'],
+    'parameters': PARAMETROS_MASIVOS,
+    'responses': RESPUESTAS_MASIVAS
+})
+@auth.requerido()
+@limitador.limite('10/minute', 'usuario')
+def crear_productos():
+    response, status = controllers.crear_productos(leer_elementos())
+    return jsonify(response), status
+
+@routes.route('/productos/bulk', methods=['PATCH'])
+@swag_from({
+    'summary': 'Actualizar productos de forma masiva',
+    'description': 'Actualiza por id los campos indicados de cada producto.',
+    'security': SEGURIDAD,
+    'consumes': ['application/json', 'application/x-ndjson'],
+    'parameters': PARAMETROS_MASIVOS,
+    'responses': RESPUESTAS_MASIVAS
+})
+@auth.requerido()
+@limitador.limite('10/minute', 'usuario')
+def actualizar_productos():
+    response, status = controllers.actualizar_productos(leer_elementos())
+    return jsonify(response), status
+
+@routes.route('/productos/bulk', methods=['DELETE'])
+@swag_from({
+    'summary': 'Eliminar productos de forma masiva',
+    'description': 'Elimina los productos cuyos ids se indican (enteros u objetos con id).',
+    'security': SEGURIDAD,
+    'consumes': ['application/json', 'application/x-ndjson'],
+    'parameters': PARAMETROS_MASIVOS,
+    'responses': RESPUESTAS_MASIVAS
+})
+@auth.requerido()
+@limitador.limite('10/minute', 'usuario')
+def eliminar_productos():
+    response, status = controllers.eliminar_productos(leer_elementos())
     return jsonify(response), status
 
 # ------------------------- CATEGORÍAS -------------------------
@@ -460,6 +1256,7 @@ def eliminar_producto(id):
 @swag_from({
     'summary': 'Obtener lista de categorías',
     'description': 'Devuelve todas las categorías disponibles en la plataforma.',
+    'parameters': PARAMETROS_LISTADO,
     'responses': {
         '200': {
             'description': 'Lista de categorías obtenida correctamente',
@@ -486,13 +1283,80 @@ def eliminar_producto(id):
     }
 })
 def obtener_categorias():
-    response, status = controllers.obtener_categorias()
-    return jsonify(response), status
+    return responder_condicional(
+        controllers.sellos_tablas('categorias'),
+        lambda: responder_listado(controllers.obtener_categorias, controllers.stream_categorias)
+    )
+
+@routes.route('/categorias/<int:id>', methods=['GET'])
+@swag_from({
+    'summary': 'Obtener una categoría',
+    'description': 'Devuelve una categoría por su id. Admite If-None-Match / If-Modified-Since.',
+    'parameters': [
+        {
+            'name': 'id',
+            'in': 'path',
+            'type': 'integer',
+            'required': True,
+            'example': 1
+        }
+    ],
+    'responses': {
+        '200': {
+            'description': 'Categoría obtenida correctamente'
+        },
+        '304': {
+            'description': 'La categoría no ha cambiado'
+        },
+        '404': {
+            'description': 'Categoría no encontrada'
+        }
+    }
+})
+def obtener_categoria(id):
+    def generar():
+        response, status = controllers.obtener_categoria(id)
+        return jsonify(response), status
+    return responder_condicional(controllers.sello_categoria(id), generar)
+
+@routes.route('/categorias/<int:id>/stats', methods=['GET'])
+@swag_from({
+    'summary': 'Estadísticas de inventario de una categoría',
+    'description': 'Número de productos, unidades en stock, valor del stock (precio * cantidad) '
+                   'y precio mínimo, medio y máximo de la categoría, calculados en la base de datos.',
+    'parameters': [
+        {
+            'name': 'id',
+            'in': 'path',
+            'type': 'integer',
+            'required': True,
+            'example': 1
+        }
+    ],
+    'responses': {
+        '200': {
+            'description': 'Estadísticas de la categoría',
+            'schema': ESQUEMA_ESTADISTICAS
+        },
+        '304': {
+            'description': 'Los productos no han cambiado'
+        },
+        '404': {
+            'description': 'Categoría no encontrada'
+        }
+    }
+})
+def estadisticas_categoria(id):
+    def generar():
+        response, status = controllers.estadisticas_categoria(id)
+        return jsonify(response), status
+    return responder_condicional(controllers.sellos_tablas('productos', 'categorias'), generar)
 
 @routes.route('/categorias', methods=['POST'])
 @swag_from({
     'summary': 'Crear una nueva categoría',
     'description': 'Permite crear una nueva categoría para los productos.',
+    'security': SEGURIDAD,
     'parameters': [
         {
             'name': 'body',
@@ -518,6 +1382,8 @@ def obtener_categorias():
         }
     }
 })
+@auth.requerido()
+@limitador.limite('60/minute', 'usuario')
 def crear_categoria():
     data = request.get_json()
     response, status = controllers.crear_categoria(
@@ -529,6 +1395,7 @@ def crear_categoria():
 @swag_from({
     'summary': 'Actualizar datos de una categoría',
     'description': 'Permite actualizar la información de una categoría existente.',
+    'security': SEGURIDAD,
     'parameters': [
         {
             'name': 'id',
@@ -561,6 +1428,8 @@ def crear_categoria():
         }
     }
 })
+@auth.requerido()
+@limitador.limite('60/minute', 'usuario')
 def actualizar_categoria(id):
     data = request.get_json()
     response, status = controllers.actualizar_categoria(
@@ -569,10 +1438,62 @@ def actualizar_categoria(id):
     )
     return jsonify(response), status
 
+@routes.route('/categorias/<int:id>', methods=['PATCH'])
+@swag_from({
+    'summary': 'Actualizar parcialmente una categoría',
+    'description': 'Actualiza solo los campos enviados con un único UPDATE y devuelve la categoría. '
+                   'Si los valores enviados ya son los actuales no se escribe nada.',
+    'security': SEGURIDAD,
+    'parameters': [
+        {
+            'name': 'id',
+            'in': 'path',
+            'type': 'integer',
+            'required': True,
+            'example': 1
+        },
+        {
+            'name': 'body',
+            'in': 'body',
+            'required': True,
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'nombre': {
+                        'type': 'string',
+                        'example': 'Electrónica'
+                    },
+                    'descripcion': {
+                        'type': 'string',
+                        'example': 'Dispositivos y accesorios'
+                    }
+                }
+            }
+        }
+    ],
+    'responses': {
+        '200': {
+            'description': 'Categoría actualizada (o sin cambios)'
+        },
+        '400': {
+            'description': 'Valor no válido o nombre ya existente'
+        },
+        '404': {
+            'description': 'Categoría no encontrada'
+        }
+    }
+})
+@auth.requerido()
+@limitador.limite('60/minute', 'usuario')
+def actualizar_categoria_parcial(id):
+    response, status = controllers.actualizar_categoria_parcial(id, request.get_json(silent=True))
+    return jsonify(response), status
+
 @routes.route('/categorias/<int:id>', methods=['DELETE'])
 @swag_from({
     'summary': 'Eliminar una categoría',
     'description': 'Permite eliminar una categoría de la plataforma.',
+    'security': SEGURIDAD,
     'parameters': [
         {
             'name': 'id',
@@ -591,6 +1512,272 @@ def actualizar_categoria(id):
         }
     }
 })
+@auth.requerido()
+@limitador.limite('60/minute', 'usuario')
 def eliminar_categoria(id):
     response, status = controllers.eliminar_categoria(id)
     return jsonify(response), status
+
+# ------------------------- CAMBIOS (SSE) -------------------------
+# Feed de cambios de productos y categorías como Server-Sent Events. Cada
+# conexión dura STREAM_MAX_SECONDS; el navegador (EventSource) se reconecta solo
+# enviando Last-Event-ID y recibe lo que se perdió mientras siga en el buffer.
+@routes.route('/stream/productos', methods=['GET'])
+@swag_from({
+    'summary': 'Stream de cambios de productos y categorías',
+    'description': 'Server-Sent Events con un evento por cada alta, modificación o baja confirmada '
+                   '(productos.crear, productos.actualizar, productos.eliminar, categorias.*). '
+                   'Cada evento lleva id, tabla, op y las columnas que han cambiado. Con Last-Event-ID '
+                   'se reanuda tras el último evento recibido; si ya no está en el buffer se envía un '
+                   'evento reset y hay que volver a leer GET /productos.',
+    'produces': ['text/event-stream'],
+    'parameters': [
+        {
+            'name': 'Last-Event-ID',
+            'in': 'header',
+            'type': 'string',
+            'required': False,
+            'description': 'Id del último evento recibido'
+        },
+        {
+            'name': 'last_event_id',
+            'in': 'query',
+            'type': 'string',
+            'required': False,
+            'description': 'Igual que la cabecera Last-Event-ID, para clientes que no pueden enviarla'
+        }
+    ],
+    'responses': {
+        '200': {
+            'description': 'Stream de eventos',
+            'examples': {
+                'text/event-stream': 'id: 1718000000000-42\nevent: productos.actualizar\n'
+                                     'data: {"tabla":"productos","op":"actualizar","id":5,'
+                                     '"datos":{"precio":9.5,"version":3}}\n\n'
+            }
+        },
+        '503': {
+            'description': 'Demasiadas conexiones abiertas (STREAM_MAX_CLIENTS)'
+        }
+    }
+})
+def stream_productos():
+    cabeceras = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    if request.method == 'HEAD':
+        # Sin cuerpo: el servidor de desarrollo recorrería el flujo entero
+        return Response(mimetype='text/event-stream', headers=cabeceras)
+    desde = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    cerrar = eventos.abrir()
+    respuesta = Response(
+        eventos.flujo(('productos', 'categorias'), desde),
+        mimetype='text/event-stream',
+        headers=cabeceras
+    )
+    # El servidor cierra la respuesta aunque no lea el cuerpo (cliente que se va)
+    respuesta.call_on_close(cerrar)
+    return respuesta
+
+# ------------------------- TRABAJOS -------------------------
+# Operaciones largas en segundo plano (utils.trabajos): la petición solo guarda
+# el fichero y encola el trabajo; el progreso se consulta en GET /jobs/<id>
+@routes.route('/jobs/import-productos', methods=['POST'])
+@swag_from({
+    'summary': 'Importar productos desde un CSV',
+    'description': 'Encola la importación de un CSV con cabecera nombre, precio, cantidad y '
+                   'categoria_id o categoria (nombre de una categoría existente). El CSV se envía '
+                   'como cuerpo (text/csv) o como el campo archivo de un formulario multipart. '
+                   'Responde 202 con el trabajo; su estado y progreso se consultan en la cabecera '
+                   'Location (GET /jobs/<id>). Las filas se escriben y confirman por lotes.',
+    'security': SEGURIDAD,
+    'consumes': ['text/csv', 'multipart/form-data'],
+    'parameters': [
+        {
+            'name': 'archivo',
+            'in': 'formData',
+            'type': 'file',
+            'required': False,
+            'description': 'CSV de productos (o el CSV como cuerpo de la petición)'
+        }
+    ],
+    'responses': {
+        '202': {
+            'description': 'Trabajo encolado'
+        },
+        '400': {
+            'description': 'El CSV no es válido o le faltan columnas'
+        }
+    }
+})
+@auth.requerido()
+@limitador.limite('10/minute', 'usuario')
+def importar_productos():
+    if request.mimetype == 'multipart/form-data':
+        subido = request.files.get('archivo')
+        if subido is None:
+            return jsonify({'msg': 'Falta el fichero (archivo)'}), 400
+        archivo, nombre = trabajos.guardar(subido.stream, '.csv'), subido.filename
+    else:
+        archivo, nombre = trabajos.guardar(request.stream, '.csv'), None
+    response, status = controllers.encolar_importacion(archivo, nombre)
+    respuesta = jsonify(response)
+    if status == 202:
+        respuesta.headers['Location'] = '/jobs/%d' % response['id']
+    return respuesta, status
+
+@routes.route('/jobs/<int:id>', methods=['GET'])
+@swag_from({
+    'summary': 'Estado de un trabajo',
+    'description': 'Estado (pendiente, en_curso, completado, fallido), filas procesadas, '
+                   'correctas y fallidas, progreso (0-1) y los primeros errores por línea. '
+                   'Solo para el usuario que encoló el trabajo.',
+    'security': SEGURIDAD,
+    'parameters': [
+        {
+            'name': 'id',
+            'in': 'path',
+            'type': 'integer',
+            'required': True,
+            'example': 1
+        }
+    ],
+    'responses': {
+        '200': {
+            'description': 'Estado del trabajo'
+        },
+        '404': {
+            'description': 'Trabajo no encontrado o de otro usuario'
+        }
+    }
+})
+@auth.requerido()
+def obtener_trabajo(id):
+    response, status = controllers.obtener_trabajo(id)
+    return jsonify(response), status
+
+# ------------------------- ESTADÍSTICAS -------------------------
+@routes.route('/stats/inventario', methods=['GET'])
+@swag_from({
+    'summary': 'Estadísticas del inventario por categoría',
+    'description': 'Las estadísticas de cada categoría y el total. Con STATS_SOURCE=summary '
+                   'se leen de la tabla de resumen (una fila por categoría) en lugar de '
+                   'agregar todos los productos.',
+    'responses': {
+        '200': {
+            'description': 'Estadísticas por categoría y totales',
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'categorias': {'type': 'array', 'items': ESQUEMA_ESTADISTICAS},
+                    'total': ESQUEMA_ESTADISTICAS
+                }
+            }
+        },
+        '304': {
+            'description': 'Los productos no han cambiado'
+        }
+    }
+})
+def estadisticas_inventario():
+    def generar():
+        response, status = controllers.estadisticas_inventario()
+        return jsonify(response), status
+    return responder_condicional(controllers.sellos_tablas('productos', 'categorias'), generar)
+
+# ------------------------- CACHÉ -------------------------
+@routes.route('/cache/stats', methods=['GET'])
+@swag_from({
+    'summary': 'Estadísticas de la caché',
+    'description': 'Devuelve los aciertos y fallos de la caché por espacio (productos, categorias).',
+    'responses': {
+        '200': {
+            'description': 'Estadísticas obtenidas correctamente'
+        }
+    }
+})
+def estadisticas_cache():
+    return jsonify(cache.estadisticas()), 200
+
+# ------------------------- POOL DE CONEXIONES -------------------------
+@routes.route('/pool/stats', methods=['GET'])
+@swag_from({
+    'summary': 'Estadísticas del pool de conexiones',
+    'description': 'Conexiones en uso, overflow, tiempo de espera y timeouts de cada motor.',
+    'responses': {
+        '200': {
+            'description': 'Estadísticas obtenidas correctamente'
+        }
+    }
+})
+def estadisticas_pool():
+    return jsonify(resumen_pools_app()), 200
+
+def resumen_pools_app():
+    engines = dict(db.engines)
+    if adb.engine is not None:
+        engines['async'] = adb.engine.sync_engine
+    return resumen_pools(engines)
+
+# ------------------------- RÉPLICAS -------------------------
+@routes.route('/replicas/stats', methods=['GET'])
+@swag_from({
+    'summary': 'Estado de las réplicas de lectura',
+    'description': 'Salud, retraso respecto a la primaria y peticiones atendidas por cada réplica, '
+                   'y peticiones GET que se han leído de la primaria por no haber réplicas sanas.',
+    'responses': {
+        '200': {
+            'description': 'Estadísticas obtenidas correctamente'
+        }
+    }
+})
+def estadisticas_replicas():
+    return jsonify(replicas.estadisticas()), 200
+
+# ------------------------- MÉTRICAS -------------------------
+# Pool de conexiones, caché, réplicas y eventos, leídos en cada exportación
+for campo, nombre, ayuda, tipo in [
+    ('size', 'db_pool_size', 'Tamaño del pool de conexiones', 'gauge'),
+    ('checked_out', 'db_pool_checked_out', 'Conexiones en uso', 'gauge'),
+    ('overflow', 'db_pool_overflow', 'Conexiones de overflow abiertas', 'gauge'),
+    ('checkouts', 'db_pool_checkouts_total', 'Conexiones obtenidas del pool', 'counter'),
+    ('timeouts', 'db_pool_timeouts_total', 'Esperas del pool que agotaron el timeout', 'counter'),
+    ('espera_total_s', 'db_pool_wait_seconds_total', 'Tiempo total esperando conexión', 'counter')
+]:
+    metricas.gauge(nombre, ayuda, ('engine',), tipo=tipo, leer=lambda campo=campo: [
+        ((engine,), resumen[campo]) for engine, resumen in resumen_pools_app().items()
+    ])
+
+metricas.gauge('cache_hits_total', 'Aciertos de la caché', ('namespace',), tipo='counter',
+               leer=lambda: [((espacio,), n) for espacio, n in cache.aciertos.items()])
+metricas.gauge('cache_misses_total', 'Fallos de la caché', ('namespace',), tipo='counter',
+               leer=lambda: [((espacio,), n) for espacio, n in cache.fallos.items()])
+
+metricas.gauge('db_replica_healthy', 'Réplica recibiendo lecturas (1) o retirada (0)', ('replica',),
+               leer=lambda: [((e.nombre,), int(e.sana)) for e in replicas.estados])
+metricas.gauge('db_replica_lag_seconds', 'Retraso de la réplica en la última comprobación', ('replica',),
+               leer=lambda: [((e.nombre,), e.retraso) for e in replicas.estados if e.retraso is not None])
+metricas.gauge('db_replica_requests_total', 'Peticiones GET atendidas por cada réplica', ('replica',),
+               tipo='counter', leer=lambda: [((e.nombre,), e.peticiones) for e in replicas.estados])
+
+metricas.gauge('events_published_total', 'Eventos de cambios publicados', ('table',), tipo='counter',
+               leer=lambda: [((tabla,), n) for tabla, n in eventos.publicados.items()])
+metricas.gauge('events_publish_errors_total', 'Publicaciones de eventos fallidas', tipo='counter',
+               leer=lambda: [((), eventos.errores)])
+metricas.gauge('sse_clients', 'Conexiones SSE abiertas', leer=lambda: [((), eventos.clientes)])
+
+metricas.gauge('rate_limit_rejected_total', 'Peticiones rechazadas por límite de tasa', ('route',),
+               tipo='counter', leer=lambda: [((ruta,), n) for ruta, n in limitador.rechazos.items()])
+
+
+@routes.route('/metrics', methods=['GET'])
+@swag_from({
+    'summary': 'Métricas en formato Prometheus',
+    'description': 'Peticiones, latencias, tamaño de respuesta y SQL por ruta, pool de conexiones y caché.',
+    'produces': ['text/plain'],
+    'responses': {
+        '200': {
+            'description': 'Métricas en formato de exposición de Prometheus'
+        }
+    }
+})
+def exportar_metricas():
+    return Response(metricas.exportar(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,94 @@
+from contextlib import asynccontextmanager
+import httpx
+import pytest
+from flask_jwt_extended import create_access_token
+from app import create_app
+from asgi import crear_app_asgi
+from config import adb, db
+from models import Categoria, Producto
+
+CONFIG_TESTS = {
+    'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+    'SECRET_KEY': 'clave-de-pruebas-de-al-menos-32-bytes',
+    'CACHE_TYPE': 'null',
+    'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+    'SWAGGER_UI': False,
+    'MIGRATIONS_ENABLED': False,
+    'METRICS_ENABLED': False,
+    'RATE_LIMIT_ENABLED': False,
+    # Con SQLite en memoria todas las sesiones comparten una conexión: el hilo
+    # que construye el índice de búsqueda no puede usarla a la vez
+    'SEARCH_INDEX_BACKGROUND': False,
+}
+
+
+def sembrar(app, categorias=3, productos=25):
+    with app.app_context():
+        db.session.add_all(Categoria(nombre='categoria-%d' % i) for i in range(categorias))
+        db.session.flush()
+        db.session.add_all(
+            Producto(nombre='producto-%d' % i, precio=i * 1.5, cantidad=i, categoria_id=1 + i % categorias)
+            for i in range(productos)
+        )
+        db.session.commit()
+
+
+@pytest.fixture
+def crear_app():
+    # crear_app(productos=..., **config): aplicación con SQLite en memoria y datos
+    def crear(productos=25, **config):
+        app = create_app({**CONFIG_TESTS, **config})
+        with app.app_context():
+            # Solo la primaria: db recuerda los binds de las réplicas de otros
+            # tests (replica-0...), que aquí no existen
+            db.create_all(bind_key=None)
+        sembrar(app, productos=productos)
+        return app
+    return crear
+
+
+@pytest.fixture
+def app(crear_app):
+    return crear_app()
+
+
+@pytest.fixture
+def cliente(app):
+    with app.app_context():
+        token = create_access_token(identity='1')
+    cliente = app.test_client()
+    cliente.environ_base['HTTP_AUTHORIZATION'] = 'Bearer ' + token
+    return cliente
+
+
+@pytest.fixture
+def anyio_backend():
+    return 'asyncio'
+
+
+@asynccontextmanager
+async def abrir_cliente_asgi(app):
+    # Cliente del modo ASGI (asgi.py) para `app`, con el token de acceso del usuario 1
+    adb.init_app(app)
+    with app.app_context():
+        token = create_access_token(identity='1')
+    transporte = httpx.ASGITransport(app=crear_app_asgi(app))
+    try:
+        async with httpx.AsyncClient(transport=transporte, base_url='http://asgi',
+                                     headers={'Authorization': 'Bearer ' + token}) as cliente:
+            yield cliente
+    finally:
+        await adb.engine.dispose()
+
+
+@pytest.fixture
+def base_de_datos_en_fichero(tmp_path):
+    # El motor asíncrono abre sus propias conexiones y no vería una base de
+    # datos SQLite en memoria
+    return 'sqlite:///%s' % (tmp_path / 'asgi.db')
+
+
+@pytest.fixture
+async def cliente_asgi(crear_app, base_de_datos_en_fichero):
+    async with abrir_cliente_asgi(crear_app(SQLALCHEMY_DATABASE_URI=base_de_datos_en_fichero)) as cliente:
+        yield cliente
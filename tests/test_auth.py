@@ -0,0 +1,28 @@
+import pytest
+from app import create_app
+from tests.conftest import CONFIG_TESTS
+
+
+def test_sin_secret_key_fuera_de_debug(monkeypatch):
+    monkeypatch.delenv('SECRET_KEY', raising=False)
+    with pytest.raises(RuntimeError):
+        create_app({**CONFIG_TESTS, 'SECRET_KEY': None})
+    assert create_app({**CONFIG_TESTS, 'SECRET_KEY': None, 'DEBUG': True}).config['SECRET_KEY']
+
+
+def test_refresco_y_cierre_de_sesion(app):
+    cliente = app.test_client()
+    assert cliente.post('/registrar', json={
+        'nombre': 'ana', 'email': 'Ana@Correo.com', 'password': 'secreta123'
+    }).status_code == 201
+    tokens = cliente.post('/login', json={'email': 'ana@correo.com', 'password': 'secreta123'}).get_json()
+    acceso = {'Authorization': 'Bearer ' + tokens['access_token']}
+    refresco = {'Authorization': 'Bearer ' + tokens['refresh_token']}
+
+    assert cliente.get('/usuarios/me', headers=acceso).get_json()['email'] == 'Ana@Correo.com'
+    nuevo = cliente.post('/refresh', headers=refresco).get_json()['access_token']
+    assert cliente.get('/usuarios/me', headers={'Authorization': 'Bearer ' + nuevo}).status_code == 200
+    assert cliente.post('/refresh', headers=acceso).status_code == 401
+
+    assert cliente.post('/logout', headers=acceso).status_code == 200
+    assert cliente.get('/usuarios/me', headers=acceso).status_code == 401
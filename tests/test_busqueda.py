@@ -0,0 +1,55 @@
+import threading
+from flask_jwt_extended import create_access_token
+from config import buscador
+from utils.busqueda import IndiceInvertido
+
+
+def nombres(cliente, q):
+    respuesta = cliente.get('/productos/search', query_string={'q': q})
+    assert respuesta.status_code == 200
+    return [p['nombre'] for p in respuesta.get_json()['items']]
+
+
+def test_escrituras_cambian_los_resultados(cliente):
+    assert nombres(cliente, 'zapatilla') == []
+    id = cliente.post('/productos', json={
+        'nombre': 'Zapatilla roja', 'precio': 30.0, 'cantidad': 2, 'categoria_id': 1
+    }).get_json()['id']
+    assert nombres(cliente, 'zapa') == ['Zapatilla roja']
+    assert cliente.patch('/productos/%d' % id, json={'nombre': 'Sandalia roja'}).status_code == 200
+    assert nombres(cliente, 'zapatilla') == []
+    assert nombres(cliente, 'roja sand') == ['Sandalia roja']
+    assert cliente.put('/productos/%d' % id, json={'nombre': 'Bota'}).status_code == 200
+    assert nombres(cliente, 'sandalia') == []
+    assert nombres(cliente, 'bota') == ['Bota']
+    assert cliente.delete('/productos/%d' % id).status_code == 200
+    assert nombres(cliente, 'bota') == []
+
+
+def test_sql_mientras_se_construye_el_indice(crear_app, base_de_datos_en_fichero, monkeypatch):
+    app = crear_app(SQLALCHEMY_DATABASE_URI=base_de_datos_en_fichero, SEARCH_INDEX_BACKGROUND=True)
+    cliente = app.test_client()
+    seguir = threading.Event()
+    cargar = IndiceInvertido.cargar
+
+    def cargar_despacio(indice, filas, **opciones):
+        seguir.wait(10)
+        cargar(indice, filas, **opciones)
+    monkeypatch.setattr(IndiceInvertido, 'cargar', cargar_despacio)
+
+    respuesta = cliente.get('/productos/search?q=product&limit=5').get_json()
+    assert respuesta['total'] == 25
+    assert [p['id'] for p in respuesta['items']] == [1, 2, 3, 4, 5]
+    hilo, = buscador.construcciones.values()
+    # Las escrituras no esperan a la construcción del índice
+    with app.app_context():
+        token = create_access_token(identity='1')
+    respuesta = cliente.patch('/productos/1', json={'nombre': 'camiseta azul'},
+                              headers={'Authorization': 'Bearer ' + token})
+    assert respuesta.status_code == 200
+    assert nombres(cliente, 'camiseta') == ['camiseta azul']
+    seguir.set()
+    hilo.join(10)
+    assert not buscador.construcciones
+    assert nombres(cliente, 'camiseta az') == ['camiseta azul']
+    assert len(nombres(cliente, 'producto')) == 24
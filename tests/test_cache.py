@@ -0,0 +1,34 @@
+import gzip
+import json
+from sqlalchemy import create_engine, text
+
+
+def escribir_desde_otro_proceso(url, nombre):
+    # Lo que hace otro proceso: su commit incrementa versiones_tabla, pero no
+    # la versión del espacio de la caché en memoria de este
+    engine = create_engine(url)
+    with engine.begin() as conexion:
+        conexion.execute(text('UPDATE productos SET nombre = :nombre WHERE id = 1'), {'nombre': nombre})
+        conexion.execute(text("UPDATE versiones_tabla SET version = version + 1 WHERE tabla = 'productos'"))
+    engine.dispose()
+
+
+def primer_nombre(respuesta):
+    datos = respuesta.get_data()
+    if respuesta.headers.get('Content-Encoding') == 'gzip':
+        datos = gzip.decompress(datos)
+    return json.loads(datos)['items'][0]['nombre']
+
+
+def test_cuerpo_cacheado_sigue_a_las_versiones_compartidas(crear_app, tmp_path):
+    url = 'sqlite:///%s' % (tmp_path / 'recursoapi.db')
+    app = crear_app(SQLALCHEMY_DATABASE_URI=url, CACHE_TYPE='memory', COMPRESSION_MIN_SIZE=0)
+    cliente = app.test_client()
+    for cabeceras in ({}, {'Accept-Encoding': 'gzip'}):
+        antes = cliente.get('/productos?limit=1', headers=cabeceras)
+        assert primer_nombre(antes) == 'producto-0'
+    escribir_desde_otro_proceso(url, 'renombrado')
+    for cabeceras in ({}, {'Accept-Encoding': 'gzip'}):
+        despues = cliente.get('/productos?limit=1', headers=cabeceras)
+        assert primer_nombre(despues) == 'renombrado'
+        assert despues.get_etag() != antes.get_etag()
@@ -0,0 +1,64 @@
+# Número de sentencias SQL por petición: los listados y los detalles no pueden
+# hacer una consulta por fila (carga perezosa de la categoría de cada producto)
+from contextlib import contextmanager
+import pytest
+from sqlalchemy import event
+from config import db
+
+# Una sentencia para las versiones de las tablas (ETag) o el sello de la fila,
+# y otra para los datos
+RUTAS_LECTURA = [
+    '/productos',
+    '/productos?limit=100',
+    '/productos?fields=nombre,categoria',
+    '/productos?stream=1',
+    '/productos?categoria_id=1&sort=-precio',
+    '/productos/1',
+    '/categorias',
+    '/categorias/1',
+    '/usuarios',
+]
+
+
+@contextmanager
+def sentencias(app):
+    enviadas = []
+
+    def antes_de_ejecutar(conexion, cursor, sentencia, parametros, contexto, varias):
+        enviadas.append(sentencia)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', antes_de_ejecutar)
+    try:
+        yield enviadas
+    finally:
+        event.remove(engine, 'before_cursor_execute', antes_de_ejecutar)
+
+
+def contar(app, cliente, url):
+    with sentencias(app) as enviadas:
+        respuesta = cliente.get(url)
+        respuesta.get_data()
+    assert respuesta.status_code == 200, respuesta.get_data(as_text=True)
+    return len(enviadas)
+
+
+@pytest.mark.parametrize('url', RUTAS_LECTURA)
+def test_lecturas_con_numero_fijo_de_sentencias(crear_app, url):
+    cuentas = []
+    for productos in (5, 60):
+        app = crear_app(productos=productos)
+        cuentas.append(contar(app, app.test_client(), url))
+    assert cuentas == [2, 2]
+
+
+def test_crear_producto_lee_una_sola_vez(app, cliente):
+    with sentencias(app) as enviadas:
+        respuesta = cliente.post('/productos', json={
+            'nombre': 'nuevo', 'precio': 2.5, 'cantidad': 3, 'categoria_id': 1
+        })
+    assert respuesta.status_code == 201
+    assert respuesta.get_json()['categoria']['id'] == 1
+    lecturas = [s for s in enviadas if s.lstrip().upper().startswith('SELECT')]
+    assert len(lecturas) == 1, lecturas
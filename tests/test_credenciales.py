@@ -0,0 +1,139 @@
+import pytest
+from sqlalchemy import insert
+from config import credenciales, db
+from models import Usuario
+from tests.test_consultas import sentencias
+from utils.credenciales import FiltroBloom, normalizar_email
+from utils.versiones import ahora
+
+
+def registrar(cliente, email, nombre='ana', password='secreta123'):
+    return cliente.post('/registrar', json={'nombre': nombre, 'email': email, 'password': password})
+
+
+def consultas_de_email(enviadas):
+    # Las comprobaciones de email registrado del registro (no las del filtro)
+    return [s for s in enviadas if 'WHERE usuarios.email_normalizado' in s]
+
+
+def filtro_actual():
+    return next(iter(credenciales.filtros.values()))
+
+
+@pytest.fixture
+def app(crear_app):
+    # Sin sincronizaciones durante el test: el filtro solo cambia con los commits
+    return crear_app(CREDENTIALS_SYNC_INTERVAL=3600)
+
+
+# ------------------------- FILTRO DE BLOOM -------------------------
+def test_filtro_sin_falsos_negativos_y_con_pocos_falsos_positivos():
+    filtro = FiltroBloom(1000, 0.01)
+    claves = ['usuario-%d@correo.com' % i for i in range(1000)]
+    for clave in claves:
+        filtro.anadir(clave)
+    assert all(clave in filtro for clave in claves)
+    assert 990 <= len(filtro) <= 1000
+    falsos = sum('otro-%d@correo.com' % i in filtro for i in range(10000))
+    assert falsos < 300
+
+
+def test_filtro_lleno_por_altas_o_por_bajas():
+    filtro = FiltroBloom(100)
+    assert not filtro.lleno()
+    filtro.bajas = 11
+    assert filtro.lleno()
+    filtro = FiltroBloom(10)
+    for i in range(20):
+        filtro.anadir('usuario-%d' % i)
+    assert filtro.lleno()
+
+
+def test_normalizar_email():
+    assert normalizar_email('  Ana@Correo.COM ') == 'ana@correo.com'
+    assert normalizar_email(None) is None
+
+
+# ------------------------- REGISTRO -------------------------
+def test_registro_no_consulta_el_email_si_el_filtro_no_lo_conoce(app):
+    cliente = app.test_client()
+    assert registrar(cliente, 'primero@correo.com').status_code == 201
+    with sentencias(app) as enviadas:
+        assert registrar(cliente, 'ana@correo.com').status_code == 201
+    assert consultas_de_email(enviadas) == []
+    assert 'ana@correo.com' in filtro_actual()
+
+
+def test_registro_duplicado_se_comprueba_antes_del_insert(app):
+    cliente = app.test_client()
+    assert registrar(cliente, 'Ana@Correo.com').status_code == 201
+    with sentencias(app) as enviadas:
+        respuesta = registrar(cliente, '  ANA@correo.COM ')
+    assert respuesta.status_code == 400
+    assert respuesta.get_json() == {'msg': 'El usuario ya existe'}
+    assert len(consultas_de_email(enviadas)) == 1
+    assert not [s for s in enviadas if s.startswith('INSERT INTO usuarios')]
+
+
+def test_registro_duplicado_que_el_filtro_no_conoce(app):
+    # Alta hecha en otro proceso: no pasa por el filtro de este
+    cliente = app.test_client()
+    assert registrar(cliente, 'primero@correo.com').status_code == 201
+    with app.app_context():
+        db.session.execute(insert(Usuario).values(
+            nombre='ana', email='ana@correo.com', email_normalizado='ana@correo.com',
+            password='x', updated_at=ahora()
+        ))
+        db.session.commit()
+    assert 'ana@correo.com' not in filtro_actual()
+    with sentencias(app) as enviadas:
+        respuesta = registrar(cliente, 'Ana@Correo.com')
+    # El índice único rechaza el INSERT y la consulta de después lo confirma
+    assert respuesta.status_code == 400
+    assert respuesta.get_json() == {'msg': 'El usuario ya existe'}
+    assert [s for s in enviadas if s.startswith('INSERT INTO usuarios')]
+    assert len(consultas_de_email(enviadas)) == 1
+    assert 'ana@correo.com' in filtro_actual()
+    with app.app_context():
+        assert db.session.scalar(db.select(db.func.count(Usuario.id))) == 2
+
+
+def test_falso_positivo_del_filtro(app, monkeypatch):
+    cliente = app.test_client()
+    assert registrar(cliente, 'primero@correo.com').status_code == 201
+    # El filtro dice "puede existir" para cualquier email
+    monkeypatch.setattr(FiltroBloom, '__contains__', lambda filtro, clave: True)
+    with sentencias(app) as enviadas:
+        assert registrar(cliente, 'ana@correo.com').status_code == 201
+    assert len(consultas_de_email(enviadas)) == 1
+    assert cliente.post('/login', json={'email': 'ana@correo.com', 'password': 'secreta123'}).status_code == 200
+
+
+def test_registro_sin_filtro(crear_app):
+    app = crear_app(CREDENTIALS_FILTER=False)
+    cliente = app.test_client()
+    assert registrar(cliente, 'ana@correo.com').status_code == 201
+    assert registrar(cliente, 'ANA@correo.com').status_code == 400
+    assert credenciales.filtros == {}
+
+
+# ------------------------- LOGIN -------------------------
+@pytest.mark.parametrize('email', ['ana@correo.com', 'ANA@Correo.com', '  Ana@Correo.COM  '])
+def test_login_por_email_normalizado(app, email):
+    cliente = app.test_client()
+    assert registrar(cliente, 'Ana@Correo.com').status_code == 201
+    respuesta = cliente.post('/login', json={'email': email, 'password': 'secreta123'})
+    assert respuesta.status_code == 200
+    assert set(respuesta.get_json()) == {'access_token', 'refresh_token'}
+    assert cliente.post('/login', json={'email': email, 'password': 'otra'}).status_code == 401
+    assert cliente.post('/login', json={'email': 'otra@correo.com', 'password': 'secreta123'}).status_code == 401
+
+
+@pytest.mark.anyio
+async def test_registro_y_login_asgi(cliente_asgi):
+    datos = {'nombre': 'ana', 'email': 'Ana@Correo.com', 'password': 'secreta123'}
+    assert (await cliente_asgi.post('/registrar', json=datos)).status_code == 201
+    respuesta = await cliente_asgi.post('/registrar', json={**datos, 'email': ' ana@CORREO.com'})
+    assert respuesta.status_code == 400
+    respuesta = await cliente_asgi.post('/login', json={'email': 'ANA@correo.com ', 'password': 'secreta123'})
+    assert respuesta.status_code == 200
@@ -0,0 +1,24 @@
+from config import eventos
+
+
+def test_head_no_ocupa_conexion(crear_app):
+    app = crear_app(STREAM_MAX_CLIENTS=1)
+    cliente = app.test_client()
+    for _ in range(3):
+        respuesta = cliente.head('/stream/productos')
+        assert respuesta.status_code == 200
+        assert respuesta.mimetype == 'text/event-stream'
+        assert eventos.clientes == 0
+
+
+def test_conexion_liberada_sin_leer_el_cuerpo(crear_app):
+    # El servidor WSGI cierra la respuesta aunque el generador no haya empezado
+    app = crear_app(STREAM_MAX_CLIENTS=1)
+    cliente = app.test_client()
+    for _ in range(3):
+        respuesta = cliente.get('/stream/productos', buffered=False)
+        assert eventos.clientes == 1
+        assert cliente.get('/stream/productos').status_code == 503
+        respuesta.close()
+        respuesta.close()
+        assert eventos.clientes == 0
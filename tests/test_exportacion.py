@@ -0,0 +1,115 @@
+import csv
+import io
+import json
+import pytest
+from flask_jwt_extended import create_access_token
+from config import db
+from models import Producto, Trabajo
+
+COLUMNAS = ['id', 'nombre', 'precio', 'cantidad', 'version', 'categoria_id', 'categoria']
+
+
+def esperado(app):
+    # Filas de GET /productos/export, leídas de la base de datos
+    with app.app_context():
+        return [
+            {'id': p.id, 'nombre': p.nombre, 'precio': p.precio, 'cantidad': p.cantidad, 'version': p.version,
+             'categoria_id': p.categoria_id, 'categoria': p.categoria.nombre}
+            for p in db.session.scalars(db.select(Producto).order_by(Producto.id))
+        ]
+
+
+def exportar(cliente, formato):
+    # Cuerpo completo y número de trozos en que se ha enviado
+    respuesta = cliente.get('/productos/export?format=' + formato, buffered=False)
+    assert respuesta.status_code == 200
+    assert respuesta.is_streamed
+    trozos = [trozo for trozo in respuesta.response if trozo]
+    respuesta.close()
+    return respuesta, b''.join(trozos), len(trozos)
+
+
+def cliente_importacion(app):
+    # Cliente con token: la importación encola un trabajo del usuario 1
+    cliente = app.test_client()
+    with app.app_context():
+        cliente.environ_base['HTTP_AUTHORIZATION'] = 'Bearer ' + create_access_token(identity='1')
+    return cliente
+
+
+@pytest.fixture
+def app(crear_app):
+    # Lotes de 10 filas: las 25 se envían en varios trozos
+    return crear_app(EXPORT_BATCH_SIZE=10, EXPORT_ROW_GROUP_SIZE=10)
+
+
+def test_exportar_csv(app, cliente):
+    respuesta, cuerpo, trozos = exportar(cliente, 'csv')
+    assert respuesta.mimetype == 'text/csv'
+    assert respuesta.headers['Content-Disposition'] == 'attachment; filename="productos.csv"'
+    lector = csv.DictReader(io.StringIO(cuerpo.decode('utf-8')))
+    assert lector.fieldnames == COLUMNAS
+    tipos = {'id': int, 'precio': float, 'cantidad': int, 'version': int, 'categoria_id': int}
+    filas = [{c: tipos.get(c, str)(v) for c, v in fila.items()} for fila in lector]
+    assert filas == esperado(app)
+    assert trozos == 3
+
+
+def test_exportar_ndjson(app, cliente):
+    respuesta, cuerpo, trozos = exportar(cliente, 'ndjson')
+    assert respuesta.mimetype == 'application/x-ndjson'
+    assert cuerpo.endswith(b'\n')
+    filas = [json.loads(linea) for linea in cuerpo.decode('utf-8').splitlines()]
+    assert filas == esperado(app)
+    assert all(list(fila) == COLUMNAS for fila in filas)
+    assert trozos == 3
+
+
+def test_exportar_parquet(app, cliente):
+    parquet = pytest.importorskip('pyarrow.parquet')
+    respuesta, cuerpo, trozos = exportar(cliente, 'parquet')
+    assert respuesta.mimetype == 'application/vnd.apache.parquet'
+    fichero = parquet.ParquetFile(io.BytesIO(cuerpo))
+    assert fichero.schema_arrow.names == COLUMNAS
+    assert fichero.metadata.num_row_groups == 3
+    assert fichero.read().to_pylist() == esperado(app)
+    # Un trozo por row group y el pie del fichero
+    assert trozos == 4
+
+
+def test_exportar_con_filtro_y_parametros_no_validos(app, cliente):
+    assert cliente.get('/productos/export?format=xml').status_code == 400
+    assert cliente.get('/productos/export?format=csv&categoria_id=x').status_code == 400
+    # Los filtros no finitos tampoco se aceptan
+    for valor in ('nan', 'inf', '-Infinity'):
+        assert cliente.get('/productos/export?precio_min=' + valor).status_code == 400
+    respuesta = cliente.get('/productos/export?format=csv&categoria_id=2')
+    ids = [int(fila['id']) for fila in csv.DictReader(io.StringIO(respuesta.get_data(as_text=True)))]
+    assert ids == [p['id'] for p in esperado(app) if p['categoria_id'] == 2]
+
+
+def test_el_csv_exportado_se_vuelve_a_importar(crear_app, tmp_path):
+    app = crear_app(JOBS_POOL_TYPE='inline', JOBS_DIR=str(tmp_path))
+    cliente = cliente_importacion(app)
+    exportado = cliente.get('/productos/export?format=csv').get_data()
+    respuesta = cliente.post('/jobs/import-productos', data=exportado, content_type='text/csv')
+    assert respuesta.status_code == 202
+    trabajo = cliente.get(respuesta.headers['Location']).get_json()
+    assert (trabajo['estado'], trabajo['correctos'], trabajo['fallidos']) == ('completado', 25, 0)
+    filas = esperado(app)
+    assert [(f['nombre'], f['precio'], f['cantidad'], f['categoria_id']) for f in filas[25:]] == \
+           [(f['nombre'], f['precio'], f['cantidad'], f['categoria_id']) for f in filas[:25]]
+
+
+@pytest.mark.parametrize('precio', ['nan', 'inf', '-Infinity'])
+def test_la_importacion_rechaza_precios_no_finitos(crear_app, tmp_path, precio):
+    app = crear_app(productos=0, JOBS_POOL_TYPE='inline', JOBS_DIR=str(tmp_path))
+    cliente = cliente_importacion(app)
+    datos = 'nombre,precio,cantidad,categoria_id\nbueno,2.5,1,1\nmalo,%s,1,1\n' % precio
+    respuesta = cliente.post('/jobs/import-productos', data=datos, content_type='text/csv')
+    trabajo = cliente.get(respuesta.headers['Location']).get_json()
+    assert (trabajo['correctos'], trabajo['fallidos']) == (1, 1)
+    assert trabajo['errores'] == [{'linea': 3, 'status': 400, 'msg': 'Valor no válido para precio'}]
+    with app.app_context():
+        assert db.session.scalars(db.select(Producto.nombre)).all() == ['bueno']
+        assert db.session.scalar(db.select(db.func.count(Trabajo.id))) == 1
@@ -0,0 +1,17 @@
+import pytest
+
+
+@pytest.mark.parametrize('ruta', ['/productos', '/productos/export'])
+@pytest.mark.parametrize('filtro', [
+    'precio_min=barato', 'precio_max=nan', 'precio_min=inf', 'cantidad_min=1.5', 'categoria_id=uno'
+])
+def test_filtro_no_numerico(cliente, ruta, filtro):
+    respuesta = cliente.get('%s?%s' % (ruta, filtro))
+    assert respuesta.status_code == 400
+    assert respuesta.get_json()['msg'].startswith('Filtro no válido')
+
+
+def test_filtros_numericos(cliente):
+    respuesta = cliente.get('/productos?precio_min=3&precio_max=6.0&cantidad_min=&categoria_id=1')
+    assert respuesta.status_code == 200
+    assert [p['precio'] for p in respuesta.get_json()] == [4.5]
@@ -0,0 +1,48 @@
+import asyncio
+import time
+import pytest
+from flask_jwt_extended import create_access_token
+from tests.conftest import abrir_cliente_asgi
+
+# Dos peticiones seguidas por usuario; el cubo recupera un token cada medio segundo
+LIMITES_TESTS = {
+    'RATE_LIMIT_ENABLED': True,
+    'RATE_LIMITS': {'actualizar_producto:usuario': '2/second'},
+    'JWT_IDENTITY_CLAIM': 'usuario',
+}
+
+
+def cabecera(app, identidad):
+    with app.app_context():
+        return {'Authorization': 'Bearer ' + create_access_token(identity=identidad)}
+
+
+def test_cubo_vacio_y_recarga(crear_app):
+    app = crear_app(**LIMITES_TESTS)
+    cliente = app.test_client()
+    uno, dos = cabecera(app, '1'), cabecera(app, '2')
+    for _ in range(2):
+        assert cliente.put('/productos/1', json={'cantidad': 5}, headers=uno).status_code == 200
+    respuesta = cliente.put('/productos/1', json={'cantidad': 5}, headers=uno)
+    assert respuesta.status_code == 429
+    assert respuesta.headers['Retry-After'] == '1'
+    # Cada usuario tiene su cubo (por JWT_IDENTITY_CLAIM)
+    assert cliente.put('/productos/1', json={'cantidad': 5}, headers=dos).status_code == 200
+    time.sleep(0.6)
+    assert cliente.put('/productos/1', json={'cantidad': 5}, headers=uno).status_code == 200
+    assert cliente.put('/productos/1', json={'cantidad': 5}, headers=uno).status_code == 429
+
+
+@pytest.mark.anyio
+async def test_cubo_vacio_y_recarga_asgi(crear_app, base_de_datos_en_fichero):
+    app = crear_app(SQLALCHEMY_DATABASE_URI=base_de_datos_en_fichero, **LIMITES_TESTS)
+    async with abrir_cliente_asgi(app) as cliente:
+        for _ in range(2):
+            assert (await cliente.put('/productos/1', json={'cantidad': 5})).status_code == 200
+        respuesta = await cliente.put('/productos/1', json={'cantidad': 5})
+        assert respuesta.status_code == 429
+        assert respuesta.headers['Retry-After'] == '1'
+        otro = await cliente.put('/productos/1', json={'cantidad': 5}, headers=cabecera(app, '2'))
+        assert otro.status_code == 200
+        await asyncio.sleep(0.6)
+        assert (await cliente.put('/productos/1', json={'cantidad': 5})).status_code == 200
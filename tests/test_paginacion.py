@@ -0,0 +1,61 @@
+import pytest
+from utils.paginacion import codificar_cursor
+
+
+@pytest.mark.parametrize('sort, valores', [
+    ('id', '5'),
+    ('id', True),
+    ('id', 1.5),
+    ('precio', ['1.5', 3]),
+    ('precio', [float('nan'), 3]),
+    ('precio', [1.5, '3']),
+    ('cantidad', [2.5, 3]),
+    ('nombre', [7, 3]),
+    ('nombre', [None, 3]),
+])
+def test_cursor_con_valores_de_otro_tipo(cliente, sort, valores):
+    respuesta = cliente.get('/productos?sort=%s&after=%s' % (sort, codificar_cursor(valores)))
+    assert respuesta.status_code == 400
+
+
+def test_cursor_de_la_pagina_anterior(cliente):
+    vistos = []
+    url = '/productos?sort=-precio&limit=10'
+    while url:
+        pagina = cliente.get(url).get_json()
+        vistos += [p['id'] for p in pagina['items']]
+        siguiente = pagina['next_cursor']
+        url = siguiente and '/productos?sort=-precio&limit=10&after=' + siguiente
+    assert sorted(vistos) == list(range(1, 26))
+
+
+RUTAS_PAGINADAS = ['/productos', '/usuarios', '/categorias', '/productos/search?q=producto&']
+
+
+def con_limite(ruta, limite):
+    return ruta + ('' if ruta.endswith('&') else '?') + 'limit=' + limite
+
+
+@pytest.mark.parametrize('ruta', RUTAS_PAGINADAS)
+@pytest.mark.parametrize('limite', ['abc', '1.5', '0', '-5'])
+def test_limite_no_valido(cliente, ruta, limite):
+    respuesta = cliente.get(con_limite(ruta, limite))
+    assert respuesta.status_code == 400
+    assert respuesta.get_json() == {'msg': 'Valor no válido para limit'}
+
+
+def test_limite_valido(cliente):
+    cuerpo = cliente.get('/productos?limit=2').get_json()
+    assert len(cuerpo['items']) == 2 and cuerpo['next_cursor']
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize('ruta', ['/productos', '/usuarios', '/categorias'])
+async def test_limite_no_valido_asgi(cliente_asgi, ruta):
+    for limite in ('abc', '0', '-5'):
+        respuesta = await cliente_asgi.get(con_limite(ruta, limite))
+        assert respuesta.status_code == 400
+        assert respuesta.json() == {'msg': 'Valor no válido para limit'}
+    respuesta = await cliente_asgi.get(con_limite(ruta, '2'))
+    assert respuesta.status_code == 200
+    assert len(respuesta.json()['items']) <= 2
@@ -0,0 +1,33 @@
+from tests.test_consultas import sentencias
+
+
+def test_patch_sin_resumen_en_un_solo_update(app, cliente):
+    with sentencias(app) as enviadas:
+        respuesta = cliente.patch('/productos/1', json={'precio': 99.5})
+    assert respuesta.status_code == 200
+    assert respuesta.get_json()['precio'] == 99.5
+    # El UPDATE ... RETURNING y el incremento de versiones_tabla
+    assert len(enviadas) == 2, enviadas
+    assert enviadas[0].lstrip().upper().startswith('UPDATE PRODUCTOS')
+
+
+def test_patch_sin_cambios_no_escribe(cliente):
+    antes = cliente.get('/productos/1')
+    producto = antes.get_json()
+    respuesta = cliente.patch('/productos/1', json={'precio': producto['precio'], 'nombre': producto['nombre']})
+    assert respuesta.status_code == 200
+    assert respuesta.get_json()['version'] == producto['version']
+    despues = cliente.get('/productos/1')
+    assert despues.get_json()['version'] == producto['version']
+    assert despues.headers['ETag'] == antes.headers['ETag']
+    assert cliente.get('/productos/1', headers={'If-None-Match': antes.headers['ETag']}).status_code == 304
+
+
+def test_patch_version_antigua_o_producto_inexistente(cliente):
+    version = cliente.get('/productos/1').get_json()['version']
+    assert cliente.patch('/productos/1', json={'cantidad': 7, 'version': version}).status_code == 200
+    respuesta = cliente.patch('/productos/1', json={'cantidad': 8, 'version': version})
+    assert respuesta.status_code == 409
+    assert respuesta.get_json()['version'] == version + 1
+    assert cliente.patch('/productos/999', json={'cantidad': 8}).status_code == 404
+    assert cliente.patch('/productos/999', json={}).status_code == 404
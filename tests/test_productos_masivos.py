@@ -0,0 +1,7 @@
+def test_eliminar_id_repetido(cliente):
+    respuesta = cliente.delete('/productos/bulk', json=[3, 4, 3, 99])
+    cuerpo = respuesta.get_json()
+    estados = [(r['indice'], r['status']) for r in cuerpo['resultados']]
+    assert estados == [(0, 200), (1, 200), (2, 400), (3, 404)]
+    assert cliente.get('/productos/3').status_code == 404
+    assert cliente.get('/productos/4').status_code == 404
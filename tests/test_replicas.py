@@ -0,0 +1,130 @@
+# Dos bases de datos SQLite en fichero: la primaria y una copia como réplica
+import shutil
+import sqlite3
+import time
+from contextlib import contextmanager
+import pytest
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+from config import replicas
+
+
+@pytest.fixture
+def app_replica(crear_app, tmp_path):
+    primaria, replica = tmp_path / 'primaria.db', tmp_path / 'replica.db'
+    # La réplica se crea al copiar la primaria ya sembrada
+    replica.touch()
+    app = crear_app(
+        SQLALCHEMY_DATABASE_URI='sqlite:///%s' % primaria,
+        SQLALCHEMY_REPLICA_URIS=['sqlite:///%s' % replica],
+        REPLICA_MAX_LAG=0,
+        REPLICA_STICKY_SECONDS=60,
+    )
+    shutil.copy(primaria, replica)
+    # Solo en la réplica, para saber de dónde sale cada respuesta
+    with sqlite3.connect(replica) as conexion:
+        conexion.execute("UPDATE productos SET nombre = 'leido-de-replica' WHERE id = 1")
+    # Las comprobaciones se hacen a mano, no en segundo plano
+    replicas.proxima_comprobacion = time.monotonic() + 3600
+    comprobar(app)
+    return app
+
+
+def cliente_con_token(app):
+    # replicas es una sola extensión: otra aplicación en el mismo test (como la
+    # del fixture cliente) le cambiaría la configuración
+    with app.app_context():
+        token = create_access_token(identity='1')
+    cliente = app.test_client()
+    cliente.environ_base['HTTP_AUTHORIZATION'] = 'Bearer ' + token
+    return cliente
+
+
+def comprobar(app):
+    with app.app_context():
+        return replicas.comprobar()
+
+
+def comprobar_estado(app):
+    # Estado de la réplica sin volver a comprobarla
+    with app.app_context():
+        return replicas.estadisticas()['replicas'][0]
+
+
+@contextmanager
+def motores_usados(app):
+    usados = []
+    with app.app_context():
+        motores = app.extensions['sqlalchemy'].engines
+    oyentes = []
+    for nombre, motor in motores.items():
+        def anotar(*args, nombre=nombre):
+            usados.append(nombre or 'primaria')
+        event.listen(motor, 'before_cursor_execute', anotar)
+        oyentes.append((motor, anotar))
+    try:
+        yield usados
+    finally:
+        for motor, anotar in oyentes:
+            event.remove(motor, 'before_cursor_execute', anotar)
+
+
+def leer(app, cliente, url='/productos/1'):
+    with motores_usados(app) as usados:
+        respuesta = cliente.get(url)
+    assert respuesta.status_code == 200
+    return respuesta.get_json(), set(usados)
+
+
+def test_lecturas_a_la_replica(app_replica):
+    cliente = app_replica.test_client()
+    producto, usados = leer(app_replica, cliente)
+    assert producto['nombre'] == 'leido-de-replica'
+    assert usados == {'replica-0'}
+    _, usados = leer(app_replica, cliente, '/productos?limit=5')
+    assert usados == {'replica-0'}
+
+
+def test_escritura_y_lectura_de_lo_escrito_en_la_primaria(app_replica):
+    cliente_replica = cliente_con_token(app_replica)
+    with motores_usados(app_replica) as usados:
+        respuesta = cliente_replica.patch('/productos/2', json={'cantidad': 50})
+    assert respuesta.status_code == 200
+    assert set(usados) == {'primaria'}
+    # La cookie manda las lecturas del mismo cliente a la primaria
+    assert cliente_replica.get_cookie('leer_primaria') is not None
+    producto, usados = leer(app_replica, cliente_replica)
+    assert producto['nombre'] == 'producto-0'
+    assert usados == {'primaria'}
+    # Otro cliente sigue leyendo de la réplica
+    _, usados = leer(app_replica, app_replica.test_client())
+    assert usados == {'replica-0'}
+
+
+def test_replica_atrasada_o_con_errores(app_replica):
+    cliente_replica = cliente_con_token(app_replica)
+    cliente_replica.patch('/productos/2', json={'cantidad': 50})
+    # La réplica no ha recibido la escritura: con REPLICA_MAX_LAG=0 se retira
+    estado, = comprobar(app_replica)['replicas']
+    assert not estado['sana'] and estado['error'].startswith('Retraso')
+    producto, usados = leer(app_replica, app_replica.test_client())
+    assert usados == {'primaria'} and producto['nombre'] == 'producto-0'
+
+    # Al día otra vez, vuelve a recibir lecturas
+    primaria = app_replica.config['SQLALCHEMY_DATABASE_URI'].removeprefix('sqlite:///')
+    replica = app_replica.config['SQLALCHEMY_REPLICA_URIS'][0].removeprefix('sqlite:///')
+    with sqlite3.connect(replica) as conexion:
+        conexion.execute('ATTACH DATABASE ? AS primaria', (primaria,))
+        conexion.execute('DELETE FROM versiones_tabla')
+        conexion.execute('INSERT INTO versiones_tabla SELECT * FROM primaria.versiones_tabla')
+    assert comprobar(app_replica)['replicas'][0]['sana']
+    _, usados = leer(app_replica, app_replica.test_client())
+    assert usados == {'replica-0'}
+
+    # Un error de la réplica al leer la retira; la siguiente lectura va a la primaria
+    with sqlite3.connect(replica) as conexion:
+        conexion.execute('DROP TABLE productos')
+    app_replica.test_client().get('/productos/1')
+    assert not comprobar_estado(app_replica)['sana']
+    producto, usados = leer(app_replica, app_replica.test_client())
+    assert usados == {'primaria'} and producto['id'] == 1
@@ -0,0 +1,45 @@
+from flask_jwt_extended import create_access_token
+from sqlalchemy import delete, func, select
+from config import db
+from models import Producto, ResumenCategoria
+
+
+def estadisticas(app, cliente, fuente):
+    app.config['STATS_SOURCE'] = fuente
+    return cliente.get('/stats/inventario').get_json()
+
+
+def escribir(cliente):
+    assert cliente.post('/productos', json={
+        'nombre': 'nuevo', 'precio': 9.5, 'cantidad': 4, 'categoria_id': 2
+    }).status_code == 201
+    assert cliente.patch('/productos/1', json={'precio': 100.0, 'categoria_id': 3}).status_code == 200
+    assert cliente.delete('/productos/bulk', json=[5, 6]).status_code == 200
+    assert cliente.post('/productos/2/stock', json={'delta': -1}).status_code == 200
+
+
+def test_resumen_igual_que_la_consulta(crear_app):
+    app = crear_app(STATS_SOURCE='summary')
+    cliente = app.test_client()
+    with app.app_context():
+        cliente.environ_base['HTTP_AUTHORIZATION'] = 'Bearer ' + create_access_token(identity='1')
+    escribir(cliente)
+    assert estadisticas(app, cliente, 'summary') == estadisticas(app, cliente, 'query')
+
+
+def test_resumen_creado_con_upsert(crear_app):
+    app = crear_app(STATS_SOURCE='summary')
+    with app.app_context():
+        db.session.execute(delete(ResumenCategoria))
+        db.session.commit()
+        db.session.add(Producto(nombre='nuevo', precio=2.0, cantidad=5, categoria_id=1))
+        db.session.commit()
+        fila = db.session.get(ResumenCategoria, 1)
+        total = db.session.scalar(select(func.count()).where(Producto.categoria_id == 1))
+        assert (fila.productos, fila.precio_max) == (total, 36.0)
+
+
+def test_sin_resumen_con_stats_source_query(app, cliente):
+    escribir(cliente)
+    with app.app_context():
+        assert db.session.scalar(select(func.count()).select_from(ResumenCategoria)) == 0
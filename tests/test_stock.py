@@ -0,0 +1,58 @@
+import pytest
+
+
+def test_ajuste_no_deja_stock_negativo(cliente):
+    # producto 3: cantidad 2
+    respuesta = cliente.post('/productos/3/stock', json={'delta': -2})
+    assert respuesta.status_code == 200
+    version = respuesta.get_json()['version']
+    assert respuesta.get_json()['cantidad'] == 0
+    respuesta = cliente.post('/productos/3/stock', json={'delta': -1})
+    assert respuesta.status_code == 409
+    assert respuesta.get_json() == {'msg': 'Stock insuficiente', 'cantidad': 0}
+    assert cliente.get('/productos/3').get_json()['version'] == version
+    assert cliente.post('/productos/999/stock', json={'delta': 1}).status_code == 404
+    assert cliente.post('/productos/3/stock', json={'delta': 0}).status_code == 400
+
+
+def test_pedido_todo_o_nada(cliente):
+    respuesta = cliente.post('/productos/stock', json=[{'id': 2, 'delta': -1}, {'id': 3, 'delta': -5}])
+    assert respuesta.status_code == 409
+    assert respuesta.get_json()['errores'] == [
+        {'id': 3, 'status': 409, 'msg': 'Stock insuficiente', 'cantidad': 2}
+    ]
+    assert cliente.get('/productos/2').get_json()['cantidad'] == 1
+
+
+def test_put_con_version_antigua(cliente):
+    version = cliente.get('/productos/1').get_json()['version']
+    assert cliente.put('/productos/1', json={'precio': 3.0, 'version': version}).status_code == 200
+    respuesta = cliente.put('/productos/1', json={'precio': 4.0, 'version': version})
+    assert respuesta.status_code == 409
+    assert respuesta.get_json()['version'] == version + 1
+    assert cliente.get('/productos/1').get_json()['precio'] == 3.0
+
+
+def test_delete_con_version_antigua(cliente):
+    version = cliente.get('/productos/1').get_json()['version']
+    cliente.post('/productos/1/stock', json={'delta': 1})
+    respuesta = cliente.delete('/productos/1?version=%d' % version)
+    assert respuesta.status_code == 409
+    assert respuesta.get_json()['version'] == version + 1
+    assert cliente.delete('/productos/1?version=uno').status_code == 400
+    assert cliente.get('/productos/1').status_code == 200
+    assert cliente.delete('/productos/1?version=%d' % (version + 1)).status_code == 200
+    assert cliente.get('/productos/1').status_code == 404
+
+
+@pytest.mark.anyio
+async def test_version_antigua_asgi(cliente_asgi):
+    version = (await cliente_asgi.get('/productos/1')).json()['version']
+    assert (await cliente_asgi.put('/productos/1', json={'precio': 3.0, 'version': version})).status_code == 200
+    respuesta = await cliente_asgi.put('/productos/1', json={'precio': 4.0, 'version': version})
+    assert respuesta.status_code == 409
+    respuesta = await cliente_asgi.delete('/productos/1?version=%d' % version)
+    assert respuesta.status_code == 409
+    assert respuesta.json()['version'] == version + 1
+    assert (await cliente_asgi.delete('/productos/1?version=uno')).status_code == 400
+    assert (await cliente_asgi.delete('/productos/1?version=%d' % (version + 1))).status_code == 200
@@ -0,0 +1,114 @@
+from datetime import timedelta
+import pytest
+from flask_jwt_extended import create_access_token
+from config import db, trabajos
+from controllers.controllers import fila_importacion
+from models import Trabajo
+from utils.versiones import ahora
+
+
+def test_trabajo_solo_visible_para_quien_lo_encolo(app, cliente):
+    with app.app_context():
+        trabajo = Trabajo(tipo='import-productos', estado='completado', usuario_id=1)
+        db.session.add(trabajo)
+        db.session.commit()
+        id = trabajo.id
+        otro = create_access_token(identity='2')
+    assert cliente.get('/jobs/%d' % id).status_code == 200
+    respuesta = cliente.get('/jobs/%d' % id, headers={'Authorization': 'Bearer ' + otro})
+    assert respuesta.status_code == 404
+    assert respuesta.get_json() == cliente.get('/jobs/%d' % (id + 1)).get_json()
+
+
+@pytest.mark.parametrize('precio', ['nan', 'NaN', 'inf', '-inf', 'Infinity'])
+def test_importacion_rechaza_precios_no_finitos(precio):
+    fila = {'nombre': 'p', 'precio': precio, 'cantidad': '1', 'categoria_id': '1'}
+    assert fila_importacion(fila, {}) == (None, 'Valor no válido para precio')
+
+
+def test_importacion_acepta_fila_valida():
+    fila = {'nombre': 'p', 'precio': '2.5', 'cantidad': '1', 'categoria': 'c'}
+    assert fila_importacion(fila, {'c': 3}) == (
+        {'nombre': 'p', 'precio': 2.5, 'cantidad': 1, 'categoria_id': 3}, None
+    )
+
+
+# ------------------------- CONCESIÓN -------------------------
+@pytest.fixture
+def tarea_prueba(monkeypatch):
+    # Tarea que registra qué trabajos ejecuta y avanza un lote
+    ejecutados = []
+
+    def tarea(parametros, progreso):
+        ejecutados.append(parametros['n'])
+        progreso.iniciar(1)
+        progreso.avanzar(1, 1)
+        return {'n': parametros['n']}
+    monkeypatch.setitem(trabajos.tareas, 'prueba', (tarea, ()))
+    return ejecutados
+
+
+def crear_trabajo(n, estado='pendiente', antiguedad=0, **valores):
+    momento = ahora() - timedelta(seconds=antiguedad)
+    trabajo = Trabajo(tipo='prueba', estado=estado, parametros={'n': n}, usuario_id=1,
+                      created_at=momento, **valores)
+    db.session.add(trabajo)
+    db.session.commit()
+    return trabajo.id
+
+
+def test_recuperar_devuelve_a_la_cola_los_trabajos_abandonados(crear_app):
+    app = crear_app(JOBS_POOL_TYPE='external', JOBS_LEASE_SECONDS=60)
+    with app.app_context():
+        caducado = crear_trabajo(1, 'en_curso', 300, started_at=ahora(), reclamado_en=ahora() - timedelta(seconds=120))
+        vigente = crear_trabajo(2, 'en_curso', 300, started_at=ahora(), reclamado_en=ahora())
+        sin_concesion = crear_trabajo(3, 'en_curso', 300)
+        assert trabajos.recuperar() == 2
+        estados = {t.id: (t.estado, t.reclamado_en) for t in db.session.scalars(db.select(Trabajo))}
+    assert estados[caducado] == ('pendiente', None)
+    assert estados[sin_concesion] == ('pendiente', None)
+    assert estados[vigente][0] == 'en_curso'
+
+
+def test_flask_trabajos_ejecuta_los_abandonados(crear_app, tarea_prueba):
+    app = crear_app(JOBS_POOL_TYPE='external', JOBS_LEASE_SECONDS=60)
+    with app.app_context():
+        id = crear_trabajo(1, 'en_curso', 300, started_at=ahora(), reclamado_en=ahora() - timedelta(seconds=120))
+        trabajos.consumir(una_vez=True)
+        trabajo = db.session.get(Trabajo, id)
+        assert (trabajo.estado, trabajo.resultado, trabajo.procesados) == ('completado', {'n': 1}, 1)
+        assert trabajo.reclamado_en is not None
+    assert tarea_prueba == [1]
+
+
+def test_el_pool_despacha_al_arrancar_los_trabajos_de_un_pool_muerto(crear_app, tarea_prueba,
+                                                                     base_de_datos_en_fichero):
+    app = crear_app(JOBS_POOL_TYPE='thread', JOBS_LEASE_SECONDS=60,
+                    SQLALCHEMY_DATABASE_URI=base_de_datos_en_fichero)
+    with app.app_context():
+        pendiente = crear_trabajo(1, antiguedad=300)
+        en_curso = crear_trabajo(2, 'en_curso', 300, started_at=ahora(), reclamado_en=ahora() - timedelta(seconds=120))
+        reciente = crear_trabajo(3)
+        trabajos.obtener_pool().shutdown(wait=True)
+        trabajos.pool = None
+        estados = {t.id: t.estado for t in db.session.scalars(db.select(Trabajo))}
+    assert estados == {pendiente: 'completado', en_curso: 'completado', reciente: 'pendiente'}
+    assert sorted(tarea_prueba) == [1, 2]
+
+
+def test_el_trabajador_que_pierde_la_concesion_deja_de_escribir(crear_app, monkeypatch):
+    app = crear_app(JOBS_POOL_TYPE='external', JOBS_LEASE_SECONDS=60)
+    lotes = []
+
+    def tarea(parametros, progreso):
+        # Mientras tanto, se da por abandonado y lo reclama otro trabajador
+        trabajos.actualizar(progreso.id, estado='en_curso', started_at=ahora() + timedelta(seconds=1))
+        progreso.avanzar(1, 1)
+        lotes.append(1)
+    monkeypatch.setitem(trabajos.tareas, 'prueba', (tarea, ()))
+    with app.app_context():
+        id = crear_trabajo(1)
+        trabajos.ejecutar(id)
+        trabajo = db.session.get(Trabajo, id)
+        assert (trabajo.estado, trabajo.procesados, trabajo.finished_at) == ('en_curso', 0, None)
+    assert lotes == []
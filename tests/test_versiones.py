@@ -0,0 +1,45 @@
+from sqlalchemy import delete, event, select
+from config import db
+from models import Categoria, VersionTabla
+
+
+def versiones():
+    return dict(db.session.execute(select(VersionTabla.tabla, VersionTabla.version)).all())
+
+
+def test_filas_sembradas_al_crear_la_tabla(crear_app):
+    app = crear_app(productos=0)
+    with app.app_context():
+        # La siembra de datos de crear_app ya ha escrito categorías
+        assert versiones() == {'usuarios': 0, 'categorias': 1, 'productos': 0}
+
+
+def test_upsert_sin_fila_sembrada(app):
+    with app.app_context():
+        db.session.execute(delete(VersionTabla))
+        db.session.commit()
+        for esperada in (1, 2):
+            db.session.add(Categoria(nombre='nueva-%d' % esperada))
+            db.session.commit()
+            assert versiones() == {'categorias': esperada}
+
+
+def test_version_es_la_ultima_sentencia_antes_del_commit(app, cliente):
+    enviadas = []
+    with app.app_context():
+        engine = db.engine
+
+    def antes_de_ejecutar(conexion, cursor, sentencia, parametros, contexto, varias):
+        enviadas.append(sentencia)
+
+    event.listen(engine, 'before_cursor_execute', antes_de_ejecutar)
+    try:
+        respuesta = cliente.post('/productos', json={
+            'nombre': 'nuevo', 'precio': 2.5, 'cantidad': 3, 'categoria_id': 1
+        })
+    finally:
+        event.remove(engine, 'before_cursor_execute', antes_de_ejecutar)
+    assert respuesta.status_code == 201
+    escrituras = [s for s in enviadas if not s.lstrip().upper().startswith('SELECT')]
+    assert 'versiones_tabla' in escrituras[-1]
+    assert sum('versiones_tabla' in s for s in escrituras) == 1
@@ -0,0 +1,64 @@
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+
+# Driver asíncrono equivalente a cada driver síncrono
+DRIVERS_ASYNC = {
+    'mysql': 'aiomysql',
+    'sqlite': 'aiosqlite'
+}
+
+
+class SesionSincrona(Session):
+    # Clase propia para la sesión síncrona que hay bajo cada AsyncSession: los
+    # eventos (caché, versiones) se registran sobre ella igual que sobre db.session
+    pass
+
+
+def url_asincrona(url):
+    url = make_url(url)
+    driver = DRIVERS_ASYNC.get(url.get_backend_name())
+    if driver is None:
+        raise ValueError('No hay driver asíncrono para %s' % url.drivername)
+    return url.set(drivername='%s+%s' % (url.get_backend_name(), driver))
+
+
+class AsyncDB:
+    # Motor y sesiones asíncronas para el modo ASGI (asgi.py). La sesión de la
+    # petición en curso se guarda en una ContextVar, como db.session en Flask.
+    clase_sesion = SesionSincrona
+
+    def __init__(self):
+        self.engine = None
+        self.sesiones = None
+        self.actual = ContextVar('sesion_async', default=None)
+
+    def init_app(self, app):
+        url = app.config.get('SQLALCHEMY_ASYNC_DATABASE_URI') \
+            or url_asincrona(app.config['SQLALCHEMY_DATABASE_URI'])
+        self.engine = create_async_engine(url, **app.config.get('SQLALCHEMY_ASYNC_ENGINE_OPTIONS', {}))
+        self.sesiones = async_sessionmaker(
+            self.engine,
+            class_=AsyncSession,
+            sync_session_class=self.clase_sesion,
+            expire_on_commit=False
+        )
+        app.extensions['async_db'] = self
+
+    @property
+    def session(self):
+        sesion = self.actual.get()
+        if sesion is None:
+            raise RuntimeError('No hay una sesión asíncrona activa')
+        return sesion
+
+    @asynccontextmanager
+    async def sesion(self):
+        async with self.sesiones() as sesion:
+            token = self.actual.set(sesion)
+            try:
+                yield sesion
+            finally:
+                self.actual.reset(token)
@@ -0,0 +1,143 @@
+# Autenticación JWT de las rutas que modifican datos.
+#
+# Los tokens los emite y valida flask_jwt_extended (firma, caducidad, algoritmo);
+# aquí se añade:
+#   - una caché de tokens ya verificados, hasta su caducidad: un token que se
+#     repite en cada petición se valida una sola vez por proceso;
+#   - la lista de tokens revocados (jti), en memoria o en Redis, consultada en
+#     cada petición con una búsqueda O(1);
+#   - ninguna carga del usuario: la identidad sale del token y el Usuario solo
+#     se lee si el handler lo pide (controllers.usuario_actual).
+#
+#   AUTH_VERIFY_CACHE_SIZE   10000     tokens verificados en memoria
+#   AUTH_DENYLIST_TYPE       'memory'  o 'redis' (compartida entre procesos)
+#   AUTH_DENYLIST_REDIS_URL  por defecto CACHE_REDIS_URL
+import threading
+import time
+from functools import wraps
+from flask import current_app, g, request
+from flask_jwt_extended import decode_token
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt.exceptions import ExpiredSignatureError, PyJWTError
+from utils.cache import MemoriaLRU
+
+
+class ErrorAutenticacion(Exception):
+    pass
+
+
+# ------------------------- REVOCADOS -------------------------
+class RevocadosMemoria:
+    # jti -> instante de caducidad del token; los caducados se purgan al revocar
+    def __init__(self):
+        self.revocados = {}
+        self.lock = threading.Lock()
+
+    def revocar(self, jti, ttl):
+        ahora = time.time()
+        with self.lock:
+            self.revocados[jti] = ahora + ttl
+            if len(self.revocados) % 1000 == 0:
+                self.revocados = {j: fin for j, fin in self.revocados.items() if fin > ahora}
+
+    def contiene(self, jti):
+        fin = self.revocados.get(jti)
+        return fin is not None and fin > time.time()
+
+
+class RevocadosRedis:
+    # Una clave por jti con la caducidad del token: EXISTS es O(1) y Redis
+    # borra solas las entradas que ya no hacen falta
+    def __init__(self, cliente, prefijo='recursoapi:'):
+        self.cliente = cliente
+        self.prefijo = prefijo + 'revocado:'
+
+    @classmethod
+    def desde_url(cls, url, prefijo='recursoapi:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('AUTH_DENYLIST_TYPE=redis requiere el paquete redis')
+        return cls(redis.Redis.from_url(url), prefijo)
+
+    def revocar(self, jti, ttl):
+        self.cliente.set(self.prefijo + jti, 1, ex=max(1, int(ttl) + 1))
+
+    def contiene(self, jti):
+        return bool(self.cliente.exists(self.prefijo + jti))
+
+
+# ------------------------- AUTENTICACIÓN -------------------------
+def segundos_restantes(claims):
+    # Sin exp (JWT_*_TOKEN_EXPIRES = False) el token no caduca
+    return claims['exp'] - time.time() if 'exp' in claims else None
+
+
+class Autenticacion:
+    def __init__(self, app=None):
+        self.verificados = MemoriaLRU(10000)
+        self.revocados = RevocadosMemoria()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.verificados = MemoriaLRU(app.config.get('AUTH_VERIFY_CACHE_SIZE', 10000))
+        tipo = app.config.get('AUTH_DENYLIST_TYPE', 'memory')
+        if tipo == 'memory':
+            self.revocados = RevocadosMemoria()
+        elif tipo == 'redis':
+            self.revocados = RevocadosRedis.desde_url(
+                app.config.get('AUTH_DENYLIST_REDIS_URL')
+                or app.config.get('CACHE_REDIS_URL', 'redis://localhost:6379/0'),
+                app.config.get('CACHE_KEY_PREFIX', 'recursoapi:')
+            )
+        else:
+            raise ValueError('AUTH_DENYLIST_TYPE no válido: %s' % tipo)
+        app.extensions['autenticacion'] = self
+
+    def verificar(self, autorizacion, refresh=False):
+        # autorizacion: cabecera Authorization ("Bearer <token>"). Devuelve los
+        # claims del token o lanza ErrorAutenticacion. Necesita contexto de Flask.
+        tipo, _, token = (autorizacion or '').partition(' ')
+        if tipo.lower() != 'bearer' or not token:
+            raise ErrorAutenticacion('Falta el token de autorización')
+        claims = self.verificados.get(token)
+        if claims is None:
+            try:
+                claims = decode_token(token)
+            except ExpiredSignatureError:
+                raise ErrorAutenticacion('Token caducado')
+            except (PyJWTError, JWTExtendedException):
+                raise ErrorAutenticacion('Token no válido')
+            restantes = segundos_restantes(claims)
+            if restantes is None or restantes > 0:
+                self.verificados.set(token, claims, restantes)
+        if claims.get('type') != ('refresh' if refresh else 'access'):
+            raise ErrorAutenticacion('Se requiere un token de %s' % ('refresco' if refresh else 'acceso'))
+        if self.revocados.contiene(claims['jti']):
+            raise ErrorAutenticacion('Token revocado')
+        return claims
+
+    def revocar(self, claims):
+        restantes = segundos_restantes(claims)
+        self.revocados.revocar(claims['jti'], 365 * 24 * 3600 if restantes is None else restantes)
+
+    def requerido(self, refresh=False):
+        # Como jwt_required(), pero con la caché de verificación y sin cargar el
+        # usuario. Los handlers leen el token con auth.claims() y auth.identidad()
+        # (get_jwt() solo ve lo que valida el propio verify_jwt_in_request).
+        def decorador(f):
+            @wraps(f)
+            def envoltorio(*args, **kwargs):
+                g.claims_jwt = self.verificar(request.headers.get('Authorization'), refresh)
+                return f(*args, **kwargs)
+            return envoltorio
+        return decorador
+
+    def claims(self):
+        # Claims del token de la petición en curso, o None si la ruta no lo pide
+        return g.get('claims_jwt')
+
+    def identidad(self):
+        claims = self.claims()
+        return claims[current_app.config['JWT_IDENTITY_CLAIM']] if claims else None
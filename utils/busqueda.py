@@ -0,0 +1,399 @@
+# Búsqueda de texto sobre una columna (el nombre de los productos).
+#
+# En MySQL se usa un índice FULLTEXT (MATCH ... AGAINST en modo booleano); con
+# una intercalación *_ai_ci ya ignora mayúsculas y acentos. En el resto de
+# bases de datos (SQLite) se mantiene en memoria un índice invertido, término ->
+# ids. En ambos casos todas las palabras de la consulta deben aparecer, la
+# última también como prefijo ("cami" encuentra "camiseta"), y los resultados
+# salen ordenados por relevancia.
+#
+# El índice en memoria se construye en un hilo aparte la primera vez que se
+# busca (con un millón de filas tarda decenas de segundos); mientras tanto las
+# búsquedas van a SQL: cada palabra como prefijo de alguna palabra del texto,
+# por orden de id y sin ignorar acentos. Después se actualiza tras cada
+# commit con las filas creadas, modificadas o eliminadas en la sesión. Las
+# escrituras de otros procesos se detectan con la versión de la tabla
+# (versiones_tabla) y se incorporan leyendo solo las filas con updated_at
+# reciente; sus borrados no se ven hasta reconstruir el índice, pero los ids que
+# ya no existen nunca llegan a la respuesta.
+#
+#   SEARCH_BACKEND          'auto' (FULLTEXT en MySQL, memoria en el resto),
+#                           'fulltext' o 'memory'
+#   SEARCH_MAX_EXPANSIONS   64    términos en los que se expande el prefijo
+#   SEARCH_INDEX_BACKGROUND True  False: el índice se construye en la propia
+#                                 petición (SQLite en memoria, catálogos pequeños)
+import bisect
+import heapq
+import logging
+import math
+import re
+import threading
+import unicodedata
+from datetime import timedelta
+from sqlalchemy import event, func, or_, select
+from sqlalchemy.dialects.mysql import match
+from sqlalchemy.orm import Session
+from utils.cambios import seguir_tablas_escritas, tablas_escritas
+from utils.versiones import ahora, leer_versiones
+
+# Parámetros de BM25
+K1 = 1.2
+B = 0.75
+# Un término que solo coincide como prefijo puntúa menos que uno completo
+PESO_PREFIJO = 0.5
+# Margen al releer filas recientes: un commit puede llegar después de otro con
+# un updated_at posterior
+MARGEN_SINCRONIZACION = timedelta(seconds=5)
+# Filas por lote al construir el índice en segundo plano
+TAMANO_LOTE_INDICE = 10000
+CLAVE = 'cambios_busqueda'
+PALABRA = re.compile(r'\w+')
+
+logger = logging.getLogger(__name__)
+
+
+def normalizar(texto):
+    # Minúsculas y sin acentos ("Camión" -> "camion"); la ñ pasa a n
+    descompuesto = unicodedata.normalize('NFKD', texto.lower())
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c))
+
+
+def tokenizar(texto):
+    return PALABRA.findall(normalizar(texto or ''))
+
+
+# ------------------------- ÍNDICE EN MEMORIA -------------------------
+class IndiceInvertido:
+    def __init__(self, max_expansiones=64):
+        self.max_expansiones = max_expansiones
+        self.terminos = {}       # término -> set de ids
+        self.documentos = {}     # id -> tupla de términos (con repeticiones)
+        self.vocabulario = []    # términos ordenados, para buscar por prefijo
+        self.longitudes = {}     # número de términos -> set de ids
+        self.repetidos = set()   # ids con algún término repetido (tf > 1)
+        self.longitud_total = 0
+        self.version = None      # versión de la tabla que refleja el índice
+        self.sincronizado = None # updated_at desde el que releer filas
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.documentos)
+
+    def cargar(self, filas, ordenar=True):
+        # Construcción inicial: el vocabulario se ordena una sola vez al final
+        # (ordenar=False al cargar por lotes, hasta el último)
+        with self.lock:
+            for id, texto in filas:
+                self._quitar(id, ordenado=False)
+                self._poner(id, texto, ordenado=False)
+            if ordenar:
+                self.vocabulario = sorted(self.terminos)
+
+    def indexar(self, id, texto):
+        with self.lock:
+            self._quitar(id)
+            self._poner(id, texto)
+
+    def eliminar(self, id):
+        with self.lock:
+            self._quitar(id)
+
+    def _poner(self, id, texto, ordenado=True):
+        documento = tuple(tokenizar(texto))
+        distintos = set(documento)
+        self.documentos[id] = documento
+        self.longitud_total += len(documento)
+        self.longitudes.setdefault(len(documento), set()).add(id)
+        if len(distintos) < len(documento):
+            self.repetidos.add(id)
+        for termino in distintos:
+            ids = self.terminos.get(termino)
+            if ids is None:
+                ids = self.terminos[termino] = set()
+                if ordenado:
+                    bisect.insort(self.vocabulario, termino)
+            ids.add(id)
+
+    def _quitar(self, id, ordenado=True):
+        documento = self.documentos.pop(id, None)
+        if documento is None:
+            return
+        self.longitud_total -= len(documento)
+        self.longitudes[len(documento)].discard(id)
+        self.repetidos.discard(id)
+        for termino in set(documento):
+            ids = self.terminos[termino]
+            ids.discard(id)
+            if not ids:
+                del self.terminos[termino]
+                if ordenado:
+                    del self.vocabulario[bisect.bisect_left(self.vocabulario, termino)]
+
+    def expandir(self, prefijo):
+        # El propio término (si existe) y los que empiezan por él
+        inicio = bisect.bisect_left(self.vocabulario, prefijo)
+        expansion = []
+        for termino in self.vocabulario[inicio:inicio + self.max_expansiones]:
+            if not termino.startswith(prefijo):
+                break
+            expansion.append(termino)
+        return expansion
+
+    def buscar(self, consulta, limit, offset=0):
+        # Devuelve (total, ids de la página ordenados por relevancia)
+        palabras = tokenizar(consulta)
+        if not palabras:
+            return 0, []
+        with self.lock:
+            grupos = []
+            for i, palabra in enumerate(palabras):
+                if i == len(palabras) - 1:
+                    terminos = self.expandir(palabra)
+                else:
+                    terminos = [palabra] if palabra in self.terminos else []
+                if not terminos:
+                    return 0, []
+                grupos.append((palabra, terminos))
+
+            # Candidatos: intersección de los grupos, empezando por el más pequeño
+            conjuntos = sorted(
+                (self.terminos[t[0]] if len(t) == 1 else set().union(*(self.terminos[x] for x in t))
+                 for _, t in grupos),
+                key=len
+            )
+            candidatos = conjuntos[0].intersection(*conjuntos[1:]) if len(conjuntos) > 1 else conjuntos[0]
+
+            n = len(self.documentos)
+            media = self.longitud_total / n
+            pesos = [
+                [(t, (1 if t == palabra else PESO_PREFIJO) *
+                  math.log(1 + (n - len(self.terminos[t]) + 0.5) / (len(self.terminos[t]) + 0.5)))
+                 for t in terminos]
+                for palabra, terminos in grupos
+            ]
+
+            def clave(id):
+                documento = self.documentos[id]
+                normalizacion = K1 * (1 - B + B * len(documento) / media)
+                puntuacion = 0
+                for grupo in pesos:
+                    mejor = 0
+                    for termino, peso in grupo:
+                        tf = documento.count(termino)
+                        if tf:
+                            mejor = max(mejor, peso * tf * (K1 + 1) / (tf + normalizacion))
+                    puntuacion += mejor
+                return -puntuacion, id
+
+            if any(len(grupo) > 1 for grupo in pesos):
+                return len(candidatos), heapq.nsmallest(offset + limit, candidatos, key=clave)[offset:]
+
+            # Un término por palabra: salvo con términos repetidos, la puntuación
+            # solo depende de la longitud del nombre. Se puntúa una vez por
+            # longitud y de cada una se toman los ids menores (intersecciones de
+            # conjuntos), en vez de recorrer todos los candidatos en Python.
+            n = offset + limit
+            peso = sum(grupo[0][1] for grupo in pesos) * (K1 + 1)
+            normales = candidatos - self.repetidos
+            mejores = [clave(id) for id in candidatos & self.repetidos]
+            for longitud, ids in self.longitudes.items():
+                comunes = normales & ids if len(normales) < len(ids) else ids & normales
+                if comunes:
+                    puntuacion = peso / (1 + K1 * (1 - B + B * longitud / media))
+                    mejores.extend((-puntuacion, id) for id in heapq.nsmallest(n, comunes))
+            return len(candidatos), [id for _, id in heapq.nsmallest(n, mejores)][offset:]
+
+
+# ------------------------- BUSCADOR -------------------------
+def clave_url(url):
+    # La misma base de datos con driver síncrono o asíncrono comparte índice
+    return url.set(drivername=url.get_backend_name()).render_as_string(hide_password=False)
+
+
+class Buscador:
+    def __init__(self, app=None):
+        self.backend = 'auto'
+        self.max_expansiones = 64
+        self.modelo = None
+        self.columna = None
+        self.versiones = None
+        self.en_segundo_plano = True
+        self.indices = {}
+        self.construcciones = {}
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.backend = app.config.get('SEARCH_BACKEND', 'auto')
+        if self.backend not in ('auto', 'fulltext', 'memory'):
+            raise ValueError('SEARCH_BACKEND no válido: %s' % self.backend)
+        self.max_expansiones = app.config.get('SEARCH_MAX_EXPANSIONS', 64)
+        self.en_segundo_plano = app.config.get('SEARCH_INDEX_BACKGROUND', True)
+        self.indices, self.construcciones = {}, {}
+        app.extensions['buscador'] = self
+
+    def seguir(self, session, modelo, columna, versiones):
+        # Registra los cambios de modelo.columna hechos en la sesión y los aplica
+        # al índice tras el commit. versiones: modelo de versiones_tabla.
+        self.modelo, self.columna, self.versiones = modelo, columna, versiones
+        seguir_tablas_escritas(session)
+        tabla = modelo.__tablename__
+
+        @event.listens_for(session, 'after_flush')
+        def tras_flush(sesion, contexto):
+            for obj in list(sesion.new) + list(sesion.dirty):
+                if isinstance(obj, modelo):
+                    self.registrar(sesion, {obj.id: getattr(obj, columna)})
+            for obj in sesion.deleted:
+                if isinstance(obj, modelo):
+                    self.registrar(sesion, {obj.id: None})
+
+        @event.listens_for(session, 'after_commit')
+        def tras_commit(sesion):
+            cambios = sesion.info.pop(CLAVE, None)
+            if tabla not in tablas_escritas(sesion):
+                return
+            indice = self.indices.get(clave_url(sesion.get_bind().url))
+            # Índice aún en construcción: lo que escriba este commit se recoge
+            # al sincronizarlo (su versión ya no coincidirá)
+            if indice is None or indice.version is None:
+                return
+            cambios = cambios or {}
+            # Una fila escrita sin id conocido (INSERT masivo sin RETURNING) no se
+            # puede indexar aquí: se recoge en la siguiente sincronización
+            completo = cambios.pop(None, 0) == 0
+            with indice.lock:
+                for id, texto in cambios.items():
+                    if texto is None:
+                        indice.eliminar(id)
+                    else:
+                        indice.indexar(id, texto)
+                # Cada commit que escribe en la tabla sube su versión en uno
+                if indice.version is not None and completo:
+                    indice.version += 1
+
+        @event.listens_for(session, 'after_transaction_end')
+        def tras_transaccion(sesion, transaccion):
+            if transaccion.parent is None:
+                sesion.info.pop(CLAVE, None)
+
+    def registrar(self, sesion, cambios):
+        # cambios: {id: texto nuevo, o None si la fila se ha borrado}. Para las
+        # escrituras masivas, que no pasan por los objetos de la sesión.
+        sesion.info.setdefault(CLAVE, {}).update(cambios)
+
+    def usa_fulltext(self, sesion):
+        if self.backend == 'auto':
+            return sesion.get_bind().dialect.name == 'mysql'
+        return self.backend == 'fulltext'
+
+    def version_tabla(self, sesion):
+        tabla = self.modelo.__tablename__
+        return dict((t, v) for t, v, _ in leer_versiones(sesion, self.versiones, [tabla])).get(tabla, 0)
+
+    def indice(self, sesion):
+        # Índice en memoria de la base de datos de la sesión, al día con la
+        # tabla, o None mientras se construye en segundo plano
+        motor = sesion.get_bind()
+        clave = clave_url(motor.url)
+        with self.lock:
+            indice = self.indices.get(clave)
+            if indice is None:
+                indice = self.indices[clave] = IndiceInvertido(self.max_expansiones)
+                if self.en_segundo_plano:
+                    hilo = threading.Thread(target=self.construir, args=(motor, clave, indice),
+                                            name='indice-busqueda', daemon=True)
+                    self.construcciones[clave] = hilo
+                    hilo.start()
+        if clave in self.construcciones:
+            return None
+        # Primera construcción en la petición, o sincronización con lo que han
+        # escrito otros procesos: solo las filas recientes
+        version = self.version_tabla(sesion)
+        with indice.lock:
+            if indice.version != version:
+                self.sincronizar(sesion, indice, version)
+        return indice
+
+    def construir(self, motor, clave, indice):
+        # Hilo de construcción, con su propia sesión. Lee la tabla por lotes de
+        # id, cada uno en una transacción corta: una lectura de decenas de
+        # segundos bloquearía las escrituras en SQLite. Lo que cambie mientras
+        # tanto sube la versión de la tabla y se relee al sincronizar.
+        modelo = self.modelo
+        try:
+            with Session(motor) as sesion:
+                inicio = ahora()
+                version = self.version_tabla(sesion)
+                ultimo = None
+                while True:
+                    consulta = select(modelo.id, getattr(modelo, self.columna)).order_by(modelo.id)
+                    if ultimo is not None:
+                        consulta = consulta.where(modelo.id > ultimo)
+                    filas = sesion.execute(consulta.limit(TAMANO_LOTE_INDICE)).all()
+                    sesion.rollback()
+                    if not filas:
+                        break
+                    indice.cargar(filas, ordenar=False)
+                    ultimo = filas[-1].id
+                with indice.lock:
+                    indice.vocabulario = sorted(indice.terminos)
+                    indice.version, indice.sincronizado = version, inicio
+        except Exception:
+            logger.exception('No se ha podido construir el índice de búsqueda')
+            # La siguiente búsqueda lo vuelve a intentar
+            with self.lock:
+                if self.indices.get(clave) is indice:
+                    del self.indices[clave]
+        finally:
+            with self.lock:
+                self.construcciones.pop(clave, None)
+
+    def sincronizar(self, sesion, indice, version):
+        modelo = self.modelo
+        consulta = select(modelo.id, getattr(modelo, self.columna))
+        if indice.sincronizado is not None:
+            consulta = consulta.where(modelo.updated_at >= indice.sincronizado - MARGEN_SINCRONIZACION)
+        inicio = ahora()
+        indice.cargar(sesion.execute(consulta.execution_options(yield_per=10000)))
+        indice.version, indice.sincronizado = version, inicio
+
+    def buscar(self, sesion, consulta, limit, offset=0):
+        # (total, ids ordenados por relevancia) de la página pedida
+        if self.usa_fulltext(sesion):
+            return self.buscar_fulltext(sesion, consulta, limit, offset)
+        indice = self.indice(sesion)
+        if indice is None:
+            return self.buscar_sql(sesion, consulta, limit, offset)
+        return indice.buscar(consulta, limit, offset)
+
+    def buscar_sql(self, sesion, consulta, limit, offset=0):
+        # Mientras no hay índice: cada palabra, prefijo de alguna palabra del
+        # texto (LIKE 'p%' o '% p%'), sin relevancia
+        palabras = tokenizar(consulta)
+        if not palabras:
+            return 0, []
+        texto = func.lower(getattr(self.modelo, self.columna))
+        condiciones = [
+            or_(texto.startswith(p, autoescape=True), texto.contains(' ' + p, autoescape=True))
+            for p in palabras
+        ]
+        total = sesion.scalar(select(func.count()).select_from(self.modelo).where(*condiciones))
+        ids = sesion.scalars(
+            select(self.modelo.id).where(*condiciones).order_by(self.modelo.id).limit(limit).offset(offset)
+        ).all()
+        return total, ids
+
+    def buscar_fulltext(self, sesion, consulta, limit, offset=0):
+        palabras = tokenizar(consulta)
+        if not palabras:
+            return 0, []
+        booleana = ' '.join('+%s' % p for p in palabras) + '*'
+        relevancia = match(getattr(self.modelo, self.columna), against=booleana).in_boolean_mode()
+        total = sesion.scalar(select(func.count()).select_from(self.modelo).where(relevancia))
+        ids = sesion.scalars(
+            select(self.modelo.id).where(relevancia)
+            .order_by(relevancia.desc(), self.modelo.id).limit(limit).offset(offset)
+        ).all()
+        return total, ids
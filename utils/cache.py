@@ -0,0 +1,232 @@
+import hashlib
+import inspect
+import json
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from flask import g, has_request_context
+from sqlalchemy import event
+from utils.cambios import seguir_tablas_escritas, tablas_escritas
+
+
+def acotar_ttl(ttl):
+    # Lo leído de una réplica (g.ttl_cache_maximo) se cachea como mucho durante
+    # el retraso máximo que se le admite a la réplica
+    maximo = g.get('ttl_cache_maximo') if has_request_context() else None
+    return min(ttl, maximo) if maximo else ttl
+
+
+# ------------------------- BACKENDS -------------------------
+class MemoriaLRU:
+    # Caché en proceso: LRU acotada por número de entradas y con TTL por entrada
+    def __init__(self, max_entradas=1024):
+        self.max_entradas = max_entradas
+        self.entradas = OrderedDict()
+        self.versiones = {}
+        self.lock = threading.Lock()
+
+    def get(self, clave):
+        with self.lock:
+            entrada = self.entradas.get(clave)
+            if entrada is None:
+                return None
+            valor, expira = entrada
+            if expira is not None and expira < time.monotonic():
+                del self.entradas[clave]
+                return None
+            self.entradas.move_to_end(clave)
+            return valor
+
+    def set(self, clave, valor, ttl=None):
+        expira = time.monotonic() + ttl if ttl else None
+        with self.lock:
+            self.entradas[clave] = (valor, expira)
+            self.entradas.move_to_end(clave)
+            while len(self.entradas) > self.max_entradas:
+                self.entradas.popitem(last=False)
+
+    def version(self, espacio):
+        return self.versiones.get(espacio, 0)
+
+    def incrementar_version(self, espacio):
+        with self.lock:
+            self.versiones[espacio] = self.versiones.get(espacio, 0) + 1
+
+    def __len__(self):
+        return len(self.entradas)
+
+
+class RedisBackend:
+    # Cualquier cliente compatible con Redis (redis-py, valkey, fakeredis...)
+    def __init__(self, cliente, prefijo='recursoapi:'):
+        self.cliente = cliente
+        self.prefijo = prefijo
+
+    @classmethod
+    def desde_url(cls, url, prefijo='recursoapi:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('CACHE_TYPE=redis requiere el paquete redis')
+        return cls(redis.Redis.from_url(url), prefijo)
+
+    # Los valores se guardan como JSON; los bytes (cuerpos ya comprimidos) tal
+    # cual, tras un byte 0 que ningún documento JSON puede tener al principio
+    def get(self, clave):
+        valor = self.cliente.get(self.prefijo + clave)
+        if valor is None:
+            return None
+        if valor[:1] == b'\x00':
+            return valor[1:]
+        return json.loads(valor)
+
+    def set(self, clave, valor, ttl=None):
+        datos = b'\x00' + valor if isinstance(valor, bytes) else json.dumps(valor)
+        self.cliente.set(self.prefijo + clave, datos, ex=ttl or None)
+
+    def version(self, espacio):
+        return int(self.cliente.get(self.prefijo + 'version:' + espacio) or 0)
+
+    def incrementar_version(self, espacio):
+        self.cliente.incr(self.prefijo + 'version:' + espacio)
+
+
+# ------------------------- CACHÉ -------------------------
+class Cache:
+    # Las claves incluyen la versión del espacio (productos, categorias...).
+    # Invalidar un espacio es incrementar su versión: las entradas antiguas dejan
+    # de ser alcanzables y caducan solas, sin recorrer claves.
+    def __init__(self, app=None):
+        self.backend = None
+        self.ttl = 300
+        self.aciertos = Counter()
+        self.fallos = Counter()
+        # Resumen de los sellos (versiones de las tablas) de la petición en curso
+        self.sello = ContextVar('sello_cache', default=None)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        tipo = app.config.get('CACHE_TYPE', 'memory')
+        self.ttl = app.config.get('CACHE_DEFAULT_TIMEOUT', 300)
+        if tipo == 'memory':
+            self.backend = MemoriaLRU(app.config.get('CACHE_MAX_ENTRIES', 1024))
+        elif tipo == 'redis':
+            self.backend = RedisBackend.desde_url(
+                app.config.get('CACHE_REDIS_URL', 'redis://localhost:6379/0'),
+                app.config.get('CACHE_KEY_PREFIX', 'recursoapi:')
+            )
+        elif tipo == 'null':
+            self.backend = None
+        else:
+            raise ValueError('CACHE_TYPE no válido: %s' % tipo)
+        app.extensions['cache'] = self
+
+    def clave(self, espacio, clave):
+        return '%s:%d:%s' % (espacio, self.backend.version(espacio), clave)
+
+    def get(self, espacio, clave):
+        if self.backend is None:
+            return None
+        valor = self.backend.get(self.clave(espacio, clave))
+        if valor is None:
+            self.fallos[espacio] += 1
+        else:
+            self.aciertos[espacio] += 1
+        return valor
+
+    def set(self, espacio, clave, valor, ttl=None):
+        if self.backend is not None:
+            self.backend.set(self.clave(espacio, clave), valor, acotar_ttl(ttl or self.ttl))
+
+    def invalidar(self, *espacios):
+        if self.backend is not None:
+            for espacio in espacios:
+                self.backend.incrementar_version(espacio)
+
+    @contextmanager
+    def sellada(self, sellos):
+        # Lo que se cachee dentro queda ligado a los sellos del ETag (versiones
+        # de versiones_tabla, compartidas por todos los procesos). La versión
+        # del espacio solo la incrementa el proceso que escribe: sin esto, otro
+        # proceso con caché en memoria serviría el cuerpo anterior bajo el ETag
+        # nuevo, y el cuerpo comprimido se cachearía con él.
+        token = self.sello.set(hashlib.sha1(repr(sellos).encode('utf-8')).hexdigest())
+        try:
+            yield
+        finally:
+            self.sello.reset(token)
+
+    def cached(self, espacio, ttl=None):
+        # Cachea las respuestas (respuesta, status) de un controlador, solo si status == 200
+        def decorador(f):
+            def buscar(args, kwargs):
+                clave = '%s:%r:%r' % (f.__name__, args, sorted(kwargs.items()))
+                if self.sello.get() is not None:
+                    clave += ':' + self.sello.get()
+                # La versión se fija antes de consultar la base de datos: si se
+                # invalida mientras tanto, el valor calculado queda inalcanzable
+                clave = self.clave(espacio, clave)
+                respuesta = self.backend.get(clave)
+                if respuesta is None:
+                    self.fallos[espacio] += 1
+                else:
+                    self.aciertos[espacio] += 1
+                return clave, respuesta
+
+            def guardar(clave, respuesta, status):
+                if status == 200:
+                    self.backend.set(clave, respuesta, acotar_ttl(ttl or self.ttl))
+                return respuesta, status
+
+            if inspect.iscoroutinefunction(f):
+                @wraps(f)
+                async def envoltorio_async(*args, **kwargs):
+                    if self.backend is None:
+                        return await f(*args, **kwargs)
+                    clave, respuesta = buscar(args, kwargs)
+                    if respuesta is not None:
+                        return respuesta, 200
+                    return guardar(clave, *(await f(*args, **kwargs)))
+                return envoltorio_async
+
+            @wraps(f)
+            def envoltorio(*args, **kwargs):
+                if self.backend is None:
+                    return f(*args, **kwargs)
+                clave, respuesta = buscar(args, kwargs)
+                if respuesta is not None:
+                    return respuesta, 200
+                return guardar(clave, *f(*args, **kwargs))
+            return envoltorio
+        return decorador
+
+    def invalidar_en_commit(self, session, dependencias):
+        # dependencias: nombre de tabla -> espacios de caché que dependen de ella
+        seguir_tablas_escritas(session)
+
+        @event.listens_for(session, 'after_commit')
+        def tras_commit(sesion):
+            if sesion.in_nested_transaction():
+                return
+            espacios = set()
+            for tabla in tablas_escritas(sesion):
+                espacios.update(dependencias.get(tabla, ()))
+            self.invalidar(*espacios)
+
+    def estadisticas(self):
+        espacios = set(self.aciertos) | set(self.fallos)
+        return {
+            'backend': type(self.backend).__name__ if self.backend else None,
+            'entradas': len(self.backend) if isinstance(self.backend, MemoriaLRU) else None,
+            'espacios': {
+                espacio: {
+                    'aciertos': self.aciertos[espacio],
+                    'fallos': self.fallos[espacio]
+                }
+                for espacio in sorted(espacios)
+            }
+        }
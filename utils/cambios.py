@@ -0,0 +1,41 @@
+from sqlalchemy import event
+
+# Registro, por sesión, de las tablas escritas en la transacción en curso:
+# tanto por flush de objetos como por sentencias masivas (insert/update/delete)
+CLAVE = 'tablas_escritas'
+sesiones_seguidas = set()
+
+
+def tablas_escritas(sesion):
+    return sesion.info.get(CLAVE, set())
+
+
+def marcar_tabla(sesion, tabla):
+    sesion.info.setdefault(CLAVE, set()).add(tabla)
+
+
+def seguir_tablas_escritas(session):
+    if id(session) in sesiones_seguidas:
+        return
+    sesiones_seguidas.add(id(session))
+
+    @event.listens_for(session, 'after_flush')
+    def tras_flush(sesion, contexto):
+        for obj in list(sesion.new) + list(sesion.dirty) + list(sesion.deleted):
+            tabla = getattr(obj, '__tablename__', None)
+            if tabla:
+                marcar_tabla(sesion, tabla)
+
+    @event.listens_for(session, 'do_orm_execute')
+    def tras_ejecutar(estado):
+        if estado.is_insert or estado.is_update or estado.is_delete:
+            tabla = getattr(estado.statement, 'table', None)
+            if tabla is not None:
+                marcar_tabla(estado.session, tabla.name)
+
+    # after_transaction_end se emite después de after_commit/after_rollback, así
+    # que quien escuche esos eventos todavía ve las tablas escritas
+    @event.listens_for(session, 'after_transaction_end')
+    def tras_transaccion(sesion, transaccion):
+        if transaccion.parent is None:
+            sesion.info.pop(CLAVE, None)
@@ -0,0 +1,198 @@
+# Compresión de las respuestas (gzip, br, zstd) negociada con Accept-Encoding.
+#
+#   COMPRESSION_ENABLED      True
+#   COMPRESSION_ALGORITHMS   ['zstd', 'br', 'gzip']   preferencia del servidor
+#   COMPRESSION_MIN_SIZE     1024                     bytes; por debajo no compensa
+#   COMPRESSION_LEVEL        {'gzip': 6, 'br': 4, 'zstd': 3}
+#
+# brotli y zstandard son opcionales: si no están instalados esas codificaciones
+# no se ofrecen. Los cuerpos de las respuestas con ETag (listados y elementos)
+# se guardan ya comprimidos en la caché, con clave ETag + codificación, de modo
+# que un listado caliente se comprime una vez y no en cada petición. Las
+# respuestas generadas por trozos (exportaciones) se comprimen también por
+# trozos, sin tener el cuerpo entero en memoria.
+import gzip
+import zlib
+from flask import current_app, request
+from werkzeug.http import parse_accept_header
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CODIFICACIONES = ('zstd', 'br', 'gzip')
+NIVELES_POR_DEFECTO = {'gzip': 6, 'br': 4, 'zstd': 3}
+TIPOS_COMPRIMIBLES = ('application/json', 'application/x-ndjson', 'text/')
+ESPACIO_CACHE = 'comprimidos'
+
+
+def comprimir_gzip(datos, nivel):
+    # mtime=0: mismo cuerpo para los mismos datos, como corresponde a un ETag fuerte
+    return gzip.compress(datos, compresslevel=nivel, mtime=0)
+
+
+def comprimir_br(datos, nivel):
+    return brotli.compress(datos, quality=nivel)
+
+
+def comprimir_zstd(datos, nivel):
+    return zstandard.ZstdCompressor(level=nivel).compress(datos)
+
+
+class FlujoGzip:
+    def __init__(self, nivel):
+        # wbits=31: cabecera gzip (con mtime=0, como comprimir_gzip)
+        self.compresor = zlib.compressobj(nivel, zlib.DEFLATED, 31)
+
+    def comprimir(self, datos):
+        return self.compresor.compress(datos)
+
+    def terminar(self):
+        return self.compresor.flush()
+
+
+class FlujoBrotli:
+    def __init__(self, nivel):
+        self.compresor = brotli.Compressor(quality=nivel)
+
+    def comprimir(self, datos):
+        return self.compresor.process(datos)
+
+    def terminar(self):
+        return self.compresor.finish()
+
+
+class FlujoZstd:
+    def __init__(self, nivel):
+        self.compresor = zstandard.ZstdCompressor(level=nivel).compressobj()
+
+    def comprimir(self, datos):
+        return self.compresor.compress(datos)
+
+    def terminar(self):
+        return self.compresor.flush()
+
+
+FLUJOS = {'gzip': FlujoGzip, 'br': FlujoBrotli, 'zstd': FlujoZstd}
+
+
+def compresores_disponibles():
+    compresores = {'gzip': comprimir_gzip}
+    if brotli is not None:
+        compresores['br'] = comprimir_br
+    if zstandard is not None:
+        compresores['zstd'] = comprimir_zstd
+    return compresores
+
+
+def etag_codificado(etag, codificacion):
+    return '%s-%s' % (etag, codificacion) if codificacion else etag
+
+
+class Compresion:
+    def __init__(self, app=None):
+        self.activa = False
+        self.algoritmos = []
+        self.minimo = 1024
+        self.niveles = dict(NIVELES_POR_DEFECTO)
+        self.compresores = compresores_disponibles()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.activa = app.config.get('COMPRESSION_ENABLED', True)
+        algoritmos = app.config.get('COMPRESSION_ALGORITHMS', CODIFICACIONES)
+        desconocidos = set(algoritmos) - set(CODIFICACIONES)
+        if desconocidos:
+            raise ValueError('COMPRESSION_ALGORITHMS no válido: %s' % ', '.join(sorted(desconocidos)))
+        self.algoritmos = [a for a in algoritmos if a in self.compresores]
+        self.minimo = app.config.get('COMPRESSION_MIN_SIZE', 1024)
+        self.niveles = {**NIVELES_POR_DEFECTO, **app.config.get('COMPRESSION_LEVEL', {})}
+        app.extensions['compresion'] = self
+
+    def negociar(self, accept_encoding):
+        # La codificación con mayor q en Accept-Encoding; a igual q, la preferida
+        # por el servidor. None si no hay ninguna aceptable.
+        if not self.activa or not accept_encoding:
+            return None
+        aceptadas = parse_accept_header(accept_encoding)
+        mejor, calidad = None, 0
+        for codificacion in self.algoritmos:
+            q = aceptadas.quality(codificacion)
+            if q > calidad:
+                mejor, calidad = codificacion, q
+        return mejor
+
+    def comprimir(self, datos, codificacion):
+        return self.compresores[codificacion](datos, self.niveles[codificacion])
+
+    def comprimir_flujo(self, trozos, codificacion):
+        # Comprime un cuerpo generado por trozos (bytes) a medida que llega
+        flujo = FLUJOS[codificacion](self.niveles[codificacion])
+        for trozo in trozos:
+            datos = flujo.comprimir(trozo)
+            if datos:
+                yield datos
+        yield flujo.terminar()
+
+    def cuerpo_cacheado(self, etag, codificacion):
+        cache = current_app.extensions.get('cache')
+        if cache is None or not codificacion:
+            return None
+        return cache.get(ESPACIO_CACHE, '%s:%s' % (etag, codificacion))
+
+    def comprimir_cuerpo(self, datos, codificacion, etag=None):
+        # Cuerpo comprimido, o None si es demasiado pequeño. Con etag se guarda
+        # en la caché: el ETag ya cambia con cada versión de los datos.
+        if len(datos) < self.minimo:
+            return None
+        cuerpo = self.comprimir(datos, codificacion)
+        cache = current_app.extensions.get('cache')
+        if etag and cache is not None:
+            cache.set(ESPACIO_CACHE, '%s:%s' % (etag, codificacion), cuerpo)
+        return cuerpo
+
+    def comprimible(self, respuesta):
+        return (
+            200 <= respuesta.status_code < 300 and respuesta.status_code != 204
+            and not respuesta.direct_passthrough and not respuesta.is_streamed
+            and 'Content-Encoding' not in respuesta.headers
+            and (respuesta.mimetype or '').startswith(TIPOS_COMPRIMIBLES)
+        )
+
+    def aplicar(self, respuesta, cuerpo, codificacion):
+        respuesta.set_data(cuerpo)
+        respuesta.headers['Content-Encoding'] = codificacion
+        etag, debil = respuesta.get_etag()
+        if etag:
+            respuesta.set_etag(etag_codificado(etag, codificacion), debil)
+        return respuesta
+
+    def comprimir_streaming(self, respuesta):
+        # Para las respuestas por trozos, que comprimir_respuesta no toca: el
+        # cuerpo se comprime mientras se genera y no lleva Content-Length
+        if not self.activa or not (respuesta.mimetype or '').startswith(TIPOS_COMPRIMIBLES):
+            return respuesta
+        respuesta.vary.add('Accept-Encoding')
+        codificacion = self.negociar(request.headers.get('Accept-Encoding'))
+        if codificacion is not None:
+            respuesta.response = self.comprimir_flujo(respuesta.response, codificacion)
+            respuesta.headers['Content-Encoding'] = codificacion
+        return respuesta
+
+    def comprimir_respuesta(self, respuesta, etag=None):
+        # Hook after_request del blueprint y de responder_condicional
+        if not self.activa or not self.comprimible(respuesta):
+            return respuesta
+        respuesta.vary.add('Accept-Encoding')
+        codificacion = self.negociar(request.headers.get('Accept-Encoding'))
+        if codificacion is None:
+            return respuesta
+        cuerpo = self.comprimir_cuerpo(respuesta.get_data(), codificacion, etag)
+        return respuesta if cuerpo is None else self.aplicar(respuesta, cuerpo, codificacion)
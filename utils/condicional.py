@@ -0,0 +1,87 @@
+import hashlib
+from datetime import datetime, timezone
+from flask import Response, current_app, make_response, request
+from werkzeug.http import parse_date, parse_etags
+from utils.compresion import CODIFICACIONES, etag_codificado
+
+
+def fecha_http(fecha):
+    return fecha.replace(tzinfo=timezone.utc, microsecond=0)
+
+
+def calcular_etag(sellos, ruta):
+    return hashlib.sha1(repr((sellos, ruta)).encode('utf-8')).hexdigest()
+
+
+def ultima_modificacion(sellos):
+    fechas = [s[-1] for s in sellos if isinstance(s[-1], datetime)]
+    return fecha_http(max(fechas)) if fechas else None
+
+
+def no_modificado(etag, ultima, if_none_match, if_modified_since):
+    # Devuelve el ETag de la respuesta 304, o None si hay que enviar el cuerpo.
+    # If-None-Match tiene prioridad sobre If-Modified-Since (RFC 9110) y acepta
+    # también las variantes comprimidas (etag-gzip, etag-br...) del mismo recurso.
+    if if_none_match:
+        for candidato in (etag, *(etag_codificado(etag, c) for c in CODIFICACIONES)):
+            if if_none_match.contains(candidato):
+                return candidato
+        return None
+    if ultima and if_modified_since and ultima <= if_modified_since:
+        return etag
+    return None
+
+
+def evaluar_cabeceras(sellos, ruta, cabeceras):
+    # Versión independiente de Flask, para el modo ASGI.
+    # Devuelve (etag, última modificación, ETag de la 304 o None)
+    etag = calcular_etag(sellos, ruta)
+    ultima = ultima_modificacion(sellos)
+    if_none_match = cabeceras.get('if-none-match')
+    return etag, ultima, no_modificado(
+        etag, ultima,
+        parse_etags(if_none_match) if if_none_match else None,
+        parse_date(cabeceras.get('if-modified-since'))
+    )
+
+
+def responder_condicional(sellos, generar):
+    # sellos: tuplas (tabla, version o id, updated_at) que cambian siempre que
+    # cambia el recurso. Si coinciden con If-None-Match / If-Modified-Since se
+    # responde 304 sin llamar a generar(), es decir, sin leer ni serializar filas.
+    # Si el cuerpo comprimido para ese ETag ya está en caché tampoco se genera.
+    if sellos is None:
+        return generar()
+    etag = calcular_etag(sellos, request.full_path)
+    ultima = ultima_modificacion(sellos)
+    compresion = current_app.extensions.get('compresion')
+    codificacion = compresion.negociar(request.headers.get('Accept-Encoding')) if compresion else None
+
+    coincidente = no_modificado(etag, ultima, request.if_none_match, request.if_modified_since)
+    cuerpo = None
+    if not coincidente and codificacion:
+        cuerpo = compresion.cuerpo_cacheado(etag, codificacion)
+    if coincidente:
+        respuesta = Response(status=304)
+        respuesta.set_etag(coincidente)
+    elif cuerpo is not None:
+        respuesta = compresion.aplicar(Response(mimetype='application/json'), cuerpo, codificacion)
+        respuesta.set_etag(etag_codificado(etag, codificacion))
+    else:
+        cache = current_app.extensions.get('cache')
+        if cache is not None:
+            with cache.sellada(sellos):
+                respuesta = make_response(generar())
+        else:
+            respuesta = make_response(generar())
+        if respuesta.status_code != 200:
+            return respuesta
+        respuesta.set_etag(etag)
+        if compresion:
+            compresion.comprimir_respuesta(respuesta, etag)
+    if compresion and compresion.activa:
+        respuesta.vary.add('Accept-Encoding')
+    if ultima:
+        respuesta.last_modified = ultima
+    respuesta.headers['Cache-Control'] = 'no-cache'
+    return respuesta
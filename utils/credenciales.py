@@ -0,0 +1,179 @@
+# Búsqueda de credenciales por email y filtro de emails registrados.
+#
+# El email se guarda también normalizado (sin espacios y con casefold) en
+# usuarios.email_normalizado, con su propio índice único: el login lee solo id
+# y password por esa clave, y "Ana@Correo.com" y "ana@correo.com" son la misma
+# cuenta.
+#
+# El registro consulta antes un filtro de Bloom con las claves existentes. Si
+# la clave no está en el filtro no se consulta la base de datos y el índice
+# único decide en el INSERT; si puede estar, se comprueba antes de calcular el
+# hash. El filtro se construye al primer uso y se mantiene como el índice de
+# búsqueda: tras cada commit con las claves escritas en la sesión, y cada
+# CREDENTIALS_SYNC_INTERVAL segundos con las filas de updated_at reciente (las
+# altas de otros procesos). Una clave no se puede quitar de un filtro de Bloom:
+# las bajas se cuentan y el filtro se reconstruye cuando pasan de la décima
+# parte de su capacidad, o cuando se llena.
+#
+# El login no usa el filtro: una cuenta dada de alta en otro proceso y aún no
+# sincronizada recibiría un 401.
+#
+#   CREDENTIALS_FILTER          True
+#   CREDENTIALS_FILTER_ERROR    0.01   falsos positivos con el filtro lleno
+#   CREDENTIALS_SYNC_INTERVAL   30     segundos
+import hashlib
+import math
+import threading
+import time
+from datetime import timedelta
+from sqlalchemy import event, func, inspect, select
+from utils.busqueda import clave_url
+from utils.versiones import ahora
+
+CLAVE = 'cambios_credenciales'
+CAPACIDAD_MINIMA = 1024
+# Margen al releer filas recientes, como en utils.busqueda
+MARGEN_SINCRONIZACION = timedelta(seconds=5)
+
+
+def normalizar_email(email):
+    # Las variantes de mayúsculas y espacios del mismo email son la misma clave
+    return email.strip().casefold() if isinstance(email, str) else None
+
+
+class FiltroBloom:
+    def __init__(self, capacidad, error=0.01):
+        self.capacidad = capacidad
+        self.bits = max(64, int(-capacidad * math.log(error) / math.log(2) ** 2))
+        self.funciones = max(1, round(self.bits / capacidad * math.log(2)))
+        self.mapa = bytearray((self.bits + 7) // 8)
+        self.elementos = 0
+        self.bajas = 0
+        self.sincronizado = None  # updated_at desde el que releer filas
+        self.comprobado = 0       # time.monotonic() de la última sincronización
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.elementos
+
+    def posiciones(self, clave):
+        # Doble hash: h1 + i * h2 con las dos mitades de un blake2b de 128 bits
+        resumen = hashlib.blake2b(clave.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(resumen[:8], 'little')
+        h2 = int.from_bytes(resumen[8:], 'little') | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.funciones)]
+
+    def anadir(self, clave):
+        with self.lock:
+            nueva = False
+            for posicion in self.posiciones(clave):
+                byte, bit = posicion >> 3, 1 << (posicion & 7)
+                if not self.mapa[byte] & bit:
+                    self.mapa[byte] |= bit
+                    nueva = True
+            self.elementos += nueva
+
+    def __contains__(self, clave):
+        return all(self.mapa[p >> 3] & (1 << (p & 7)) for p in self.posiciones(clave))
+
+    def lleno(self):
+        return self.elementos >= self.capacidad or self.bajas > self.capacidad // 10
+
+
+class Credenciales:
+    def __init__(self, app=None):
+        self.activo = True
+        self.error = 0.01
+        self.intervalo = 30
+        self.modelo = None
+        self.filtros = {}
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.activo = app.config.get('CREDENTIALS_FILTER', True)
+        self.error = app.config.get('CREDENTIALS_FILTER_ERROR', self.error)
+        self.intervalo = app.config.get('CREDENTIALS_SYNC_INTERVAL', self.intervalo)
+        self.filtros = {}
+        app.extensions['credenciales'] = self
+
+    def seguir(self, session, modelo):
+        # modelo: Usuario, con email_normalizado y updated_at. Las claves nuevas
+        # (altas y cambios de email) entran en el filtro tras el commit.
+        self.modelo = modelo
+
+        @event.listens_for(session, 'after_flush')
+        def tras_flush(sesion, contexto):
+            for obj in sesion.new:
+                if isinstance(obj, modelo):
+                    self.registrar(sesion, [obj.email_normalizado])
+            for obj in sesion.dirty:
+                if isinstance(obj, modelo) and inspect(obj).attrs.email_normalizado.history.has_changes():
+                    self.registrar(sesion, [obj.email_normalizado], bajas=1)
+            for obj in sesion.deleted:
+                if isinstance(obj, modelo):
+                    self.registrar(sesion, bajas=1)
+
+        @event.listens_for(session, 'after_commit')
+        def tras_commit(sesion):
+            cambios = sesion.info.pop(CLAVE, None)
+            filtro = self.filtros.get(clave_url(sesion.get_bind().url))
+            if cambios is None or filtro is None:
+                return
+            for clave in cambios['claves']:
+                filtro.anadir(clave)
+            filtro.bajas += cambios['bajas']
+
+        @event.listens_for(session, 'after_transaction_end')
+        def tras_transaccion(sesion, transaccion):
+            if transaccion.parent is None:
+                sesion.info.pop(CLAVE, None)
+
+    def registrar(self, sesion, claves=(), bajas=0):
+        # Para las escrituras con sentencias (PATCH), que no pasan por los objetos
+        pendientes = sesion.info.setdefault(CLAVE, {'claves': [], 'bajas': 0})
+        pendientes['claves'].extend(claves)
+        pendientes['bajas'] += bajas
+
+    def conocida(self, sesion, clave):
+        # Una clave que el INSERT ha encontrado ya en la tabla
+        filtro = self.filtros.get(clave_url(sesion.get_bind().url))
+        if filtro is not None:
+            filtro.anadir(clave)
+
+    def puede_existir(self, sesion, clave):
+        # False si la clave seguro que no existe (no hace falta consultarla)
+        if not self.activo:
+            return True
+        return clave in self.filtro(sesion)
+
+    def filtro(self, sesion):
+        url = clave_url(sesion.get_bind().url)
+        filtro = self.filtros.get(url)
+        if filtro is not None and not filtro.lleno() \
+                and time.monotonic() - filtro.comprobado < self.intervalo:
+            return filtro
+        with self.lock:
+            filtro = self.filtros.get(url)
+            if filtro is None or filtro.lleno():
+                filtro = self.filtros[url] = self.construir(sesion)
+            elif time.monotonic() - filtro.comprobado >= self.intervalo:
+                self.sincronizar(sesion, filtro)
+        return filtro
+
+    def construir(self, sesion):
+        total = sesion.scalar(select(func.count()).select_from(self.modelo))
+        filtro = FiltroBloom(max(2 * total, CAPACIDAD_MINIMA), self.error)
+        self.sincronizar(sesion, filtro)
+        return filtro
+
+    def sincronizar(self, sesion, filtro):
+        modelo = self.modelo
+        consulta = select(modelo.email_normalizado)
+        if filtro.sincronizado is not None:
+            consulta = consulta.where(modelo.updated_at >= filtro.sincronizado - MARGEN_SINCRONIZACION)
+        inicio = ahora()
+        for clave in sesion.scalars(consulta.execution_options(yield_per=10000)):
+            filtro.anadir(clave)
+        filtro.sincronizado, filtro.comprobado = inicio, time.monotonic()
@@ -0,0 +1,316 @@
+# Feed de cambios: un evento compacto por cada fila escrita, publicado tras el commit.
+#
+#   {"tabla": "productos", "op": "actualizar", "id": 5, "datos": {"precio": 9.5, "version": 3}}
+#
+# `datos` lleva solo las columnas publicables que han cambiado (en un alta,
+# todas); nunca email ni password. Las escrituras ORM se recogen solas en el
+# flush; las masivas, que son sentencias sobre la tabla, llaman a registrar().
+# Lo escrito dentro de un SAVEPOINT que se deshace no se publica.
+#
+# El broker numera los eventos y guarda los últimos EVENTS_BUFFER_SIZE, para que
+# un suscriptor que se reconecta con Last-Event-ID reciba lo que se perdió; si
+# ese id ya ha salido del buffer, recibe un evento `reset` y debe volver a leer
+# el listado. Con varios workers, EVENTS_BROKER=redis (Redis Streams): cada
+# worker publica en el mismo stream y cada suscriptor lee de él.
+#
+#   EVENTS_BROKER         'memory' (por proceso) o 'redis'
+#   EVENTS_REDIS_URL      por defecto CACHE_REDIS_URL
+#   EVENTS_BUFFER_SIZE    1000
+#   STREAM_MAX_CLIENTS    conexiones SSE abiertas a la vez (cada una ocupa un hilo en WSGI)
+#   STREAM_MAX_SECONDS    duración de cada conexión; el cliente se reconecta solo
+#   STREAM_KEEPALIVE      segundos sin eventos entre comentarios de keepalive
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import Counter, deque
+from itertools import islice
+from sqlalchemy import event, inspect
+
+CLAVE = 'eventos_pendientes'
+CLAVE_MARCAS = 'eventos_marcas'
+
+logger = logging.getLogger(__name__)
+
+
+class StreamSaturado(Exception):
+    pass
+
+
+def interpretar_id(id_evento):
+    # 'época-secuencia' (el formato de los ids de Redis Streams) -> (int, int)
+    try:
+        epoca, _, secuencia = id_evento.partition('-')
+        return int(epoca), int(secuencia or 0)
+    except (AttributeError, ValueError):
+        return None
+
+
+def evento(tabla, op, id_, datos=None):
+    return {'tabla': tabla, 'op': op, 'id': id_, 'datos': datos or {}}
+
+
+def cambios(obj, campos):
+    # Columnas publicables modificadas en el flush. La columna de versión
+    # (version_id_col) la escribe el propio UPDATE, sin historial: se añade
+    # siempre que haya otro cambio.
+    estado = inspect(obj)
+    datos = {c: getattr(obj, c) for c in campos if estado.attrs[c].history.has_changes()}
+    columna = estado.mapper.version_id_col
+    if datos and columna is not None:
+        clave = estado.mapper.get_property_by_column(columna).key
+        if clave in campos:
+            datos[clave] = getattr(obj, clave)
+    return datos
+
+
+# ------------------------- BROKERS -------------------------
+class BrokerMemoria:
+    # Buffer circular en proceso. Los ids llevan la época del proceso: tras un
+    # reinicio, un Last-Event-ID anterior no se confunde con los nuevos
+    def __init__(self, tamano=1000):
+        self.epoca = int(time.time() * 1000)
+        self.eventos = deque(maxlen=tamano)
+        self.ultimo = 0
+        self.condicion = threading.Condition()
+
+    def publicar(self, eventos):
+        with self.condicion:
+            for e in eventos:
+                self.ultimo += 1
+                self.eventos.append(e)
+            self.condicion.notify_all()
+
+    def ultimo_id(self):
+        return '%d-%d' % (self.epoca, self.ultimo)
+
+    def disponible(self, desde):
+        # True si todos los eventos posteriores a `desde` siguen en el buffer
+        id_ = interpretar_id(desde)
+        if id_ is None or id_[0] != self.epoca:
+            return False
+        with self.condicion:
+            return self.ultimo - len(self.eventos) <= id_[1] <= self.ultimo
+
+    def leer(self, desde, timeout=0):
+        # [(id, evento)] posteriores a `desde`; espera hasta `timeout` segundos si no hay
+        secuencia = interpretar_id(desde)[1]
+        with self.condicion:
+            if timeout and self.ultimo <= secuencia:
+                self.condicion.wait(timeout)
+            primero = self.ultimo - len(self.eventos) + 1
+            inicio = max(secuencia + 1, primero)
+            return [
+                ('%d-%d' % (self.epoca, n), e)
+                for n, e in enumerate(islice(self.eventos, inicio - primero, None), inicio)
+            ]
+
+
+class BrokerRedis:
+    # Redis Streams: XADD con MAXLEN hace de buffer circular compartido y los
+    # ids del stream son los del evento SSE
+    def __init__(self, cliente, clave, tamano=1000):
+        self.cliente = cliente
+        self.clave = clave
+        self.tamano = tamano
+
+    @classmethod
+    def desde_url(cls, url, prefijo='recursoapi:', tamano=1000):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('EVENTS_BROKER=redis requiere el paquete redis')
+        return cls(redis.Redis.from_url(url), prefijo + 'eventos', tamano)
+
+    def publicar(self, eventos):
+        tuberia = self.cliente.pipeline(transaction=False)
+        for e in eventos:
+            tuberia.xadd(self.clave, {'e': json.dumps(e)}, maxlen=self.tamano, approximate=True)
+        tuberia.execute()
+
+    def ultimo_id(self):
+        ultimo = self.cliente.xrevrange(self.clave, count=1)
+        return ultimo[0][0].decode() if ultimo else '0-0'
+
+    def disponible(self, desde):
+        id_ = interpretar_id(desde)
+        if id_ is None:
+            return False
+        if not self.cliente.exists(self.clave):
+            return id_ == (0, 0)
+        # max-deleted-entry-id (Redis >= 7): el último id recortado del stream
+        borrado = self.cliente.xinfo_stream(self.clave).get('max-deleted-entry-id', b'0-0')
+        borrado = interpretar_id(borrado.decode() if isinstance(borrado, bytes) else borrado)
+        return borrado is None or id_ >= borrado
+
+    def leer(self, desde, timeout=0):
+        respuesta = self.cliente.xread({self.clave: desde}, count=500,
+                                       block=int(timeout * 1000) if timeout else None)
+        if not respuesta:
+            return []
+        return [(id_.decode(), json.loads(campos[b'e'])) for id_, campos in respuesta[0][1]]
+
+
+# ------------------------- EVENTOS -------------------------
+class Eventos:
+    def __init__(self, app=None):
+        self.broker = BrokerMemoria()
+        self.publicados = Counter()
+        self.errores = 0
+        self.clientes = 0
+        self.max_clientes = 100
+        self.duracion = 300
+        self.keepalive = 15
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        tipo = app.config.get('EVENTS_BROKER', 'memory')
+        tamano = app.config.get('EVENTS_BUFFER_SIZE', 1000)
+        if tipo == 'memory':
+            self.broker = BrokerMemoria(tamano)
+        elif tipo == 'redis':
+            self.broker = BrokerRedis.desde_url(
+                app.config.get('EVENTS_REDIS_URL')
+                or app.config.get('CACHE_REDIS_URL', 'redis://localhost:6379/0'),
+                app.config.get('CACHE_KEY_PREFIX', 'recursoapi:'),
+                tamano
+            )
+        else:
+            raise ValueError('EVENTS_BROKER no válido: %s' % tipo)
+        self.max_clientes = app.config.get('STREAM_MAX_CLIENTS', 100)
+        self.duracion = app.config.get('STREAM_MAX_SECONDS', 300)
+        self.keepalive = app.config.get('STREAM_KEEPALIVE', 15)
+        app.extensions['eventos'] = self
+
+    # ------------------------- CAPTURA -------------------------
+    def seguir(self, session, campos):
+        # campos: modelo -> columnas cuyo valor se publica
+        @event.listens_for(session, 'after_flush')
+        def tras_flush(sesion, contexto):
+            pendientes = []
+            for obj in sesion.new:
+                if type(obj) in campos:
+                    pendientes.append(evento(obj.__tablename__, 'crear', obj.id,
+                                             {c: getattr(obj, c) for c in campos[type(obj)]}))
+            for obj in sesion.dirty:
+                if type(obj) in campos and sesion.is_modified(obj):
+                    datos = cambios(obj, campos[type(obj)])
+                    if datos:
+                        pendientes.append(evento(obj.__tablename__, 'actualizar', obj.id, datos))
+            for obj in sesion.deleted:
+                if type(obj) in campos:
+                    pendientes.append(evento(obj.__tablename__, 'eliminar', obj.id))
+            self.registrar(sesion, pendientes)
+
+        # Un SAVEPOINT deshecho descarta los eventos registrados dentro de él
+        @event.listens_for(session, 'after_transaction_create')
+        def tras_crear(sesion, transaccion):
+            if transaccion.nested:
+                sesion.info.setdefault(CLAVE_MARCAS, {})[transaccion] = len(sesion.info.get(CLAVE, ()))
+
+        @event.listens_for(session, 'after_soft_rollback')
+        def tras_deshacer(sesion, transaccion):
+            marca = sesion.info.get(CLAVE_MARCAS, {}).pop(transaccion, None)
+            if transaccion.nested and marca is not None:
+                del sesion.info.get(CLAVE, [])[marca:]
+
+        @event.listens_for(session, 'after_commit')
+        def tras_commit(sesion):
+            if sesion.in_nested_transaction():
+                return
+            pendientes = sesion.info.pop(CLAVE, None)
+            if pendientes:
+                self.publicar(pendientes)
+
+        @event.listens_for(session, 'after_transaction_end')
+        def tras_transaccion(sesion, transaccion):
+            if transaccion.parent is None:
+                sesion.info.pop(CLAVE, None)
+                sesion.info.pop(CLAVE_MARCAS, None)
+
+    def registrar(self, sesion, eventos):
+        # Eventos de la transacción en curso; para las escrituras masivas
+        if eventos:
+            sesion.info.setdefault(CLAVE, []).extend(eventos)
+
+    def publicar(self, eventos):
+        # El commit ya está hecho: un fallo del broker no puede convertirlo en un error
+        try:
+            self.broker.publicar(eventos)
+        except Exception:
+            self.errores += 1
+            logger.exception('No se han podido publicar %d eventos', len(eventos))
+            return
+        self.publicados.update(e['tabla'] for e in eventos)
+
+    # ------------------------- SERVER-SENT EVENTS -------------------------
+    def abrir(self):
+        # Ocupa una conexión y devuelve la función que la libera, una sola vez.
+        # La vista la llama al cerrarse la respuesta (call_on_close en WSGI, al
+        # terminar de enviarla en ASGI), no al acabar el generador: si el cliente
+        # se va antes de leer, el generador no llega a empezar.
+        with self.lock:
+            if self.clientes >= self.max_clientes:
+                raise StreamSaturado()
+            self.clientes += 1
+        abierta = [True]
+
+        def cerrar():
+            with self.lock:
+                if abierta:
+                    abierta.clear()
+                    self.clientes -= 1
+        return cerrar
+
+    def inicio(self, desde):
+        # (id desde el que leer, mensajes iniciales). Sin Last-Event-ID se empieza
+        # por el final; con uno que ya no está en el buffer, evento reset.
+        mensajes = ['retry: 3000\n\n']
+        if desde and self.broker.disponible(desde):
+            return desde, mensajes
+        ultimo = self.broker.ultimo_id()
+        if desde:
+            mensajes.append('id: %s\nevent: reset\ndata: {}\n\n' % ultimo)
+        return ultimo, mensajes
+
+    def mensajes(self, nuevos, tablas):
+        return [
+            'id: %s\nevent: %s.%s\ndata: %s\n\n' % (
+                id_, e['tabla'], e['op'], json.dumps(e, separators=(',', ':'), default=str))
+            for id_, e in nuevos if e['tabla'] in tablas
+        ]
+
+    def flujo(self, tablas, desde=None):
+        # Generador SSE (WSGI): bloquea el hilo esperando eventos
+        desde, mensajes = self.inicio(desde)
+        yield ''.join(mensajes)
+        fin = time.monotonic() + self.duracion
+        while time.monotonic() < fin:
+            nuevos = self.broker.leer(desde, timeout=min(self.keepalive, max(fin - time.monotonic(), 0.01)))
+            if nuevos:
+                desde = nuevos[-1][0]
+            yield ''.join(self.mensajes(nuevos, tablas)) or ': keepalive\n\n'
+
+    async def flujo_async(self, tablas, desde=None, intervalo=0.5):
+        # Generador SSE (ASGI): consulta el broker cada `intervalo` segundos, sin
+        # esperar en él. La consulta (una ida y vuelta a Redis con EVENTS_BROKER
+        # = redis) va a un hilo para no bloquear el bucle de eventos.
+        desde, mensajes = await asyncio.to_thread(self.inicio, desde)
+        yield ''.join(mensajes)
+        fin = time.monotonic() + self.duracion
+        silencio = time.monotonic()
+        while time.monotonic() < fin:
+            nuevos = await asyncio.to_thread(self.broker.leer, desde)
+            if nuevos:
+                desde = nuevos[-1][0]
+                salida = ''.join(self.mensajes(nuevos, tablas))
+                if salida:
+                    silencio = time.monotonic()
+                    yield salida
+            if time.monotonic() - silencio >= self.keepalive:
+                silencio = time.monotonic()
+                yield ': keepalive\n\n'
+            await asyncio.sleep(intervalo)
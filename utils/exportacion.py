@@ -0,0 +1,118 @@
+# Exportación de listados completos por trozos: CSV, NDJSON o Parquet.
+#
+# Las filas llegan por lotes de un cursor de servidor (yield_per), y cada lote
+# se escribe y se envía antes de leer el siguiente: la memoria depende del
+# tamaño del lote, no del número de filas.
+#
+#   EXPORT_BATCH_SIZE       filas por lote leído de la base de datos (5000)
+#   EXPORT_ROW_GROUP_SIZE   filas por row group de Parquet (100000); es lo que
+#                           se acumula en memoria antes de escribir
+#
+# pyarrow es opcional: sin él, format=parquet no está disponible. Parquet ya va
+# comprimido por columnas, así que no se vuelve a comprimir con Accept-Encoding.
+import csv
+import io
+from flask import current_app
+from utils.serializacion import volcador_bytes
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# formato -> (tipo MIME, extensión)
+FORMATOS = {
+    'csv': ('text/csv', '.csv'),
+    'ndjson': ('application/x-ndjson', '.ndjson'),
+    'parquet': ('application/vnd.apache.parquet', '.parquet')
+}
+
+
+def formatos_disponibles():
+    return [f for f in FORMATOS if f != 'parquet' or pyarrow is not None]
+
+
+def tamano_lote():
+    return current_app.config.get('EXPORT_BATCH_SIZE', 5000)
+
+
+def escribir_csv(columnas, lotes):
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer, lineterminator='\n')
+    escritor.writerow([nombre for nombre, _ in columnas])
+    for lote in lotes:
+        escritor.writerows(lote)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def escribir_ndjson(columnas, lotes):
+    nombres = [nombre for nombre, _ in columnas]
+    volcar = volcador_bytes()
+    for lote in lotes:
+        yield b'\n'.join(volcar(dict(zip(nombres, fila))) for fila in lote) + b'\n'
+
+
+class Sumidero(io.RawIOBase):
+    # Fichero de solo escritura que guarda lo escrito hasta que se vacía: el
+    # ParquetWriter escribe en él y lo escrito se envía tras cada row group
+    def __init__(self):
+        self.trozos = []
+        self.posicion = 0
+
+    def writable(self):
+        return True
+
+    def write(self, datos):
+        self.trozos.append(bytes(datos))
+        self.posicion += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self.posicion
+
+    def vaciar(self):
+        datos = b''.join(self.trozos)
+        self.trozos = []
+        return datos
+
+
+TIPOS_PARQUET = {int: 'int64', float: 'float64', str: 'string'}
+
+
+def escribir_parquet(columnas, lotes):
+    tamano_grupo = current_app.config.get('EXPORT_ROW_GROUP_SIZE', 100000)
+    esquema = pyarrow.schema([(nombre, TIPOS_PARQUET[tipo]) for nombre, tipo in columnas])
+    sumidero = Sumidero()
+    escritor = pyarrow.parquet.ParquetWriter(sumidero, esquema)
+
+    def escribir_grupo(filas):
+        escritor.write_table(pyarrow.Table.from_arrays(
+            [pyarrow.array(valores, tipo) for valores, tipo in zip(zip(*filas), esquema.types)],
+            schema=esquema
+        ))
+        return sumidero.vaciar()
+
+    grupo = []
+    for lote in lotes:
+        grupo.extend(lote)
+        while len(grupo) >= tamano_grupo:
+            yield escribir_grupo(grupo[:tamano_grupo])
+            del grupo[:tamano_grupo]
+    if grupo:
+        yield escribir_grupo(grupo)
+    escritor.close()
+    yield sumidero.vaciar()
+
+
+ESCRITORES = {'csv': escribir_csv, 'ndjson': escribir_ndjson, 'parquet': escribir_parquet}
+
+
+def exportar(formato, columnas, lotes):
+    # columnas: [(nombre, tipo)], tipo int, float o str; lotes: listas de
+    # filas (tuplas en el orden de columnas). Genera el fichero en bytes.
+    return ESCRITORES[formato](columnas, lotes)
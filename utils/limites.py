@@ -0,0 +1,182 @@
+# Limitación de peticiones por cubo de tokens (token bucket).
+#
+# Cada regla da a cada clave (IP, usuario o email de login, siempre dentro de
+# una ruta) un cubo de N tokens que se rellena a N por periodo. Una petición sin
+# token se rechaza con 429 y Retry-After antes de ejecutar el handler: sin
+# consultas a la base de datos ni cálculo de hashes.
+#
+#   @limitador.limite('10/minute', clave='ip')
+#
+#   RATE_LIMIT_ENABLED       True
+#   RATE_LIMIT_STORAGE       'memory' (por proceso) o 'redis' (compartido entre nodos)
+#   RATE_LIMIT_REDIS_URL     por defecto CACHE_REDIS_URL
+#   RATE_LIMITS              {'login:ip': '20/minute', ...}   sustituye la tasa de
+#                            una regla, por nombre de la ruta y tipo de clave
+#   RATE_LIMIT_TRUST_PROXY   True si X-Forwarded-For lo pone un proxy de confianza
+import math
+import threading
+import time
+from collections import Counter, OrderedDict
+from functools import wraps
+from flask import current_app, request
+from utils.credenciales import normalizar_email
+
+PERIODOS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+class LimiteExcedido(Exception):
+    def __init__(self, espera):
+        super().__init__('Demasiadas peticiones')
+        self.espera = espera
+
+    @property
+    def retry_after(self):
+        return str(max(1, math.ceil(self.espera)))
+
+
+def interpretar_tasa(tasa):
+    # '10/minute' -> (capacidad 10, 10/60 tokens por segundo)
+    cantidad, _, periodo = tasa.partition('/')
+    cantidad = int(cantidad)
+    if periodo not in PERIODOS or cantidad <= 0:
+        raise ValueError('Tasa no válida: %s' % tasa)
+    return cantidad, cantidad / PERIODOS[periodo]
+
+
+# ------------------------- BACKENDS -------------------------
+class CubosMemoria:
+    # clave -> (tokens, instante de la última actualización); LRU acotada
+    def __init__(self, max_claves=100000):
+        self.max_claves = max_claves
+        self.cubos = OrderedDict()
+        self.lock = threading.Lock()
+
+    def consumir(self, clave, capacidad, por_segundo, coste=1):
+        # Devuelve 0 si hay tokens, o los segundos hasta que los haya
+        ahora = time.monotonic()
+        with self.lock:
+            tokens, ultimo = self.cubos.get(clave, (capacidad, ahora))
+            tokens = min(capacidad, tokens + (ahora - ultimo) * por_segundo)
+            espera = 0
+            if tokens >= coste:
+                tokens -= coste
+            else:
+                espera = (coste - tokens) / por_segundo
+            self.cubos[clave] = (tokens, ahora)
+            self.cubos.move_to_end(clave)
+            while len(self.cubos) > self.max_claves:
+                self.cubos.popitem(last=False)
+        return espera
+
+
+# El cubo se lee y actualiza en un solo paso atómico dentro de Redis, con su reloj
+# (TIME), para que varios nodos compartan el mismo límite sin carreras
+SCRIPT_CUBO = """
+local capacidad = tonumber(ARGV[1])
+local por_segundo = tonumber(ARGV[2])
+local coste = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local ahora = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local cubo = redis.call('HMGET', KEYS[1], 'tokens', 'ultimo')
+local tokens = tonumber(cubo[1]) or capacidad
+local ultimo = tonumber(cubo[2]) or ahora
+tokens = math.min(capacidad, tokens + math.max(0, ahora - ultimo) * por_segundo)
+local espera = 0
+if tokens >= coste then
+    tokens = tokens - coste
+else
+    espera = (coste - tokens) / por_segundo
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ultimo', tostring(ahora))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacidad / por_segundo * 1000))
+return tostring(espera)
+"""
+
+
+class CubosRedis:
+    def __init__(self, cliente, prefijo='recursoapi:'):
+        self.cliente = cliente
+        self.prefijo = prefijo + 'limite:'
+        self.script = cliente.register_script(SCRIPT_CUBO)
+
+    @classmethod
+    def desde_url(cls, url, prefijo='recursoapi:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('RATE_LIMIT_STORAGE=redis requiere el paquete redis')
+        return cls(redis.Redis.from_url(url), prefijo)
+
+    def consumir(self, clave, capacidad, por_segundo, coste=1):
+        return float(self.script(keys=[self.prefijo + clave], args=[capacidad, por_segundo, coste]))
+
+
+# ------------------------- LIMITADOR -------------------------
+class Limitador:
+    def __init__(self, app=None):
+        self.activo = True
+        self.cubos = CubosMemoria()
+        self.tasas = {}
+        self.confiar_proxy = False
+        self.rechazos = Counter()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.activo = app.config.get('RATE_LIMIT_ENABLED', True)
+        self.confiar_proxy = app.config.get('RATE_LIMIT_TRUST_PROXY', False)
+        self.tasas = {regla: interpretar_tasa(tasa) for regla, tasa in app.config.get('RATE_LIMITS', {}).items()}
+        tipo = app.config.get('RATE_LIMIT_STORAGE', 'memory')
+        if tipo == 'memory':
+            self.cubos = CubosMemoria()
+        elif tipo == 'redis':
+            self.cubos = CubosRedis.desde_url(
+                app.config.get('RATE_LIMIT_REDIS_URL')
+                or app.config.get('CACHE_REDIS_URL', 'redis://localhost:6379/0'),
+                app.config.get('CACHE_KEY_PREFIX', 'recursoapi:')
+            )
+        else:
+            raise ValueError('RATE_LIMIT_STORAGE no válido: %s' % tipo)
+        app.extensions['limitador'] = self
+
+    def comprobar(self, ruta, clave, valor, tasa):
+        # Consume un token de la regla ruta:clave para valor, o lanza LimiteExcedido
+        if not self.activo or valor is None:
+            return
+        regla = '%s:%s' % (ruta, clave)
+        capacidad, por_segundo = self.tasas.get(regla) or interpretar_tasa(tasa)
+        espera = self.cubos.consumir('%s:%s' % (regla, valor), capacidad, por_segundo)
+        if espera > 0:
+            self.rechazos[ruta] += 1
+            raise LimiteExcedido(espera)
+
+    def ip(self):
+        if self.confiar_proxy and request.access_route:
+            return request.access_route[0]
+        return request.remote_addr
+
+    def valor_clave(self, clave):
+        if clave == 'ip':
+            return self.ip()
+        if clave == 'usuario':
+            # Identidad del token ya verificado (auth.requerido va antes); sin token, la IP
+            autenticacion = current_app.extensions.get('autenticacion')
+            identidad = autenticacion.identidad() if autenticacion else None
+            return identidad if identidad is not None else self.ip()
+        if clave == 'email':
+            data = request.get_json(silent=True)
+            return normalizar_email(data.get('email') if isinstance(data, dict) else None)
+        raise ValueError('Clave de limitación no válida: %s' % clave)
+
+    def limite(self, tasa, clave='ip'):
+        interpretar_tasa(tasa)
+
+        def decorador(f):
+            @wraps(f)
+            def envoltorio(*args, **kwargs):
+                self.comprobar(f.__name__, clave, self.valor_clave(clave), tasa)
+                return f(*args, **kwargs)
+            # Reglas de la ruta, para aplicarlas también en el modo ASGI
+            envoltorio.limites = [(clave, tasa)] + getattr(f, 'limites', [])
+            return envoltorio
+        return decorador
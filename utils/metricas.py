@@ -0,0 +1,209 @@
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Métricas en formato de exposición de Prometheus, sin dependencias externas.
+# Cada observación es un bisect y unas sumas bajo un lock, para poder dejarlo
+# activo en producción (ver benchmarks/bench_metricas.py).
+
+BUCKETS_LATENCIA = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BUCKETS_TAMANO = (100, 1000, 10000, 100000, 1000000, 10000000)
+BUCKETS_SENTENCIAS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def etiquetas(nombres, valores, extra=''):
+    pares = ['%s="%s"' % (n, escapar(v)) for n, v in zip(nombres, valores)]
+    if extra:
+        pares.append(extra)
+    return '{%s}' % ','.join(pares) if pares else ''
+
+
+def formato(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Contador:
+    tipo = 'counter'
+
+    def __init__(self, nombre, ayuda, nombres_etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.nombres_etiquetas = nombres_etiquetas
+        self.valores = {}
+        self.lock = threading.Lock()
+
+    def inc(self, valores_etiquetas=(), cantidad=1):
+        with self.lock:
+            self.valores[valores_etiquetas] = self.valores.get(valores_etiquetas, 0) + cantidad
+
+    def muestras(self):
+        with self.lock:
+            valores = list(self.valores.items())
+        for clave, valor in valores:
+            yield self.nombre + etiquetas(self.nombres_etiquetas, clave), valor
+
+
+class Histograma:
+    tipo = 'histogram'
+
+    def __init__(self, nombre, ayuda, nombres_etiquetas=(), buckets=BUCKETS_LATENCIA):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.nombres_etiquetas = nombres_etiquetas
+        self.buckets = tuple(buckets)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observar(self, valor, valores_etiquetas=()):
+        indice = bisect_left(self.buckets, valor)
+        with self.lock:
+            serie = self.series.get(valores_etiquetas)
+            if serie is None:
+                # [cuenta por bucket (no acumulada)..., +Inf, suma]
+                serie = self.series[valores_etiquetas] = [0] * (len(self.buckets) + 1) + [0.0]
+            serie[indice] += 1
+            serie[-1] += valor
+
+    def muestras(self):
+        with self.lock:
+            series = [(clave, list(serie)) for clave, serie in self.series.items()]
+        for clave, serie in series:
+            acumulado = 0
+            for limite, cuenta in zip(self.buckets + ('+Inf',), serie[:-1]):
+                acumulado += cuenta
+                le = 'le="%s"' % (limite if limite == '+Inf' else formato(float(limite)))
+                yield self.nombre + '_bucket' + etiquetas(self.nombres_etiquetas, clave, le), acumulado
+            yield self.nombre + '_sum' + etiquetas(self.nombres_etiquetas, clave), serie[-1]
+            yield self.nombre + '_count' + etiquetas(self.nombres_etiquetas, clave), acumulado
+
+
+class Gauge:
+    # Valor leído al exportar (pool de conexiones, caché...). tipo='counter'
+    # para contadores que ya lleva otro componente
+    def __init__(self, nombre, ayuda, nombres_etiquetas=(), leer=None, tipo='gauge'):
+        self.tipo = tipo
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.nombres_etiquetas = nombres_etiquetas
+        self.leer = leer
+
+    def muestras(self):
+        for clave, valor in self.leer():
+            yield self.nombre + etiquetas(self.nombres_etiquetas, clave), valor
+
+
+class Metricas:
+    # Registro de métricas de la aplicación. init_app instala los hooks de
+    # petición (latencia, tamaño, estado) y, una sola vez por proceso, los
+    # eventos before/after_cursor_execute de SQLAlchemy (sentencias y tiempo SQL
+    # por petición, acumulados en una ContextVar).
+    def __init__(self, app=None):
+        self.registro = []
+        self.sql_peticion = ContextVar('sql_peticion', default=None)
+        self.sql_instalado = False
+        etiquetas_ruta = ('route', 'method', 'status')
+        self.peticiones = self.contador(
+            'http_requests_total', 'Peticiones HTTP atendidas', etiquetas_ruta)
+        self.latencia = self.histograma(
+            'http_request_duration_seconds', 'Latencia de las peticiones HTTP', etiquetas_ruta)
+        self.tamano = self.histograma(
+            'http_response_size_bytes', 'Tamaño del cuerpo de las respuestas', ('route', 'method'),
+            BUCKETS_TAMANO)
+        self.sentencias = self.histograma(
+            'http_request_sql_statements', 'Sentencias SQL por petición', ('route', 'method'),
+            BUCKETS_SENTENCIAS)
+        self.tiempo_sql = self.histograma(
+            'http_request_sql_duration_seconds', 'Tiempo en SQL por petición', ('route', 'method'))
+        if app is not None:
+            self.init_app(app)
+
+    def contador(self, *args, **kwargs):
+        metrica = Contador(*args, **kwargs)
+        self.registro.append(metrica)
+        return metrica
+
+    def histograma(self, *args, **kwargs):
+        metrica = Histograma(*args, **kwargs)
+        self.registro.append(metrica)
+        return metrica
+
+    def gauge(self, *args, **kwargs):
+        metrica = Gauge(*args, **kwargs)
+        self.registro.append(metrica)
+        return metrica
+
+    def init_app(self, app):
+        if not app.config.get('METRICS_ENABLED', True):
+            return
+        self.instalar_sql()
+        app.before_request(self.inicio_peticion)
+        app.after_request(self.fin_peticion)
+        app.extensions['metricas'] = self
+
+    # ------------------------- SQL -------------------------
+    def instalar_sql(self):
+        if self.sql_instalado:
+            return
+        self.sql_instalado = True
+
+        @event.listens_for(Engine, 'before_cursor_execute')
+        def antes(conn, cursor, sentencia, parametros, contexto, executemany):
+            if self.sql_peticion.get() is not None:
+                conn.info['metricas_inicio'] = time.perf_counter()
+
+        @event.listens_for(Engine, 'after_cursor_execute')
+        def despues(conn, cursor, sentencia, parametros, contexto, executemany):
+            acumulado = self.sql_peticion.get()
+            inicio = conn.info.pop('metricas_inicio', None)
+            if acumulado is not None and inicio is not None:
+                acumulado[0] += 1
+                acumulado[1] += time.perf_counter() - inicio
+
+    # ------------------------- PETICIONES -------------------------
+    def inicio_peticion(self):
+        g.metricas_inicio = time.perf_counter()
+        g.metricas_sql = [0, 0.0]
+        self.sql_peticion.set(g.metricas_sql)
+
+    def fin_peticion(self, respuesta):
+        inicio = g.pop('metricas_inicio', None)
+        if inicio is None:
+            return respuesta
+        # Plantilla de la ruta (/productos/<int:id>), no la URL, para acotar la cardinalidad
+        ruta = request.url_rule.rule if request.url_rule else 'desconocida'
+        metodo = request.method
+        # Sin tamaño para las respuestas por trozos: calcularlo las leería enteras
+        # (streaming, SSE, exportaciones) antes de enviarlas
+        tamano = None if respuesta.is_streamed else respuesta.calculate_content_length()
+        self.registrar(ruta, metodo, respuesta.status_code, time.perf_counter() - inicio,
+                       tamano, g.pop('metricas_sql', None))
+        self.sql_peticion.set(None)
+        return respuesta
+
+    def registrar(self, ruta, metodo, status, duracion, tamano=None, sql=None):
+        clave = (ruta, metodo, str(status))
+        self.peticiones.inc(clave)
+        self.latencia.observar(duracion, clave)
+        if tamano is not None:
+            self.tamano.observar(tamano, (ruta, metodo))
+        if sql is not None:
+            self.sentencias.observar(sql[0], (ruta, metodo))
+            self.tiempo_sql.observar(sql[1], (ruta, metodo))
+
+    # ------------------------- EXPOSICIÓN -------------------------
+    def exportar(self):
+        lineas = []
+        for metrica in self.registro:
+            lineas.append('# HELP %s %s' % (metrica.nombre, metrica.ayuda))
+            lineas.append('# TYPE %s %s' % (metrica.nombre, metrica.tipo))
+            for nombre, valor in metrica.muestras():
+                lineas.append('%s %s' % (nombre, formato(valor)))
+        return '\n'.join(lineas) + '\n'
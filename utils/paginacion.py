@@ -0,0 +1,170 @@
+import base64
+import json
+import math
+from flask import current_app
+from sqlalchemy import and_, or_
+
+# Límites de la paginación por cursor (keyset sobre la columna id)
+LIMITE_POR_DEFECTO = 100
+LIMITE_MAXIMO = 1000
+
+# Número de filas que se cargan y serializan por lote en modo streaming
+TAMANO_LOTE_STREAMING = 500
+
+
+class CursorInvalido(ValueError):
+    pass
+
+
+class LimiteInvalido(ValueError):
+    pass
+
+
+def fila_a_dict(fila):
+    # Los listados seleccionan columnas (filas Row), no objetos ORM: el dict
+    # sale directamente de la tupla, sin hidratar instancias ni llamar a to_dict()
+    return fila._asdict()
+
+
+# ------------------------- CURSORES -------------------------
+def codificar_cursor(valor):
+    datos = json.dumps(valor, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(datos).decode('ascii').rstrip('=')
+
+
+def decodificar_cursor(cursor):
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        return json.loads(base64.urlsafe_b64decode(cursor + relleno))
+    except (ValueError, TypeError):
+        raise CursorInvalido(cursor)
+
+
+def valor_de_columna(columna, valor):
+    # Cada valor del cursor ha de ser del tipo de su columna: un cursor
+    # manipulado ("5" para precio, true para id, NaN) no llega a la consulta
+    try:
+        tipo = columna.type.python_type
+    except NotImplementedError:
+        return valor is not None
+    if isinstance(valor, bool) and tipo is not bool:
+        return False
+    if tipo is float:
+        return isinstance(valor, (int, float)) and math.isfinite(valor)
+    return isinstance(valor, tipo)
+
+
+def leer_limite(valor):
+    # ?limit= de la query string. Ausente o vacío: None. Lo que no sea un
+    # entero positivo es un 400 (LimiteInvalido): ignorarlo convertiría
+    # ?limit=abc en el listado completo sin paginar
+    if valor is None or valor == '':
+        return None
+    try:
+        limit = int(valor)
+    except ValueError:
+        raise LimiteInvalido('Valor no válido para limit')
+    if limit <= 0:
+        raise LimiteInvalido('Valor no válido para limit')
+    return limit
+
+
+def normalizar_limite(limit):
+    if limit is None or limit <= 0:
+        return LIMITE_POR_DEFECTO
+    return min(limit, LIMITE_MAXIMO)
+
+
+# ------------------------- PAGINACIÓN -------------------------
+def columnas_de_orden(columna, ordenar_por=None):
+    # La columna única (id) siempre cierra el orden para desempatar
+    if ordenar_por is None or ordenar_por is columna:
+        return [columna]
+    return [ordenar_por, columna]
+
+
+def ordenar(query, claves, descendente=False):
+    return query.order_by(*[c.desc() if descendente else c.asc() for c in claves])
+
+
+def filtro_keyset(claves, valores, descendente=False):
+    # (a, id) > (va, vid)  ==>  a > va OR (a = va AND id > vid)
+    condiciones = []
+    for i, clave in enumerate(claves):
+        iguales = [claves[j] == valores[j] for j in range(i)]
+        siguiente = clave < valores[i] if descendente else clave > valores[i]
+        condiciones.append(and_(*iguales, siguiente))
+    return or_(*condiciones)
+
+
+def consulta_pagina(query, columna, limit=None, after=None, ordenar_por=None, descendente=False):
+    # Keyset: WHERE id > :after ORDER BY id LIMIT :limit + 1, de modo que el
+    # coste de cada página no depende de lo lejos que esté del principio.
+    # Sirve tanto para Model.query como para select() (sesión asíncrona).
+    limit = normalizar_limite(limit)
+    claves = columnas_de_orden(columna, ordenar_por)
+    if after:
+        valores = decodificar_cursor(after)
+        if len(claves) == 1:
+            valores = [valores]
+        if not isinstance(valores, list) or len(valores) != len(claves) \
+                or not all(map(valor_de_columna, claves, valores)):
+            raise CursorInvalido(after)
+        query = query.filter(filtro_keyset(claves, valores, descendente))
+    return ordenar(query, claves, descendente).limit(limit + 1), claves, limit
+
+
+def construir_pagina(filas, claves, limit, serializar=None):
+    serializar = serializar or fila_a_dict
+    siguiente = None
+    if len(filas) > limit:
+        filas = filas[:limit]
+        valores = [getattr(filas[-1], clave.key) for clave in claves]
+        siguiente = codificar_cursor(valores if len(valores) > 1 else valores[0])
+    return {
+        'items': [serializar(fila) for fila in filas],
+        'next_cursor': siguiente
+    }
+
+
+def paginar(query, columna, limit=None, after=None, serializar=None,
+            ordenar_por=None, descendente=False):
+    query, claves, limit = consulta_pagina(query, columna, limit, after, ordenar_por, descendente)
+    return construir_pagina(query.all(), claves, limit, serializar)
+
+
+# ------------------------- STREAMING -------------------------
+def serializar_en_streaming(query, columna, tamano_lote=TAMANO_LOTE_STREAMING, serializar=None,
+                            ordenar_por=None, descendente=False):
+    # Genera un array JSON por trozos: solo hay un lote de filas en memoria, y
+    # cada lote se serializa con una sola llamada al proveedor JSON
+    serializar = serializar or fila_a_dict
+    dumps = current_app.json.dumps
+    query = ordenar(query, columnas_de_orden(columna, ordenar_por), descendente)
+    yield '['
+    primero = True
+    lote = []
+    for fila in query.yield_per(tamano_lote):
+        lote.append(serializar(fila))
+        if len(lote) >= tamano_lote:
+            yield ('' if primero else ',') + dumps(lote)[1:-1]
+            primero = False
+            lote = []
+    if lote:
+        yield ('' if primero else ',') + dumps(lote)[1:-1]
+    yield ']'
+
+
+async def serializar_en_streaming_async(sesion, query, columna, tamano_lote=TAMANO_LOTE_STREAMING,
+                                        serializar=None, ordenar_por=None, descendente=False):
+    # Igual que serializar_en_streaming, con un cursor de servidor de la sesión asíncrona
+    serializar = serializar or fila_a_dict
+    dumps = current_app.json.dumps
+    query = ordenar(query, columnas_de_orden(columna, ordenar_por), descendente)
+    resultado = await sesion.stream(query.execution_options(yield_per=tamano_lote))
+    yield '['
+    primero = True
+    async for lote in resultado.partitions():
+        yield ('' if primero else ',') + dumps([serializar(fila) for fila in lote])[1:-1]
+        primero = False
+    yield ']'
@@ -0,0 +1,69 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class PoolSaturado(RuntimeError):
+    pass
+
+
+class HasherPasswords:
+    # Ejecuta el KDF de las contraseñas en un pool acotado. hashlib (scrypt,
+    # pbkdf2) libera el GIL, así que el pool de hilos ya usa varios núcleos; el
+    # de procesos aísla además la CPU del KDF de los hilos que sirven peticiones.
+    # Un semáforo limita las operaciones en curso o en cola: si no hay hueco en
+    # PASSWORD_POOL_TIMEOUT segundos se lanza PoolSaturado en lugar de encolar.
+    def __init__(self, app=None):
+        self.metodo = 'scrypt:32768:8:1'
+        self.longitud_sal = 16
+        self.tipo = 'thread'
+        self.trabajadores = os.cpu_count() or 1
+        self.timeout = 5
+        self.semaforo = None
+        self.pool = None
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.metodo = app.config.get('PASSWORD_HASH_METHOD', self.metodo)
+        self.longitud_sal = app.config.get('PASSWORD_SALT_LENGTH', self.longitud_sal)
+        self.tipo = app.config.get('PASSWORD_POOL_TYPE', self.tipo)
+        self.trabajadores = app.config.get('PASSWORD_POOL_WORKERS', self.trabajadores)
+        self.timeout = app.config.get('PASSWORD_POOL_TIMEOUT', self.timeout)
+        maximo = app.config.get('PASSWORD_POOL_MAX_PENDING', self.trabajadores * 2)
+        self.semaforo = threading.BoundedSemaphore(maximo)
+        self.cerrar()
+        app.extensions['passwords'] = self
+
+    def obtener_pool(self):
+        # El pool se crea en el primer uso, ya dentro del proceso trabajador
+        # (no antes del fork de gunicorn/uwsgi)
+        if self.pool is None:
+            with self.lock:
+                if self.pool is None:
+                    clase = ProcessPoolExecutor if self.tipo == 'process' else ThreadPoolExecutor
+                    self.pool = clase(max_workers=self.trabajadores)
+        return self.pool
+
+    def ejecutar(self, funcion, *args):
+        if self.semaforo is None or self.tipo == 'inline':
+            return funcion(*args)
+        if not self.semaforo.acquire(timeout=self.timeout):
+            raise PoolSaturado()
+        try:
+            return self.obtener_pool().submit(funcion, *args).result()
+        finally:
+            self.semaforo.release()
+
+    def hashear(self, password):
+        return self.ejecutar(generate_password_hash, password, self.metodo, self.longitud_sal)
+
+    def verificar(self, password_hash, password):
+        return self.ejecutar(check_password_hash, password_hash, password)
+
+    def cerrar(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False)
+            self.pool = None
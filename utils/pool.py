@@ -0,0 +1,77 @@
+import threading
+import time
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+
+class EstadisticasPool:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.espera_total = 0.0
+        self.espera_max = 0.0
+
+    def registrar(self, espera, timeout=False):
+        with self.lock:
+            if timeout:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.espera_total += espera
+            self.espera_max = max(self.espera_max, espera)
+
+
+class InstrumentacionPool:
+    # Mide el tiempo que tarda cada checkout en obtener conexión (incluida la
+    # espera por una libre y la creación de conexiones de overflow) y cuenta los
+    # timeouts. Las estadísticas sobreviven a recreate() (engine.dispose()).
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.estadisticas = EstadisticasPool()
+
+    def _do_get(self):
+        inicio = time.perf_counter()
+        try:
+            conexion = super()._do_get()
+        except exc.TimeoutError:
+            self.estadisticas.registrar(time.perf_counter() - inicio, timeout=True)
+            raise
+        self.estadisticas.registrar(time.perf_counter() - inicio)
+        return conexion
+
+    def recreate(self):
+        nuevo = super().recreate()
+        nuevo.estadisticas = self.estadisticas
+        return nuevo
+
+    def resumen(self):
+        e = self.estadisticas
+        return {
+            'size': self.size(),
+            'checked_in': self.checkedin(),
+            'checked_out': self.checkedout(),
+            'overflow': self.overflow(),
+            'checkouts': e.checkouts,
+            'timeouts': e.timeouts,
+            'espera_total_s': round(e.espera_total, 6),
+            'espera_media_s': round(e.espera_total / e.checkouts, 6) if e.checkouts else 0.0,
+            'espera_max_s': round(e.espera_max, 6)
+        }
+
+
+class PoolInstrumentado(InstrumentacionPool, QueuePool):
+    pass
+
+
+class PoolAsyncInstrumentado(InstrumentacionPool, AsyncAdaptedQueuePool):
+    pass
+
+
+def resumen_pools(engines):
+    # engines: {nombre: Engine}; solo se informan los pools instrumentados
+    return {
+        nombre or 'default': engine.pool.resumen()
+        for nombre, engine in engines.items()
+        if isinstance(engine.pool, InstrumentacionPool)
+    }
@@ -0,0 +1,252 @@
+# Réplicas de lectura.
+#
+# db.session elige el motor en cada consulta: las lecturas de las peticiones
+# GET/HEAD van a una réplica sana, elegida por turnos y la misma durante toda la
+# petición; todo lo demás va a la primaria: escrituras, lecturas de una
+# transacción que ya ha escrito y, durante REPLICA_STICKY_SECONDS tras una
+# escritura, las peticiones del mismo cliente (marcado con una cookie), para
+# que lea sus propios cambios.
+#
+# Cada REPLICA_CHECK_INTERVAL segundos se leen, en segundo plano, las versiones
+# de las tablas (versiones_tabla) en la primaria y en cada réplica. Una réplica
+# que no responde, o que lleva más de REPLICA_MAX_LAG segundos sin alcanzar a la
+# primaria, deja de recibir lecturas hasta la siguiente comprobación correcta;
+# sin réplicas sanas se lee de la primaria. Un error de conexión al leer de una
+# réplica también la retira.
+#
+#   SQLALCHEMY_REPLICA_URIS   ['mysql+pymysql://...', ...]; cada una es un bind (replica-0...)
+#   REPLICA_CHECK_INTERVAL    5
+#   REPLICA_MAX_LAG           5
+#   REPLICA_STICKY_SECONDS    por defecto REPLICA_MAX_LAG
+import itertools
+import math
+import threading
+import time
+import weakref
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, select
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+from sqlalchemy.sql import CompoundSelect, Select
+from utils.cambios import seguir_tablas_escritas, tablas_escritas
+from utils.versiones import ahora
+
+COOKIE = 'leer_primaria'
+PREFIJO_BIND = 'replica-'
+
+
+class SesionReplicas(Session):
+    # Sesión de db.session: las lecturas de las peticiones GET van a la réplica
+    # de la petición; el resto, al bind de siempre
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_request_context() and g.get('leer_de_replica'):
+            motor = current_app.extensions['replicas'].motor_lectura(self, clause)
+            if motor is not None:
+                return motor
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class EstadoReplica:
+    def __init__(self, nombre, url):
+        self.nombre = nombre
+        self.url = url
+        self.sana = False
+        self.retraso = None
+        self.error = 'Sin comprobar'
+        self.comprobada = None
+        self.atrasada_desde = {}    # tabla -> última escritura en la primaria al verla atrasada
+        self.peticiones = 0
+
+    def retirar(self, error):
+        self.sana, self.error = False, error
+
+    def resumen(self):
+        return {
+            'nombre': self.nombre,
+            'url': self.url,
+            'sana': self.sana,
+            'retraso_s': None if self.retraso is None else round(self.retraso, 3),
+            'error': self.error,
+            'comprobada': self.comprobada.isoformat() if self.comprobada else None,
+            'peticiones': self.peticiones
+        }
+
+
+class Replicas:
+    def __init__(self, app=None):
+        self.estados = []
+        self.versiones = None
+        self.intervalo = 5
+        self.retraso_maximo = 5
+        self.pegajoso = 5
+        self.turno = itertools.count()
+        self.peticiones_sin_replica = 0
+        self.proxima_comprobacion = 0
+        self.lock = threading.Lock()
+        self.por_motor = weakref.WeakKeyDictionary()
+        self.errores_instalado = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # Antes de db.init_app: cada réplica se añade como un bind más, con las
+        # mismas opciones de motor que la primaria
+        urls = app.config.get('SQLALCHEMY_REPLICA_URIS') or []
+        self.intervalo = app.config.get('REPLICA_CHECK_INTERVAL', 5)
+        self.retraso_maximo = app.config.get('REPLICA_MAX_LAG', 5)
+        self.pegajoso = app.config.get('REPLICA_STICKY_SECONDS') or self.retraso_maximo
+        self.estados = []
+        self.proxima_comprobacion = 0
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        for i, url in enumerate(urls):
+            nombre = PREFIJO_BIND + str(i)
+            binds[nombre] = url
+            self.estados.append(EstadoReplica(nombre, url_sin_password(url)))
+        app.config['SQLALCHEMY_BINDS'] = binds
+        app.extensions['replicas'] = self
+        if self.estados:
+            self.instalar_errores()
+            app.before_request(self.antes_peticion)
+            app.after_request(self.tras_peticion)
+
+    def seguir(self, session, versiones):
+        # versiones: modelo de versiones_tabla, con el que se mide el retraso.
+        # Tras confirmar una escritura, la respuesta marca al cliente.
+        self.versiones = versiones
+        seguir_tablas_escritas(session)
+
+        @event.listens_for(session, 'after_commit')
+        def tras_commit(sesion):
+            if not sesion.in_nested_transaction() and tablas_escritas(sesion) and has_request_context():
+                g.escritura_confirmada = True
+
+    # ------------------------- PETICIONES -------------------------
+    def antes_peticion(self):
+        if request.method in ('GET', 'HEAD') and not self.lee_sus_escrituras():
+            g.leer_de_replica = True
+
+    def tras_peticion(self, respuesta):
+        if g.pop('escritura_confirmada', False):
+            respuesta.set_cookie(COOKIE, '%.3f' % (time.time() + self.pegajoso),
+                                 max_age=math.ceil(self.pegajoso), httponly=True, samesite='Lax')
+        return respuesta
+
+    def lee_sus_escrituras(self):
+        try:
+            return float(request.cookies.get(COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def motor_lectura(self, sesion, clause):
+        # Motor de la réplica de la petición, o None para usar la primaria
+        if sesion._flushing or tablas_escritas(sesion):
+            return None
+        if clause is not None and not isinstance(clause, (Select, CompoundSelect)):
+            return None
+        if 'replica' not in g:
+            g.replica = self.elegir()
+        if g.replica is None:
+            return None
+        motor = current_app.extensions['sqlalchemy'].engines[g.replica.nombre]
+        self.por_motor[motor] = g.replica
+        # Lo que se cachee a partir de una réplica no puede sobrevivir más que su retraso
+        g.ttl_cache_maximo = self.retraso_maximo
+        return motor
+
+    def elegir(self):
+        self.programar_comprobacion()
+        sanas = [estado for estado in self.estados if estado.sana]
+        if not sanas:
+            self.peticiones_sin_replica += 1
+            return None
+        estado = sanas[next(self.turno) % len(sanas)]
+        estado.peticiones += 1
+        return estado
+
+    # ------------------------- COMPROBACIONES -------------------------
+    def programar_comprobacion(self):
+        if time.monotonic() < self.proxima_comprobacion or not self.lock.acquire(blocking=False):
+            return
+        self.proxima_comprobacion = time.monotonic() + self.intervalo
+        app = current_app._get_current_object()
+
+        def comprobar():
+            try:
+                with app.app_context():
+                    self.comprobar()
+            finally:
+                self.lock.release()
+        threading.Thread(target=comprobar, name='comprobar-replicas', daemon=True).start()
+
+    def comprobar(self):
+        # Mide el retraso de cada réplica y decide cuáles reciben lecturas
+        motores = current_app.extensions['sqlalchemy'].engines
+        instante = ahora()
+        try:
+            primaria = self.leer_versiones(motores[None])
+        except SQLAlchemyError:
+            # Sin la primaria no hay con qué comparar: se mantiene el estado anterior
+            return self.estadisticas()
+        for estado in self.estados:
+            estado.comprobada = instante
+            try:
+                replica = self.leer_versiones(motores[estado.nombre])
+            except SQLAlchemyError as e:
+                estado.retraso = None
+                estado.retirar(str(getattr(e, 'orig', None) or e))
+                continue
+            estado.retraso = self.calcular_retraso(estado, primaria, replica, instante)
+            if estado.retraso is None:
+                estado.retirar('La réplica no tiene las versiones de todas las tablas')
+            elif estado.retraso > self.retraso_maximo:
+                estado.retirar('Retraso de %.1f s' % estado.retraso)
+            else:
+                estado.sana, estado.error = True, None
+        return self.estadisticas()
+
+    def leer_versiones(self, motor):
+        modelo = self.versiones
+        with motor.connect() as conexion:
+            filas = conexion.execute(select(modelo.tabla, modelo.version, modelo.updated_at))
+            return {tabla: (version, updated_at) for tabla, version, updated_at in filas}
+
+    def calcular_retraso(self, estado, primaria, replica, instante):
+        # Segundos desde que la réplica dejó de estar al día (0 si lo está). El
+        # atraso empieza después del último cambio que tiene y no antes de la
+        # primera comprobación que lo vio; con escrituras continuas manda lo
+        # primero y con escrituras aisladas lo segundo.
+        retraso = 0.0
+        for tabla, (version, escrita) in primaria.items():
+            aplicada = replica.get(tabla)
+            if aplicada is None:
+                return None
+            if aplicada[0] >= version:
+                estado.atrasada_desde.pop(tabla, None)
+                continue
+            desde = max(estado.atrasada_desde.setdefault(tabla, escrita), aplicada[1])
+            retraso = max(retraso, (instante - desde).total_seconds())
+        return retraso
+
+    def instalar_errores(self):
+        # Un error de conexión leyendo de una réplica la retira hasta la siguiente comprobación
+        if self.errores_instalado:
+            return
+        self.errores_instalado = True
+
+        @event.listens_for(Engine, 'handle_error')
+        def error(contexto):
+            estado = self.por_motor.get(contexto.engine)
+            if estado is not None and (contexto.is_disconnect
+                                       or isinstance(contexto.sqlalchemy_exception, OperationalError)):
+                estado.retirar(str(contexto.original_exception))
+
+    def estadisticas(self):
+        return {
+            'replicas': [estado.resumen() for estado in self.estados],
+            'peticiones_sin_replica': self.peticiones_sin_replica
+        }
+
+
+def url_sin_password(url):
+    return make_url(url).render_as_string(hide_password=True)
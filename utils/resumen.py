@@ -0,0 +1,183 @@
+# Resumen del inventario por categoría, mantenido por incrementos.
+#
+# Cada escritura de productos suma a la fila de su categoría la diferencia que
+# introduce (productos, unidades, valor del stock y suma de precios), en la
+# misma transacción y con UPDATE ... SET x = x + :delta, de modo que escrituras
+# concurrentes no se pisan. El mínimo y el máximo del precio no se pueden
+# restar: se releen para cada categoría tocada, con dos búsquedas sobre el
+# índice (categoria_id, precio). Leer el resumen cuesta O(categorías).
+#
+# Las escrituras ORM (objetos de la sesión) se registran solas; las masivas,
+# que son sentencias sobre la tabla, llaman a resumen.registrar_filas().
+#
+# Solo se mantiene con STATS_SOURCE = 'summary': con 'query' los hooks no se
+# registran y no cuestan nada a las escrituras. Al pasar a 'summary' la tabla
+# se rehace con flask reconstruir-resumen.
+from sqlalchemy import delete, event, func, insert, inspect, select, update
+from utils.upsert import upsert
+from utils.versiones import ahora
+
+CLAVE = 'resumen_categorias'
+CLAVE_ELIMINADAS = 'resumen_categorias_eliminadas'
+CAMPOS = ('categoria_id', 'precio', 'cantidad')
+
+
+def valores_anteriores(obj):
+    # Valores de CAMPOS antes de los cambios pendientes del objeto
+    estado = inspect(obj)
+    valores = []
+    for campo in CAMPOS:
+        historia = estado.attrs[campo].history
+        valores.append(historia.deleted[0] if historia.deleted else getattr(obj, campo))
+    return tuple(valores)
+
+
+class Resumen:
+    def __init__(self, app=None):
+        self.activo = False
+        self.registrado = False
+        self.sesiones = []
+        self.resumen = self.modelo = self.categoria = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.activo = app.config.get('STATS_SOURCE', 'query') == 'summary'
+        if self.activo != self.registrado:
+            for session in self.sesiones:
+                for evento, funcion in self.hooks():
+                    if self.activo:
+                        # before_commit delante del de versionar_en_commit, que
+                        # ha de ser la última sentencia antes del COMMIT
+                        event.listen(session, evento, funcion, insert=evento == 'before_commit')
+                    else:
+                        event.remove(session, evento, funcion)
+            self.registrado = self.activo
+        app.extensions['resumen'] = self
+
+    def seguir(self, session, resumen, modelo, categoria):
+        # resumen: modelo de la tabla de resumen; modelo: productos; categoria:
+        # su tabla. Los hooks se registran en init_app, si el resumen está activo.
+        self.resumen, self.modelo, self.categoria = resumen, modelo, categoria
+        self.sesiones.append(session)
+
+    def hooks(self):
+        return [
+            ('after_flush', self.tras_flush),
+            ('before_commit', self.antes_commit),
+            ('after_transaction_end', self.tras_transaccion)
+        ]
+
+    def registrar_filas(self, sesion, antes=(), despues=()):
+        # Filas (categoria_id, precio, cantidad) que desaparecen y que aparecen
+        if not self.activo:
+            return
+        deltas = sesion.info.setdefault(CLAVE, {})
+        for signo, filas in ((-1, antes), (1, despues)):
+            for categoria_id, precio, cantidad in filas:
+                delta = deltas.setdefault(categoria_id, [0, 0, 0, 0])
+                delta[0] += signo
+                delta[1] += signo * cantidad
+                delta[2] += signo * precio * cantidad
+                delta[3] += signo * precio
+
+    def tras_flush(self, sesion, contexto):
+        for obj in sesion.new:
+            if isinstance(obj, self.modelo):
+                self.registrar_filas(sesion, despues=[tuple(getattr(obj, c) for c in CAMPOS)])
+        for obj in sesion.dirty:
+            if isinstance(obj, self.modelo) and sesion.is_modified(obj):
+                anteriores = valores_anteriores(obj)
+                actuales = tuple(getattr(obj, c) for c in CAMPOS)
+                if anteriores != actuales:
+                    self.registrar_filas(sesion, [anteriores], [actuales])
+        for obj in sesion.deleted:
+            if isinstance(obj, self.modelo):
+                self.registrar_filas(sesion, antes=[valores_anteriores(obj)])
+            elif isinstance(obj, self.categoria):
+                sesion.info.setdefault(CLAVE_ELIMINADAS, set()).add(obj.id)
+
+    def antes_commit(self, sesion):
+        if sesion.in_nested_transaction():
+            return
+        sesion.flush()
+        deltas = sesion.info.pop(CLAVE, None) or {}
+        eliminadas = sesion.info.pop(CLAVE_ELIMINADAS, None) or set()
+        for categoria_id in sorted(set(deltas) - eliminadas):
+            aplicar(sesion, self.resumen, self.modelo, categoria_id, deltas[categoria_id])
+        if eliminadas:
+            sesion.execute(
+                delete(self.resumen).where(self.resumen.categoria_id.in_(eliminadas)),
+                execution_options={'synchronize_session': False}
+            )
+
+    # Solo al terminar la transacción exterior: deshacer un SAVEPOINT (reintento
+    # de un lote fila a fila) no descarta lo registrado antes en la transacción
+    def tras_transaccion(self, sesion, transaccion):
+        if transaccion.parent is None:
+            sesion.info.pop(CLAVE, None)
+            sesion.info.pop(CLAVE_ELIMINADAS, None)
+
+
+def extremos(modelo, categoria_id):
+    # MIN y MAX por separado: cada uno es una sola búsqueda en el índice
+    filtro = modelo.categoria_id == categoria_id
+    return {
+        'precio_min': select(func.min(modelo.precio)).where(filtro).scalar_subquery(),
+        'precio_max': select(func.max(modelo.precio)).where(filtro).scalar_subquery()
+    }
+
+
+def aplicar(sesion, resumen, modelo, categoria_id, delta):
+    productos, unidades, valor, precios = delta
+    incrementos = {
+        'productos': resumen.productos + productos,
+        'unidades': resumen.unidades + unidades,
+        'valor_stock': resumen.valor_stock + valor,
+        'suma_precios': resumen.suma_precios + precios,
+        **extremos(modelo, categoria_id)
+    }
+    resultado = sesion.execute(
+        update(resumen).where(resumen.categoria_id == categoria_id).values(updated_at=ahora(), **incrementos),
+        execution_options={'synchronize_session': False}
+    )
+    if resultado.rowcount == 0:
+        # Primera escritura de la categoría: la fila parte de sus productos
+        # actuales. Si otra transacción la crea a la vez, el upsert suma el
+        # incremento a la suya en lugar de chocar en la clave primaria.
+        filas = filas_resumen(sesion, modelo, [categoria_id]) or [dict(
+            categoria_id=categoria_id, productos=0, unidades=0, valor_stock=0, suma_precios=0,
+            precio_min=None, precio_max=None, updated_at=ahora()
+        )]
+        upsert(sesion, resumen, filas,
+               lambda insertada: dict(incrementos, updated_at=insertada('updated_at')))
+
+
+def filas_resumen(sesion, modelo, categorias=None):
+    # Filas del resumen calculadas con un GROUP BY sobre productos (todas, o
+    # las de las categorías indicadas)
+    consulta = select(
+        modelo.categoria_id,
+        func.count(modelo.id),
+        func.coalesce(func.sum(modelo.cantidad), 0),
+        func.coalesce(func.sum(modelo.precio * modelo.cantidad), 0),
+        func.coalesce(func.sum(modelo.precio), 0),
+        func.min(modelo.precio),
+        func.max(modelo.precio)
+    ).group_by(modelo.categoria_id)
+    if categorias is not None:
+        consulta = consulta.where(modelo.categoria_id.in_(categorias))
+    return [
+        dict(zip(('categoria_id', 'productos', 'unidades', 'valor_stock', 'suma_precios',
+                  'precio_min', 'precio_max'), fila), updated_at=ahora())
+        for fila in sesion.execute(consulta)
+    ]
+
+
+def recalcular(sesion, resumen, modelo):
+    # Rehace todas las filas del resumen (flask reconstruir-resumen)
+    filas = filas_resumen(sesion, modelo)
+    sesion.execute(delete(resumen), execution_options={'synchronize_session': False})
+    if filas:
+        sesion.execute(insert(resumen), filas)
+    return len(filas)
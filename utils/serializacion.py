@@ -0,0 +1,73 @@
+# Proveedor JSON de la aplicación respaldado por orjson.
+#
+# Sustituye a json de la biblioteca estándar en jsonify(), en el streaming de
+# listados y en el modo ASGI. Produce el mismo JSON que el proveedor por defecto
+# de Flask (fechas en formato HTTP, UUID, dataclasses...), salvo que no ordena
+# las claves y no escapa los caracteres no ASCII.
+#
+#   JSON_PROVIDER = 'orjson' | 'default'   (por defecto orjson si está instalado)
+from flask import current_app
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class ProveedorOrjson(DefaultJSONProvider):
+    sort_keys = False
+
+    def opciones(self, indentar=False):
+        # Las fechas pasan por default() para conservar el formato de Flask
+        opciones = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            opciones |= orjson.OPT_SORT_KEYS
+        if indentar:
+            opciones |= orjson.OPT_INDENT_2
+        return opciones
+
+    def dumpb(self, obj, indentar=False):
+        return orjson.dumps(obj, default=self.default, option=self.opciones(indentar))
+
+    def dumps(self, obj, **kwargs):
+        # Argumentos propios de json.dumps (cls, indent...): proveedor por defecto
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return self.dumpb(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indentar = self.compact is False or (self.compact is None and self._app.debug)
+        return self._app.response_class(self.dumpb(obj, indentar) + b'\n', mimetype=self.mimetype)
+
+
+def init_json(app):
+    proveedor = app.config.get('JSON_PROVIDER')
+    if proveedor is None:
+        proveedor = 'default' if orjson is None else 'orjson'
+    if proveedor == 'orjson':
+        if orjson is None:
+            raise RuntimeError('JSON_PROVIDER=orjson requiere el paquete orjson')
+        app.json = ProveedorOrjson(app)
+    elif proveedor != 'default':
+        raise ValueError('JSON_PROVIDER no válido: %s' % proveedor)
+
+
+def volcador_bytes():
+    # Función obj -> bytes del proveedor actual, para serializar muchos objetos
+    # sin buscar el proveedor en cada uno
+    proveedor = current_app.json
+    if isinstance(proveedor, ProveedorOrjson):
+        return proveedor.dumpb
+    return lambda obj: proveedor.dumps(obj).encode('utf-8')
+
+
+def volcar_bytes(obj):
+    # Cuerpo de la respuesta ya codificado, sin pasar por str con orjson
+    return volcador_bytes()(obj)
@@ -0,0 +1,51 @@
+# Documentación Swagger sin coste en el arranque de los workers.
+#
+# Las rutas declaran su especificación con swag_from, que aquí solo la guarda
+# en la función (el mismo atributo specs_dict que lee flasgger), de modo que
+# importar routes/routes.py no importa flasgger. flasgger se importa únicamente
+# si SWAGGER_UI está activo, y genera la especificación en la primera petición
+# a /apispec_1.json (la cachea fuera de modo debug).
+#
+# En producción se puede desactivar SWAGGER_UI y servir una especificación
+# precalculada en el build:
+#
+#   flask --app app exportar-swagger swagger.json
+#   SWAGGER_UI=0 SWAGGER_SPEC_FILE=swagger.json gunicorn 'app:create_app()'
+import json
+import os
+import click
+from flask import send_file
+
+RUTA_SPEC = '/apispec_1.json'
+
+
+def swag_from(especificacion):
+    def decorador(funcion):
+        funcion.specs_dict = especificacion
+        return funcion
+    return decorador
+
+
+def generar_spec(app):
+    from flasgger import Swagger
+    swagger = app.extensions.get('swagger') or Swagger(app)
+    with app.app_context():
+        return swagger.get_apispecs()
+
+
+def init_swagger(app):
+    if app.config.get('SWAGGER_UI', True):
+        from flasgger import Swagger
+        app.extensions['swagger'] = Swagger(app)
+    elif app.config.get('SWAGGER_SPEC_FILE'):
+        ruta = os.path.abspath(app.config['SWAGGER_SPEC_FILE'])
+        app.add_url_rule(RUTA_SPEC, 'apispec_1',
+                         lambda: send_file(ruta, mimetype='application/json'))
+
+    @app.cli.command('exportar-swagger')
+    @click.argument('destino', default='swagger.json')
+    def exportar_swagger(destino):
+        """Escribe la especificación Swagger de la API en un fichero JSON."""
+        with open(destino, 'w', encoding='utf-8') as f:
+            json.dump(generar_spec(app), f, ensure_ascii=False, indent=2)
+        click.echo('Especificación escrita en %s' % destino)
@@ -0,0 +1,323 @@
+# Trabajos en segundo plano: operaciones largas (importar un catálogo...) que
+# no deben ocupar un worker web durante minutos.
+#
+# La cola es la tabla trabajos. POST /jobs/... guarda el trabajo como
+# 'pendiente' y lo envía al pool; un trabajador lo reclama con un UPDATE
+# condicional (WHERE estado = 'pendiente'), así que cada trabajo se ejecuta una
+# sola vez aunque lo vean varios trabajadores. La tarea confirma su trabajo por
+# lotes y, tras cada lote, guarda el progreso en la fila: GET /jobs/<id> lo lee
+# de ahí.
+#
+# Al reclamarlo, el trabajador toma una concesión (reclamado_en) que renueva
+# con cada lote. Si muere a medias, el trabajo se queda 'en_curso' con la
+# concesión caducada: al arrancar el pool y antes de cada consulta de flask
+# trabajos vuelve a 'pendiente', y el pool que arranca despacha también los
+# pendientes más antiguos que la concesión (los de un pool que ha muerto; si
+# otro pool aún los tiene en cola, el UPDATE condicional evita ejecutarlos dos
+# veces). Un trabajador que pierde la concesión deja de escribir en la fila.
+#
+#   JOBS_POOL_TYPE   'process' (pool de procesos del worker web), 'thread',
+#                    'inline' (dentro de la propia petición, para tests) o
+#                    'external' (solo se encolan; los ejecuta flask --app app trabajos)
+#   JOBS_WORKERS     2
+#   JOBS_DIR         ficheros subidos, compartido con los trabajadores;
+#                    por defecto <instance>/trabajos
+#   JOBS_MAX_ERRORS  errores por fila que se guardan en el trabajo (100)
+#   JOBS_POLL_INTERVAL  segundos entre consultas de flask trabajos sin trabajo (2)
+#   JOBS_LEASE_SECONDS  segundos sin renovar la concesión tras los que un
+#                    trabajo en curso se da por abandonado (600); mayor que lo
+#                    que tarda el lote más lento
+#
+# Los procesos del pool se arrancan con spawn (un fork del worker web copiaría
+# sus hilos a medias, con locks tomados, y sus conexiones abiertas) y crean su
+# propia aplicación con la misma configuración, y con ella su propia caché y
+# su propio broker de eventos: al terminar cada trabajo, el proceso que lo
+# lanzó invalida su caché; los eventos del trabajo solo llegan a los
+# suscriptores de otros procesos con EVENTS_BROKER=redis.
+import logging
+import multiprocessing
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import timedelta
+from functools import partial
+from flask import current_app
+from sqlalchemy import or_, select, update
+from utils.versiones import ahora
+
+logger = logging.getLogger(__name__)
+
+# Aplicación de cada proceso del pool, creada en su primer trabajo
+app_proceso = None
+
+
+def ejecutar_en_proceso(configuracion, id):
+    global app_proceso
+    if app_proceso is None:
+        from app import create_app
+        app_proceso = create_app(configuracion)
+    with app_proceso.app_context():
+        return app_proceso.extensions['trabajos'].ejecutar(id)
+
+
+def ejecutar_en_hilo(app, id):
+    with app.app_context():
+        return app.extensions['trabajos'].ejecutar(id)
+
+
+def configuracion_serializable(config):
+    # La configuración que se puede enviar a otro proceso
+    resultado = {}
+    for clave, valor in config.items():
+        try:
+            pickle.dumps(valor)
+        except Exception:
+            continue
+        resultado[clave] = valor
+    return resultado
+
+
+class ConcesionPerdida(Exception):
+    # El trabajo se ha dado por abandonado y lo ha reclamado otro trabajador
+    pass
+
+
+class Progreso:
+    # Lo que una tarea cuenta de sí misma; cada llamada se guarda en la fila y
+    # renueva la concesión del trabajo
+    def __init__(self, trabajos, id, inicio):
+        self.trabajos = trabajos
+        self.id = id
+        self.inicio = inicio
+        self.procesados = self.correctos = self.fallidos = 0
+        self.errores = []
+
+    def iniciar(self, total):
+        self.guardar(total=total)
+
+    def avanzar(self, procesados, correctos, errores=()):
+        # Tras confirmar un lote: elementos leídos, escritos y los que han fallado
+        self.procesados += procesados
+        self.correctos += correctos
+        self.fallidos += len(errores)
+        self.errores.extend(errores[:max(self.trabajos.max_errores - len(self.errores), 0)])
+        self.guardar(procesados=self.procesados, correctos=self.correctos,
+                     fallidos=self.fallidos, errores=list(self.errores))
+
+    def guardar(self, **valores):
+        if not self.trabajos.actualizar(self.id, condicion=self.trabajos.reclamado(self.inicio),
+                                        reclamado_en=ahora(), **valores):
+            raise ConcesionPerdida('El trabajo %s lo ha reclamado otro trabajador' % self.id)
+
+
+class Trabajos:
+    def __init__(self, app=None):
+        self.sesion = None
+        self.modelo = None
+        self.tareas = {}
+        self.callbacks = []
+        self.tipo = 'process'
+        self.trabajadores = 2
+        self.directorio = None
+        self.max_errores = 100
+        self.intervalo = 2
+        self.concesion = 600
+        self.configuracion = None
+        self.pool = None
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.tipo = app.config.get('JOBS_POOL_TYPE', self.tipo)
+        if self.tipo not in ('process', 'thread', 'inline', 'external'):
+            raise ValueError('JOBS_POOL_TYPE no válido: %s' % self.tipo)
+        self.trabajadores = app.config.get('JOBS_WORKERS', self.trabajadores)
+        self.directorio = app.config.get('JOBS_DIR') or os.path.join(app.instance_path, 'trabajos')
+        self.max_errores = app.config.get('JOBS_MAX_ERRORS', self.max_errores)
+        self.intervalo = app.config.get('JOBS_POLL_INTERVAL', self.intervalo)
+        self.concesion = app.config.get('JOBS_LEASE_SECONDS', self.concesion)
+        self.configuracion = None
+        self.cerrar()
+        app.extensions['trabajos'] = self
+
+    def seguir(self, session, modelo):
+        # modelo: el de la tabla trabajos
+        self.sesion, self.modelo = session, modelo
+
+    def tarea(self, tipo, tablas=()):
+        # Registra funcion(parametros, progreso) como la tarea `tipo`; tablas:
+        # las que escribe, para invalidar la caché del proceso que la lanza
+        def decorador(funcion):
+            self.tareas[tipo] = (funcion, tuple(tablas))
+            return funcion
+        return decorador
+
+    def al_terminar(self, callback):
+        # callback(tablas) en el proceso que lanzó el trabajo, al terminar
+        self.callbacks.append(callback)
+
+    # ------------------------- ENCOLAR -------------------------
+    def guardar(self, flujo, sufijo=''):
+        # Copia un fichero subido a JOBS_DIR, por bloques, y devuelve su ruta
+        os.makedirs(self.directorio, exist_ok=True)
+        descriptor, ruta = tempfile.mkstemp(suffix=sufijo, dir=self.directorio)
+        with os.fdopen(descriptor, 'wb') as destino:
+            shutil.copyfileobj(flujo, destino, 1 << 16)
+        return ruta
+
+    def encolar(self, tipo, parametros=None, usuario_id=None):
+        trabajo = self.modelo(tipo=tipo, parametros=parametros or {}, usuario_id=usuario_id)
+        self.sesion.add(trabajo)
+        self.sesion.commit()
+        self.despachar(trabajo.id)
+        return trabajo
+
+    def despachar(self, id):
+        if self.tipo == 'external':
+            return
+        if self.tipo == 'inline':
+            return self.ejecutar(id)
+        app = current_app._get_current_object()
+        if self.tipo == 'process':
+            if self.configuracion is None:
+                self.configuracion = configuracion_serializable(app.config)
+            futuro = self.obtener_pool().submit(ejecutar_en_proceso, self.configuracion, id)
+        else:
+            futuro = self.obtener_pool().submit(ejecutar_en_hilo, app, id)
+        futuro.add_done_callback(partial(self.terminado, app, id))
+
+    def obtener_pool(self):
+        # Como el de contraseñas: se crea en el primer uso, ya en el worker web
+        # (y de nuevo si un proceso del pool muere)
+        nuevo = False
+        if self.pool is None:
+            with self.lock:
+                if self.pool is None:
+                    if self.tipo == 'process':
+                        self.pool = ProcessPoolExecutor(max_workers=self.trabajadores,
+                                                        mp_context=multiprocessing.get_context('spawn'))
+                    else:
+                        self.pool = ThreadPoolExecutor(max_workers=self.trabajadores)
+                    nuevo = True
+        if nuevo:
+            self.reanudar()
+        return self.pool
+
+    def reanudar(self):
+        # Al arrancar el pool: despacha los abandonados y los pendientes que
+        # llevan en la cola más que la concesión
+        self.recuperar()
+        modelo = self.modelo
+        ids = self.sesion.scalars(
+            select(modelo.id).where(modelo.estado == 'pendiente', modelo.created_at < self.limite_concesion())
+            .order_by(modelo.id)
+        ).all()
+        self.sesion.rollback()
+        for id in ids:
+            self.despachar(id)
+
+    def recuperar(self):
+        # Vuelve a dejar 'pendiente' cada trabajo en curso con la concesión
+        # caducada; devuelve cuántos
+        modelo = self.modelo
+        sentencia = update(modelo).where(
+            modelo.estado == 'en_curso',
+            or_(modelo.reclamado_en < self.limite_concesion(), modelo.reclamado_en.is_(None))
+        ).values(estado='pendiente', reclamado_en=None)
+        recuperados = self.sesion.execute(sentencia, execution_options={'synchronize_session': False}).rowcount
+        self.sesion.commit()
+        if recuperados:
+            logger.warning('%d trabajos abandonados vuelven a la cola', recuperados)
+        return recuperados
+
+    def limite_concesion(self):
+        return ahora() - timedelta(seconds=self.concesion)
+
+    def reclamado(self, inicio):
+        # Condición de las escrituras de un trabajador: sigue siendo el que
+        # reclamó el trabajo (otro que lo reclame tras recuperarlo cambia started_at)
+        return (self.modelo.estado == 'en_curso') & (self.modelo.started_at == inicio)
+
+    def terminado(self, app, id, futuro):
+        try:
+            tablas = futuro.result()
+        except Exception as e:
+            # El proceso del pool ha muerto (el pool queda inservible) o la
+            # tarea no ha podido ni registrar su fallo
+            logger.exception('El trabajo %s no ha terminado', id)
+            with self.lock:
+                self.pool = None
+            with app.app_context():
+                self.actualizar(id, condicion=self.modelo.estado.in_(('pendiente', 'en_curso')),
+                                estado='fallido', mensaje=str(e)[:500] or type(e).__name__,
+                                finished_at=ahora())
+            return
+        for callback in self.callbacks:
+            callback(tablas)
+
+    # ------------------------- EJECUTAR -------------------------
+    def ejecutar(self, id):
+        # En el trabajador, con contexto de aplicación. Devuelve las tablas que
+        # escribe la tarea (ninguna si otro trabajador ya lo había reclamado).
+        modelo = self.modelo
+        inicio = ahora()
+        if not self.actualizar(id, condicion=modelo.estado == 'pendiente',
+                               estado='en_curso', started_at=inicio, reclamado_en=inicio):
+            return ()
+        tipo, parametros = self.sesion.execute(
+            select(modelo.tipo, modelo.parametros).where(modelo.id == id)
+        ).one()
+        funcion, tablas = self.tareas.get(tipo, (None, ()))
+        try:
+            if funcion is None:
+                raise ValueError('Tipo de trabajo desconocido: %s' % tipo)
+            resultado = funcion(parametros, Progreso(self, id, inicio))
+        except ConcesionPerdida:
+            self.sesion.rollback()
+            logger.warning('El trabajo %s lo ha reclamado otro trabajador; se abandona', id)
+        except Exception as e:
+            self.sesion.rollback()
+            logger.exception('El trabajo %s ha fallado', id)
+            self.actualizar(id, condicion=self.reclamado(inicio), estado='fallido',
+                            mensaje=str(e)[:500] or type(e).__name__, finished_at=ahora())
+        else:
+            self.actualizar(id, condicion=self.reclamado(inicio), estado='completado',
+                            resultado=resultado, finished_at=ahora())
+        return tablas
+
+    def actualizar(self, id, condicion=None, **valores):
+        # UPDATE de la fila del trabajo en su propia transacción; True si la ha escrito
+        sentencia = update(self.modelo).where(self.modelo.id == id).values(**valores)
+        if condicion is not None:
+            sentencia = sentencia.where(condicion)
+        escrito = self.sesion.execute(sentencia, execution_options={'synchronize_session': False}).rowcount
+        self.sesion.commit()
+        return escrito == 1
+
+    def consumir(self, una_vez=False):
+        # Bucle de flask --app app trabajos: ejecuta los pendientes por orden
+        # de llegada; con una_vez, termina cuando no queda ninguno. Antes de
+        # cada consulta recupera los abandonados.
+        modelo = self.modelo
+        while True:
+            self.recuperar()
+            id = self.sesion.scalar(
+                select(modelo.id).where(modelo.estado == 'pendiente').order_by(modelo.id).limit(1)
+            )
+            self.sesion.rollback()
+            if id is not None:
+                self.ejecutar(id)
+            elif una_vez:
+                return
+            else:
+                time.sleep(self.intervalo)
+
+    def cerrar(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False)
+            self.pool = None
@@ -0,0 +1,53 @@
+# INSERT ... ON CONFLICT DO UPDATE (SQLite, PostgreSQL) o INSERT ... ON
+# DUPLICATE KEY UPDATE (MySQL/MariaDB) en una sola sentencia: dos escrituras
+# concurrentes de la misma clave no chocan en la clave primaria, y no hace
+# falta leer ni borrar la fila antes.
+from sqlalchemy import insert, update
+
+DIALECTOS_ON_CONFLICT = ('sqlite', 'postgresql')
+DIALECTOS_ON_DUPLICATE = ('mysql', 'mariadb')
+
+
+def sentencia_upsert(sesion, modelo, filas, actualizar):
+    # filas: dicts para el INSERT. actualizar(columna_insertada): valores del
+    # UPDATE si la fila ya existe; columna_insertada(nombre) es el valor que
+    # traía el INSERT (excluded.x / VALUES(x)). None si el dialecto no lo admite.
+    dialecto = sesion.get_bind().dialect.name
+    tabla = modelo.__table__
+    if dialecto in DIALECTOS_ON_CONFLICT:
+        if dialecto == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as insertar
+        else:
+            from sqlalchemy.dialects.postgresql import insert as insertar
+        sentencia = insertar(tabla).values(filas)
+        claves = [c.name for c in tabla.primary_key]
+        return sentencia.on_conflict_do_update(
+            index_elements=claves,
+            set_=actualizar(lambda nombre: sentencia.excluded[nombre])
+        )
+    if dialecto in DIALECTOS_ON_DUPLICATE:
+        from sqlalchemy.dialects.mysql import insert as insertar
+        sentencia = insertar(tabla).values(filas)
+        return sentencia.on_duplicate_key_update(actualizar(lambda nombre: sentencia.inserted[nombre]))
+    return None
+
+
+def upsert(sesion, modelo, filas, actualizar):
+    # Con otros dialectos, UPDATE por clave y, si no había fila, INSERT
+    if not filas:
+        return
+    sentencia = sentencia_upsert(sesion, modelo, filas, actualizar)
+    if sentencia is not None:
+        sesion.execute(sentencia)
+        return
+    claves = [c.name for c in modelo.__table__.primary_key]
+    for fila in filas:
+        valores = actualizar(lambda nombre: fila[nombre])
+        resultado = sesion.execute(
+            update(modelo)
+            .where(*[getattr(modelo, clave) == fila[clave] for clave in claves])
+            .values(valores),
+            execution_options={'synchronize_session': False}
+        )
+        if resultado.rowcount == 0:
+            sesion.execute(insert(modelo).values(fila))
@@ -0,0 +1,46 @@
+from datetime import datetime, timezone
+from sqlalchemy import event, insert, select
+from utils.cambios import seguir_tablas_escritas, tablas_escritas
+from utils.upsert import upsert
+
+
+def ahora():
+    # UTC sin zona horaria, igual que las columnas DateTime de los modelos
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def versionar_en_commit(session, modelo, tablas):
+    # Incrementa, dentro de la misma transacción, la versión de cada tabla
+    # escrita. Así el ETag de un listado se obtiene con una lectura por clave
+    # primaria, sin agregados sobre las tablas (un DELETE también lo cambia).
+    # Todas las escritas van en un único upsert, la última sentencia antes del
+    # COMMIT: la fila de cada tabla, que comparten todas las escrituras, queda
+    # bloqueada solo durante el COMMIT, y dos primeras escrituras a la vez no
+    # chocan en la clave primaria si la fila no estaba sembrada.
+    seguir_tablas_escritas(session)
+    tablas = set(tablas)
+
+    @event.listens_for(session, 'before_commit')
+    def antes_commit(sesion):
+        if sesion.in_nested_transaction():
+            return
+        sesion.flush()
+        momento = ahora()
+        upsert(sesion, modelo, [
+            {'tabla': tabla, 'version': 1, 'updated_at': momento}
+            for tabla in sorted(tablas_escritas(sesion) & tablas)
+        ], lambda insertada: {'version': modelo.version + 1, 'updated_at': insertada('updated_at')})
+
+
+def sembrar_versiones(conexion, modelo, tablas):
+    # Filas iniciales (versión 0) al crear la tabla
+    conexion.execute(insert(modelo.__table__), [
+        {'tabla': tabla, 'version': 0, 'updated_at': ahora()} for tabla in tablas
+    ])
+
+
+def leer_versiones(session, modelo, tablas):
+    filas = session.execute(
+        select(modelo.tabla, modelo.version, modelo.updated_at).where(modelo.tabla.in_(tablas))
+    ).all()
+    return sorted(tuple(fila) for fila in filas)